@@ -21,7 +21,8 @@ from .user import (  # @IgnorePep8
     RandomDistributionProperties, Network, MultiDynamics,
     MultiDynamicsProperties, Concatenate, ComponentArray, EventConnectionGroup,
     AnalogConnectionGroup)
-from .values import SingleValue, ArrayValue, RandomDistributionValue  # @IgnorePep8
+from .values import (  # @IgnorePep8
+    SingleValue, ArrayValue, ExternalArrayValue, RandomDistributionValue)
 from .serialization import read, write, serialize, unserialize  # @IgnorePep8
 from .reference import Reference  # @IgnorePep8
 from .annotations import Annotations  # @IgnorePep8
@@ -11,6 +11,7 @@ from .visitors.cloner import Cloner
 from .visitors.queriers import ObjectFinder
 from .visitors.equality import EqualityChecker, Hasher, MismatchFinder
 from functools import reduce
+from contextlib import contextmanager
 
 
 def sort_key(elem):
@@ -463,21 +464,64 @@ class ContainerObject(BaseNineMLObject):
         self._parent = None  # Used to link up the the containing document
 
     def add(self, *elements):
-        add_to_doc_visitor = nineml.document.AddToDocumentVisitor(
-            self.document)
+        """
+        Adds elements to the container (and any nested document level objects
+        to the document of the container). If the container is in a batch
+        (see `batch`) the elements are only added when the batch is complete.
+        """
+        batched = getattr(self, '_batched', None)
+        if batched is not None:
+            batched.extend(elements)
+        else:
+            self._add_elements(elements)
+
+    @contextmanager
+    def batch(self):
+        """
+        A context manager that defers the addition of elements to the
+        container (and the check for clashing keys and the registration of
+        the elements with the document) until the end of the block, e.g.
+
+            with network.batch():
+                for population in populations:
+                    network.add(population)
+
+        The elements are not accessible from the container until the batch is
+        complete. If the block raises an exception none of the elements are
+        added. Nested batches are added at the end of the outermost batch.
+        """
+        if getattr(self, '_batched', None) is not None:
+            yield self
+            return
+        self._batched = batched = []
+        try:
+            yield self
+        finally:
+            self._batched = None
+        self._add_elements(batched)
+
+    def _add_elements(self, elements):
+        # Check all elements for clashes before any are added
+        new_keys = set()
         for element in elements:
             dct = self._member_dict(element)
-            if element.key in dct:
+            key = (id(dct), element.key)
+            if element.key in dct or key in new_keys:
                 raise NineMLUsageError(
                     "Could not add '{}' {} to container as it clashes "
                     "with an existing element with the same key"
                     .format(element.key, type(element).__name__))
-            dct[element.key] = element
+            new_keys.add(key)
+        for element in elements:
+            self._member_dict(element)[element.key] = element
             # Set parent if a property of the child element to add
             if hasattr(element, 'parent'):
                 element._parent = self
-            # Add nested references to document
-            if self.document is not None:
+        # Add nested references to document
+        if self.document is not None:
+            add_to_doc_visitor = nineml.document.AddToDocumentVisitor(
+                self.document)
+            for element in elements:
                 add_to_doc_visitor.visit(element)
 
     def remove(self, *elements):
@@ -1,7 +1,12 @@
+import os.path
+import weakref
+from threading import RLock
+from collections import OrderedDict
+from future.moves.urllib.parse import urlparse
 from nineml.visitors.base import BaseVisitorWithContext
 from nineml.visitors.equality import MismatchFinder
 from nineml.exceptions import (
-    NineMLUsageError, NineMLNameError)
+    NineMLUsageError, NineMLNameError, NineMLDontVisitChildrenException)
 from nineml.base import AnnotatedNineMLObject, DocumentLevelObject
 from logging import getLogger
 from nineml.visitors import Cloner
@@ -18,6 +23,204 @@ def write_order_key(nineml_obj):
     return index, nineml_obj.name
 
 
+class DocumentRegistry(object):
+    """
+    Holds the documents that have been read from (or written to) file so they
+    don't need to be reloaded each time they are referenced. Documents on the
+    local file system are reloaded when the inode, size or modification time
+    (in nanoseconds) of their file changes.
+
+    Documents are held by weak references (i.e. only while they are
+    referenced elsewhere), unless the registry is given a capacity, in which
+    case the most recently used documents are also held by strong references
+    up to that capacity. Access to the registry is locked so it can be shared
+    between threads.
+
+    Parameters
+    ----------
+    max_entries : int | None
+        The maximum number of documents to hold strong references to (0, the
+        default, for none and None for no limit)
+    max_bytes : int | None
+        The maximum total size of the files of the documents to hold strong
+        references to (None for no limit). NB: the size of the file is used
+        as a proxy for the memory the document uses
+    """
+
+    def __init__(self, max_entries=0, max_bytes=None):
+        self._max_entries = max_entries
+        self._max_bytes = max_bytes
+        self._lock = RLock()
+        # Maps the urls onto the file keys they were registered with and weak
+        # references to the documents
+        self._entries = {}
+        # Strong references to the most recently used documents and the sizes
+        # of their files, in order of use
+        self._recent = OrderedDict()
+        self._num_bytes = 0
+        self._hits = 0
+        self._misses = 0
+
+    @property
+    def max_entries(self):
+        return self._max_entries
+
+    @max_entries.setter
+    def max_entries(self, max_entries):
+        with self._lock:
+            self._max_entries = max_entries
+            self._trim()
+
+    @property
+    def max_bytes(self):
+        return self._max_bytes
+
+    @max_bytes.setter
+    def max_bytes(self, max_bytes):
+        with self._lock:
+            self._max_bytes = max_bytes
+            self._trim()
+
+    @property
+    def num_bytes(self):
+        "The total size of the files of the documents held strongly"
+        return self._num_bytes
+
+    @property
+    def hits(self):
+        "The number of documents retrieved from the registry"
+        return self._hits
+
+    @property
+    def misses(self):
+        "The number of documents not found (or out of date) in the registry"
+        return self._misses
+
+    def reset_counters(self):
+        with self._lock:
+            self._hits = self._misses = 0
+
+    @classmethod
+    def file_key(cls, url):
+        """
+        Returns a key that identifies the current version of a file on the
+        local file system, (path, inode, size, modification time in ns), or
+        (url, None, None, None) for remote URLs
+        """
+        if len(urlparse(url).scheme) > 1:  # single letters are drive names
+            return (url, None, None, None)
+        path = os.path.abspath(url)
+        stat = os.stat(path)
+        try:
+            mtime_ns = stat.st_mtime_ns
+        except AttributeError:  # Python 2
+            mtime_ns = int(stat.st_mtime * 1e9)
+        return (path, stat.st_ino, stat.st_size, mtime_ns)
+
+    def get(self, url, key=None):
+        """
+        Returns the document registered for the url, or None if there isn't
+        one or its file has changed since it was registered
+
+        Parameters
+        ----------
+        url : str
+            The url of the document
+        key : tuple | None
+            The current key of the file (see file_key), if already known
+        """
+        if key is None:
+            key = self.file_key(url)
+        with self._lock:
+            try:
+                registered_key, doc_ref = self._entries[url]
+            except KeyError:
+                doc = None
+            else:
+                doc = doc_ref() if registered_key == key else None
+                if doc is None:
+                    self._remove(url)
+            if doc is None:
+                self._misses += 1
+            else:
+                self._hits += 1
+                self._hold(url, doc, key[2] or 0)
+        return doc
+
+    def add(self, url, document, key=None):
+        """
+        Registers the document for the url
+
+        Parameters
+        ----------
+        url : str
+            The url of the document
+        document : Document
+            The document to register
+        key : tuple | None
+            The key of the file the document was loaded from (see file_key).
+            Should be obtained before the file is read so that changes
+            during the read are detected.
+        """
+        if key is None:
+            key = self.file_key(url)
+        with self._lock:
+            # Drop the entries of documents that have been garbage collected
+            for dead_url in [u for u, (_, r) in self._entries.items()
+                             if r() is None]:
+                del self._entries[dead_url]
+            self._remove(url)
+            self._entries[url] = (key, weakref.ref(document))
+            self._hold(url, document, key[2] or 0)
+
+    def pop(self, url):
+        "Removes the document registered for the url (if present)"
+        with self._lock:
+            self._remove(url)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._recent.clear()
+            self._num_bytes = 0
+
+    def __contains__(self, url):
+        with self._lock:
+            return url in self._entries and self._entries[url][1]() is not None
+
+    def __len__(self):
+        with self._lock:
+            return sum(1 for _, r in self._entries.values() if r() is not None)
+
+    def _hold(self, url, document, size):
+        # Move the document to the end of the order of use
+        self._release(url)
+        self._recent[url] = (document, size)
+        self._num_bytes += size
+        self._trim()
+
+    def _trim(self):
+        while self._recent and (
+            (self._max_entries is not None and
+             len(self._recent) > self._max_entries) or
+            (self._max_bytes is not None and
+             self._num_bytes > self._max_bytes)):
+            _, (_, size) = self._recent.popitem(last=False)
+            self._num_bytes -= size
+
+    def _release(self, url):
+        try:
+            _, size = self._recent.pop(url)
+        except KeyError:
+            pass
+        else:
+            self._num_bytes -= size
+
+    def _remove(self, url):
+        self._entries.pop(url, None)
+        self._release(url)
+
+
 class Document(AnnotatedNineMLObject, dict):
     """
     Loads and stores all top-level elements in a NineML file (i.e. any element
@@ -50,7 +253,7 @@ class Document(AnnotatedNineMLObject, dict):
                    'Dimension', 'Unit')
 
     # Holds loaded documents to avoid reloading each time
-    registry = {}
+    registry = DocumentRegistry()
 
     def __init__(self, *nineml_objects, **kwargs):
         AnnotatedNineMLObject.__init__(
@@ -202,7 +405,7 @@ class Document(AnnotatedNineMLObject, dict):
         Ensure all elements are loaded before iterating, as additional
         elements may be added to the document during the load process
         """
-        for name in dict.keys(self):
+        for name in list(self.keys()):
             self[name]
 
     def clone(self, cloner=None, **kwargs):
@@ -279,6 +482,11 @@ class AddToDocumentVisitor(BaseVisitorWithContext):
         super(AddToDocumentVisitor, self).__init__()
         self.document = document
         self.add_bound = add_bound
+        # Maps the ids of the objects visited so far to the objects and what
+        # they resolved to in the document, so that sub-objects shared
+        # between the visited objects (e.g. the dynamics of populations added
+        # in a batch) are only traversed once
+        self._visited = {}
 
     def action(self, obj, **kwargs):  # @UnusedVariable
         """
@@ -291,6 +499,20 @@ class AddToDocumentVisitor(BaseVisitorWithContext):
         obj : BaseNineMLObject
             The object to add the document if is DocumentLevelObject
         """
+        try:
+            _, resolved = self._visited[id(obj)]
+        except KeyError:
+            pass
+        else:
+            if resolved is not obj:
+                self._replace_in_context(obj, resolved)
+            raise NineMLDontVisitChildrenException(resolved)
+        resolved = self._add(obj)
+        # NB: The original object is held so that its id isn't reused
+        self._visited[id(obj)] = (obj, resolved)
+        return resolved
+
+    def _add(self, obj):
         if (isinstance(obj, DocumentLevelObject) and (
                 self.add_bound or obj.document is None)):
             # Need to use dictionary keys method instead of document one
@@ -302,19 +524,7 @@ class AddToDocumentVisitor(BaseVisitorWithContext):
                 if obj is doc_obj:
                     return obj  # Object is already in document
                 if obj.equals(doc_obj, check_urls=False):
-                    # If the object is nested in another object, replace
-                    # it in the nesting object with the equivalent object in
-                    # the document
-                    if self.context is not None:
-                        if self.context.attr_name is not None:
-                            # If object is a child of the nesting object
-                            setattr(self.context.parent,
-                                    '_' + self.context.attr_name, doc_obj)
-                        elif self.context.dct is not None:
-                            # If the object is one of a set of children in the
-                            # nesting container object
-                            del self.context.dct[obj.name]
-                            self.context.dct[doc_obj.name] = doc_obj
+                    self._replace_in_context(obj, doc_obj)
                 else:
                     raise NineMLUsageError(
                         "Cannot add {} '{}' to the document {} as it "
@@ -328,6 +538,22 @@ class AddToDocumentVisitor(BaseVisitorWithContext):
                 obj._document = self.document
         return obj
 
+    def _replace_in_context(self, obj, doc_obj):
+        """
+        If the object is nested in another object, replaces it in the
+        nesting object with the equivalent object in the document
+        """
+        if self.context is not None:
+            if self.context.attr_name is not None:
+                # If object is a child of the nesting object
+                setattr(self.context.parent,
+                        '_' + self.context.attr_name, doc_obj)
+            elif self.context.dct is not None:
+                # If the object is one of a set of children in the
+                # nesting container object
+                del self.context.dct[obj.name]
+                self.context.dct[doc_obj.name] = doc_obj
+
     def post_action(self, *args, **kwargs):
         pass
 
@@ -3,15 +3,12 @@ standard_library.install_aliases()
 from past.builtins import basestring  # @IgnorePep8
 import os.path  # @IgnorePep8
 import re  # @IgnorePep8
-import time  # @IgnorePep8
-import weakref  # @IgnorePep8
 from urllib.request import urlopen  # @IgnorePep8
 import contextlib  # @IgnorePep8
 from nineml.base import DocumentLevelObject  # @IgnorePep8
 from nineml.document import Document  # @IgnorePep8
 from nineml.exceptions import (  # @IgnorePep8
-    NineMLSerializationError, NineMLIOError, NineMLReloadDocumentException,
-    NineMLSerializerNotImportedError)
+    NineMLSerializationError, NineMLIOError, NineMLSerializerNotImportedError)
 
 DEFAULT_VERSION = 1
 DEFAULT_FORMAT = 'xml'  # see nineml.serialization format_to_serializer.keys()
@@ -31,9 +28,9 @@ import nineml  # @IgnorePep8
 from .dict import DictSerializer, DictUnserializer  # @IgnorePep8
 from .json import JSONSerializer, JSONUnserializer  # @IgnorePep8
 try:
-    from .xml import XMLSerializer, XMLUnserializer
+    from .xml import XMLSerializer, XMLUnserializer, XMLStreamUnserializer
 except ImportError:
-    XMLSerializer = XMLUnserializer = None
+    XMLSerializer = XMLUnserializer = XMLStreamUnserializer = None
 try:
     from .yaml import YAMLSerializer, YAMLUnserializer
 except ImportError:
@@ -86,7 +83,12 @@ def read(url, relative_to=None, reload=False, register=True, **kwargs):  # @Rese
         or not.
     register : bool
         Whether to store the document in the cache after it is read
+    lazy : bool
+        Whether to stream the document to index its elements and only load
+        them when they are accessed (only supported for XML files on the
+        local file system, see XMLStreamUnserializer)
     """
+    lazy = kwargs.pop('lazy', False)
     if not isinstance(url, basestring):
         raise NineMLIOError(
             "{} is not a valid URL (it is not even a string)"
@@ -100,21 +102,19 @@ def read(url, relative_to=None, reload=False, register=True, **kwargs):  # @Rese
             if relative_to is None:
                 relative_to = os.getcwd()
             url = os.path.abspath(os.path.join(relative_to, url))
-        mtime = time.ctime(os.path.getmtime(url))
-    elif url_re.match(url) is not None:
-        mtime = None  # Cannot load mtime of a general URL
-    else:
+    elif url_re.match(url) is None:
         raise NineMLIOError(
             "{} is not a valid URL or file path (NB: relative file paths must "
             "start with './')".format(url))
+    registry = nineml.Document.registry
+    # NB: The key of the file is obtained before it is read so changes to the
+    # file during the read cause it to be reloaded the next time
+    file_key = registry.file_key(url)
     if reload:
-        nineml.Document.registry.pop(url, None)
-    try:  # Try to use cached document in registry
-        doc_ref, loaded_mtime = nineml.Document.registry[url]
-        if loaded_mtime != mtime or doc_ref() is None or not register:
-            raise NineMLReloadDocumentException()
-        doc = doc_ref()
-    except (KeyError, NineMLReloadDocumentException):  # Reload from file
+        registry.pop(url)
+    # Try to use cached document in registry
+    doc = registry.get(url, key=file_key) if register else None
+    if doc is None:  # Reload from file
         # Get the unserializer based on the url extension
         format = format_from_url(url)  # @ReservedAssignment
         try:
@@ -129,6 +129,12 @@ def read(url, relative_to=None, reload=False, register=True, **kwargs):  # @Rese
                 "Cannot write to '{}' as {} serializer cannot be imported. "
                 "Please check the required dependencies are correctly "
                 "installed".format(url, format))
+        if lazy:
+            if format != 'xml' or file_path_re.match(url) is None:
+                raise NineMLSerializationError(
+                    "Lazy loading is only supported for XML files on the "
+                    "local file system ('{}')".format(url))
+            Unserializer = XMLStreamUnserializer
         if file_path_re.match(url) is not None:
             file = open(url)  # @ReservedAssignment
         elif url_re.match(url) is not None:
@@ -137,9 +143,11 @@ def read(url, relative_to=None, reload=False, register=True, **kwargs):  # @Rese
             raise NineMLIOError(
                 "Unrecognised url '{}'".format(url))
         with contextlib.closing(file):
-            doc = Unserializer(root=file, url=url, **kwargs).unserialize()
+            unserializer = Unserializer(root=file, url=url, **kwargs)
+            doc = (unserializer.document if lazy else
+                   unserializer.unserialize())
         if register:
-            nineml.Document.registry[url] = weakref.ref(doc), mtime
+            registry.add(url, doc, key=file_key)
     if name is not None:
         nineml_obj = doc[name]
     else:
@@ -147,6 +155,10 @@ def read(url, relative_to=None, reload=False, register=True, **kwargs):  # @Rese
     return nineml_obj
 
 
+# Keyword arguments of 'write' that are not options of the serialization
+write_only_kwargs = ('register', 'format', 'version')
+
+
 def write(url, *nineml_objects, **kwargs):
     """
     Writes NineML objects or single document to file given by a path
@@ -161,6 +173,10 @@ def write(url, *nineml_objects, **kwargs):
         Whether to store the document in the cache after writing
     version : str | float | int
         The version to serialize the NineML objects to
+    array_encoding : str
+        The encoding used to write ArrayValues, can be one of 'rows'
+        (default), 'base64' or 'base64-zlib' (binary encodings require
+        version >= 2)
     """
     register = kwargs.pop('register', True)
     # Encapsulate the NineML element in a document if it is not already
@@ -188,12 +204,14 @@ def write(url, *nineml_objects, **kwargs):
         # file is passed to the serializer for serializations that store
         # elements dynamically, such as HDF5
         serializer = Serializer(document=document, fname=file, **kwargs)
-        serializer.serialize()
+        # Only the serialization options (e.g. 'array_encoding') are passed
+        # on to the visitor, not the arguments of the serializer itself
+        serializer.serialize(**{k: v for k, v in kwargs.items()
+                                if k not in write_only_kwargs})
         serializer.to_file(serializer.root, file, **kwargs)
     if register:
         document._url = url
-        nineml.Document.registry[url] = (weakref.ref(document),
-                                         time.ctime(os.path.getmtime(url)))
+        nineml.Document.registry.add(url, document)
 
 
 def serialize(nineml_object, format=DEFAULT_FORMAT, version=DEFAULT_VERSION,  # @ReservedAssignment @IgnorePep8
@@ -158,6 +158,27 @@ class NodeToSerialize(BaseNode):
         """
         self.visitor.set_body(self._serial_elem, value, **options)
 
+    def array(self, name, values, **options):
+        """
+        Stores an array natively in the serialization (only for visitors that
+        support arrays, e.g. HDF5)
+
+        Parameters
+        ----------
+        name : str
+            Name of the array within the element
+        values : numpy.ndarray
+            The values of the array
+        options : dict
+            Options that can be passed to specific branches of the element
+            tree (unlikely to be used but included for completeness)
+        """
+        if not self.visitor.supports_arrays:
+            raise NineMLSerializationError(
+                "{} does not support native arrays".format(
+                    type(self.visitor).__name__))
+        self.visitor.set_array(self._serial_elem, name, values, **options)
+
 
 class NodeToUnserialize(BaseNode):
 
@@ -435,6 +456,30 @@ class NodeToUnserialize(BaseNode):
                 "Cannot convert body of {} node ({}) to {}"
                 .format(self.name, value, dtype))
 
+    def array(self, name, **options):
+        """
+        Returns an array stored natively in the serialization (only for
+        visitors that support arrays, e.g. HDF5)
+
+        Parameters
+        ----------
+        name : str
+            Name of the array within the element
+
+        Returns
+        -------
+        array : array-like
+            The array, which may be lazily loaded (e.g. a memory-mapped
+            array or HDF5 dataset)
+        """
+        if not self.visitor.supports_arrays:
+            raise NineMLSerializationError(
+                "{} does not support native arrays".format(
+                    type(self.visitor).__name__))
+        array = self.visitor.get_array(self._serial_elem, name, **options)
+        self.unprocessed_children.discard(name)
+        return array
+
     def _get_name_map(self, nineml_classes):
         try:
             nineml_classes = list(nineml_classes)
@@ -47,6 +47,11 @@ class BaseVisitor(with_metaclass(ABCMeta, object)):
     # stage.
     supports_bodies = False
 
+    # A flag to determine whether the serialization form can store arrays
+    # natively (i.e. as HDF5 datasets) via the 'set_array' and 'get_array'
+    # methods
+    supports_arrays = False
+
     def __init__(self, version, document):
         self._version = self.standardize_version(version)
         self._document = document
@@ -877,6 +882,23 @@ class BaseUnserializer(with_metaclass(ABCMeta, BaseVisitor)):
                     n for n, _ in self.get_all_children(elem))))
         return getattr(nineml, nineml_type)
 
+    def _get_doc_elem(self, name):
+        """
+        Returns the type and serial element of the document-level element
+        with the given name
+        """
+        try:
+            return next(
+                (t, e) for t, e in self.get_all_children(self.root)
+                if self._get_elem_name(e) == name)
+        except StopIteration:
+            raise NineMLSerializationError(
+                "Referenced '{}' component or component class is missing "
+                "from document {} ({})"
+                .format(name, self.document.url, "', '".join(
+                    self._get_elem_name(e)
+                    for _, e in self.get_all_children(self.root))))
+
     def _get_v1_component_type(self, elem):
         """
         Gets the appropriate component class for a 9MLv1 component.
@@ -901,17 +923,7 @@ class BaseUnserializer(with_metaclass(ABCMeta, BaseVisitor)):
             defn_cls = type(
                 Reference(name, self.document, url=url).target)
         else:
-            try:
-                elem_type, doc_elem = next(
-                    (t, e) for t, e in self.get_all_children(self.root)
-                    if self._get_elem_name(e) == name)
-            except StopIteration:
-                raise NineMLSerializationError(
-                    "Referenced '{}' component or component class is missing "
-                    "from document {} ({})"
-                    .format(name, self.document.url, "', '".join(
-                        self._get_elem_name(e)
-                        for _, e in self.get_all_children(self.root))))
+            elem_type, doc_elem = self._get_doc_elem(name)
             if elem_type == 'ComponentClass':
                 defn_cls = self._get_v1_component_class_type(doc_elem)
             elif elem_type == 'Component':
@@ -1,8 +1,9 @@
 from builtins import zip
 import h5py
+import numpy
 from . import NINEML_BASE_NS
 from tempfile import mkstemp
-import contextlib
+import os.path
 import nineml
 from itertools import chain, repeat
 from nineml.exceptions import (NineMLSerializationError,
@@ -14,11 +15,27 @@ from nineml.exceptions import NineMLNameError
 from nineml.utils import is_file_handle
 
 
+def lazy_dataset(dataset):
+    """
+    Returns a memory-mapped array of the dataset if it is stored contiguously
+    (i.e. uncompressed) in a file on disk, or the dataset itself otherwise,
+    so that it can be sliced lazily in either case
+    """
+    offset = dataset.id.get_offset()
+    if (dataset.chunks is None and offset is not None and
+            os.path.isfile(dataset.file.filename)):
+        return numpy.memmap(dataset.file.filename, dtype=dataset.dtype,
+                            mode='r', offset=offset, shape=dataset.shape)
+    return dataset
+
+
 class HDF5Serializer(BaseSerializer):
     """
     A Serializer class that serializes to the HDF5 format
     """
 
+    supports_arrays = True
+
     def __init__(self, fname, **kwargs):  # @UnusedVariable @IgnorePep8 @ReservedAssignment
         if is_file_handle(fname):
             # Close the file and reopen with the h5py File object
@@ -59,6 +76,21 @@ class HDF5Serializer(BaseSerializer):
     def set_body(self, serial_elem, value, **options):  # @UnusedVariable @IgnorePep8
         self.set_attr(serial_elem, self.BODY_ATTR, value, **options)
 
+    def set_array(self, serial_elem, name, values, array_compression='gzip',
+                  array_chunk_size=2 ** 16,
+                  **options):  # @UnusedVariable @IgnorePep8
+        """
+        Writes the array to a dataset, which is chunked and compressed unless
+        'array_compression' is None (in which case it is stored contiguously
+        and can be memory-mapped on read)
+        """
+        values = numpy.asarray(values)
+        kwargs = {}
+        if array_compression is not None and len(values):
+            kwargs = dict(chunks=(min(len(values), array_chunk_size),),
+                          compression=array_compression, shuffle=True)
+        serial_elem.create_dataset(name, data=values, **kwargs)
+
     def to_file(self, serial_elem, file, **options):  # @UnusedVariable  @IgnorePep8 @ReservedAssignment
         if file.name != self._file.filename:
             raise NineMLSerializationError(
@@ -77,8 +109,15 @@ class HDF5Serializer(BaseSerializer):
 class HDF5Unserializer(BaseUnserializer):
     """
     A Unserializer class unserializes the HDF5 format.
+
+    The file is opened read-only and kept open by the unserializer, which is
+    referenced by the document it loads, as ArrayValues are read lazily from
+    its datasets. The file must therefore stay open (and unmodified) for as
+    long as the document or any of its arrays are in use.
     """
 
+    supports_arrays = True
+
     def get_child(self, parent, nineml_type, **options):  # @UnusedVariable
         try:
             elem = parent[nineml_type]
@@ -103,10 +142,26 @@ class HDF5Unserializer(BaseUnserializer):
         return iter(children.values())
 
     def get_all_children(self, parent, **options):  # @UnusedVariable
+        # NB: Datasets (see get_array) don't have the multiple attribute
         return chain(
-            ((n, e) for n, e in parent.items() if not e.attrs[self.MULT_ATTR]),
+            ((n, e) for n, e in parent.items()
+             if not e.attrs.get(self.MULT_ATTR, False)),
             *(zip(repeat(n), iter(e.values())) for n, e in parent.items()
-              if e.attrs[self.MULT_ATTR]))
+              if e.attrs.get(self.MULT_ATTR, False)))
+
+    def get_array(self, serial_elem, name, **options):  # @UnusedVariable
+        """
+        Returns the dataset without loading it (see lazy_dataset)
+        """
+        try:
+            dataset = serial_elem[name]
+        except KeyError:
+            raise NineMLMissingSerializationError(
+                "{} doesn't have a '{}' dataset".format(serial_elem, name))
+        if not isinstance(dataset, h5py.Dataset):
+            raise NineMLSerializationError(
+                "'{}' in {} is not a dataset".format(name, serial_elem))
+        return lazy_dataset(dataset)
 
     def get_attr(self, serial_elem, name, **options):  # @UnusedVariable
         return serial_elem.attrs[name]
@@ -131,14 +186,20 @@ class HDF5Unserializer(BaseUnserializer):
         # Close the file and reopen in h5py File object
         fname = file.name
         file.close()
-        return h5py.File(fname)[nineml.Document.nineml_type]
+        return self._open(fname)
 
     def from_urlfile(self, urlfile, **options):  # @UnusedVariable
         # Cache URL to temporary file and open in h5py File object
-        f, fname = mkstemp()
-        with contextlib.closing(f):
+        fd, fname = mkstemp()
+        with os.fdopen(fd, 'wb') as f:
             f.write(urlfile.read())
-        return h5py.File(fname)[nineml.Document.nineml_type]
+        return self._open(fname)
+
+    def _open(self, fname):
+        # The file is held open by the unserializer (and therefore the
+        # document) so that arrays can be read from it lazily
+        self._file = h5py.File(fname, 'r')
+        return self._file[nineml.Document.nineml_type]
 
     def from_str(self, string, **options):
         raise NineMLSerializationNotSupportedError(
@@ -1,10 +1,17 @@
+from __future__ import absolute_import
 import re
+import os.path
+from collections import OrderedDict
+from past.builtins import basestring
 from future.utils import native_str_to_bytes, bytes_to_native_str
+from xml.parsers import expat
 from lxml import etree
 from lxml.builder import ElementMaker
 from nineml.document import Document
+from nineml.annotations import Annotations
 from nineml.exceptions import (
-    NineMLSerializationError, NineMLMissingSerializationError)
+    NineMLSerializationError, NineMLMissingSerializationError,
+    NineMLSerializationNotSupportedError)
 from nineml.serialization.base import BaseSerializer, BaseUnserializer
 from nineml.exceptions import NineMLNameError
 from . import DEFAULT_VERSION
@@ -150,3 +157,176 @@ class XMLUnserializer(BaseUnserializer):
 
     def from_elem(self, serial_elem, **options):  # @UnusedVariable
         return serial_elem
+
+
+class XMLStreamUnserializer(XMLUnserializer):
+    """
+    Unserializer class for XML documents that are too large to hold in memory
+    as a single element tree.
+
+    Rather than parsing the whole document up front, the document is
+    streamed once with an expat parser to index the name, type, byte range
+    (and line number) of each top-level element. Each element is then parsed
+    on demand when it is first accessed from the document (e.g. by
+    `Document.__getitem__`), by seeking to its byte range in the file and
+    parsing only that range, so elements can be loaded in any order.
+
+    The root must be a handle to a file on the local file system, so that it
+    can be reopened to load the elements.
+    """
+
+    def __init__(self, root, version=None, url=None, document=None,
+                 class_map=None, **kwargs):
+        self._class_map = class_map if class_map is not None else {}
+        self._index = OrderedDict()
+        super(XMLStreamUnserializer, self).__init__(
+            root, version=version, url=url, document=document,
+            class_map=class_map, **kwargs)
+
+    def from_file(self, file):  # @ReservedAssignment
+        path = getattr(file, 'name', None)
+        if not isinstance(path, basestring) or not os.path.exists(path):
+            raise NineMLSerializationError(
+                "Streamed XML documents must be read from a file on the local "
+                "file system ('{}')".format(path))
+        self._path = path
+        # The byte offsets of the start of each top-level element, and the
+        # end of the root element, which delimit the top-level elements
+        offsets = []
+        elems = []
+        root_tag = []
+        depth = [0]
+        parser = expat.ParserCreate()
+
+        def start(tag, attrib):
+            depth[0] += 1
+            if depth[0] == 1:
+                root_tag.append(tag)
+            elif depth[0] == 2:
+                offsets.append(parser.CurrentByteIndex)
+                elems.append((tag, attrib, parser.CurrentLineNumber))
+
+        def end(tag):  # @UnusedVariable
+            depth[0] -= 1
+            if depth[0] == 0:
+                offsets.append(parser.CurrentByteIndex)
+
+        parser.StartElementHandler = start
+        parser.EndElementHandler = end
+        try:
+            with open(path, 'rb') as f:
+                parser.ParseFile(f)
+        except (expat.ExpatError, IOError) as e:
+            raise NineMLSerializationError(
+                "Could not read file path '{}': \n{}".format(path, e))
+        if not elems:
+            return self._parse(path)
+        for (tag, attrib, line), start, end in zip(elems, offsets[:-1],
+                                                   offsets[1:]):
+            self._index_elem(tag, attrib, line, start, end)
+        # Everything before the first top-level element (the XML declaration
+        # and the opening tag of the root) is prepended to each element when
+        # it is parsed so that it is parsed within the namespace of the root
+        with open(path, 'rb') as f:
+            self._prefix = f.read(offsets[0])
+        self._suffix = native_str_to_bytes('</{}>'.format(root_tag[0]))
+        return self._parse(self._prefix + self._suffix)
+
+    def from_str(self, string, **options):  # @UnusedVariable
+        raise NineMLSerializationNotSupportedError(
+            "Streamed XML documents must be read from a file on the local "
+            "file system, use XMLUnserializer to unserialize strings")
+
+    def keys(self):
+        return iter(self._index.keys())
+
+    def unserialize(self):
+        for name in self._index:
+            # Elements can be loaded implicitly when they are referenced by
+            # other elements
+            if name not in self._doc_elems:
+                self.load_element(name)
+        return self.document
+
+    def load_element(self, name, **options):
+        if name not in self._doc_elems and name in self._index:
+            nineml_type, _, start, end = self._index[name]
+            elem = self._parse_elem(start, end)
+            try:
+                elem_cls = self._class_map[nineml_type]
+            except KeyError:
+                elem_cls = self.get_nineml_class(nineml_type, elem)
+            self._doc_elems[name] = (elem, elem_cls)
+        nineml_object = super(XMLStreamUnserializer, self).load_element(
+            name, **options)
+        # Release the parsed element now that it has been unserialized
+        self._doc_elems[name] = (None, self._doc_elems[name][1])
+        return nineml_object
+
+    def line_number(self, name):
+        "The line number of the top-level element in the file"
+        return self._index[name][1]
+
+    def _get_doc_elem(self, name):
+        try:
+            nineml_type, _, start, end = self._index[name]
+        except KeyError:
+            raise NineMLSerializationError(
+                "Referenced '{}' component or component class is missing "
+                "from document {} ({})".format(
+                    name, self.document.url, "', '".join(self._index)))
+        try:
+            elem = self._doc_elems[name][0]
+        except KeyError:
+            elem = None
+        if elem is None:
+            elem = self._parse_elem(start, end)
+        return nineml_type, elem
+
+    def _index_elem(self, tag, attrib, line, start, end):
+        nineml_type = tag.split(':')[-1]
+        # NB: The version isn't known until the root has been parsed so the
+        # annotations type name is compared directly
+        if nineml_type == Annotations.nineml_type:
+            return
+        try:
+            name = attrib['name']
+        except KeyError:
+            try:
+                name = attrib['symbol']
+            except KeyError:
+                raise NineMLSerializationError(
+                    "Missing 'name' (or 'symbol') attribute from document "
+                    "level object '{}' (line {})".format(nineml_type, line))
+        if name in self._index:
+            raise NineMLSerializationError(
+                "Duplicate elements for name '{}' found in document"
+                .format(name))
+        self._index[name] = (nineml_type, line, start, end)
+
+    def _parse_elem(self, start, end):
+        """
+        Reads the byte range of a top-level element from the file and parses
+        it (along with its subtree) within the root element
+        """
+        with open(self._path, 'rb') as f:
+            f.seek(start)
+            fragment = f.read(end - start)
+        root = self._parse(self._prefix + fragment + self._suffix)
+        for elem in root:
+            if not isinstance(elem, etree._Comment):
+                return elem
+        raise NineMLSerializationError(
+            "Could not find element at byte {} in '{}'".format(start,
+                                                               self._path))
+
+    def _parse(self, source):
+        parser = etree.XMLParser(remove_comments=True, huge_tree=True)
+        try:
+            if isinstance(source, bytes):
+                return etree.fromstring(source, parser)
+            return etree.parse(source, parser).getroot()
+        except (etree.LxmlError, IOError) as e:
+            raise NineMLSerializationError(
+                "Could not parse element from file path '{}': \n{}"
+                .format(self._path, e))
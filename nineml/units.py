@@ -306,6 +306,13 @@ class Unit(AnnotatedNineMLObject, DocumentLevelObject):
         return (self.dimension.to_SI_units_str() +
                 ' * 10**({})'.format(self.power) if self.power else '')
 
+    def to_SI(self, value):
+        """
+        Converts a value (or array of values) in these units to the
+        equivalent SI units, i.e. scales it by 10 ** power and adds the offset
+        """
+        return value * 10.0 ** self.power + self.offset
+
     @property
     def name(self):
         return self._name
@@ -499,8 +506,9 @@ class Quantity(AnnotatedNineMLObject):
 
     @classmethod
     def unserialize_node(cls, node, **options):  # @UnusedVariable
-        value = node.child((SingleValue, ArrayValue, RandomDistributionValue),
-                           allow_ref=True, **options)
+        value = node.child((SingleValue, ArrayValue, ExternalArrayValue,
+                            RandomDistributionValue), allow_ref=True,
+                           **options)
         units_str = node.attr('units', **options)
         try:
             units = node.document[units_str]
@@ -754,4 +762,4 @@ pF_per_nA = Unit(name='pF_per_nA', dimension=voltage / time, power=-6)
 
 
 from nineml.values import (  # @IgnorePep8
-    SingleValue, ArrayValue, RandomDistributionValue)
+    SingleValue, ArrayValue, ExternalArrayValue, RandomDistributionValue)
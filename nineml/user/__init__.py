@@ -6,12 +6,17 @@ from .randomdistribution import RandomDistributionProperties
 from .population import Population
 from .dynamics import Initial, DynamicsProperties
 from .connectionrule import (
-    ConnectionRuleProperties, Connectivity, InverseConnectivity)
+    ConnectionRuleProperties, Connectivity, InverseConnectivity,
+    SampledConnectionsMemo)
+from .connectivity_cache import ConnectivityCache
 from .multi import MultiDynamics, MultiDynamicsProperties, append_namespace
 from .port_connections import (
     AnalogPortConnection, EventPortConnection)
 from .component_array import ComponentArray
 from .selection import Selection, Concatenate
 from .projection import Projection
-from .connection_group import AnalogConnectionGroup, EventConnectionGroup
+from .connection_group import (
+    AnalogConnectionGroup, EventConnectionGroup, ConnectionTable)
 from .network import Network
+from .partition import NetworkPartition
+from .population_graph import PopulationGraph
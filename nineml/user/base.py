@@ -11,5 +11,10 @@ class BaseULObject(AnnotatedNineMLObject):
 
     layer = 'user'
 
+    # Incremented whenever the size of a population or component array is
+    # set, so that values derived from the sizes (e.g. the offsets of
+    # Concatenate objects) can be cached until one of them changes
+    _size_changes = 0
+
     def __init__(self, **kwargs):
         AnnotatedNineMLObject.__init__(self, **kwargs)
@@ -13,7 +13,8 @@ from . import BaseULObject
 from nineml.document import Document
 from nineml.base import (
     DocumentLevelObject, ContainerObject)
-from nineml.values import SingleValue, ArrayValue, RandomDistributionValue
+from nineml.values import (
+    SingleValue, ArrayValue, ExternalArrayValue, RandomDistributionValue)
 from future.utils import with_metaclass
 
 
@@ -118,8 +119,8 @@ class Property(BaseULObject):
     @classmethod
     def unserialize_node_v1(cls, node, **options):  # @UnusedVariable
         name = node.attr('name', **options)
-        value = node.child((SingleValue, ArrayValue, RandomDistributionValue),
-                           **options)
+        value = node.child((SingleValue, ArrayValue, ExternalArrayValue,
+                            RandomDistributionValue), **options)
         units = node.document[node.attr('units', **options)]
         quantity = Quantity(value, units)
         return cls(name=name, quantity=quantity)
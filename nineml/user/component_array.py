@@ -34,6 +34,7 @@ class ComponentArray(BaseULObject, DocumentLevelObject):
     @size.setter
     def size(self, size):
         self._size = int(size)
+        BaseULObject._size_changes += 1
 
     @property
     def dynamics_properties(self):
@@ -1,19 +1,311 @@
 from builtins import zip
+import numpy
+from itertools import chain
+from random import Random
+from collections import OrderedDict
 from abc import ABCMeta, abstractmethod
 from . import BaseULObject
 from nineml.abstraction.connectionrule import (
     explicit_connection_rule, one_to_one_connection_rule)
 from nineml.user.port_connections import EventPortConnection
 from nineml.user.connectionrule import (
-    ConnectionRuleProperties, Connectivity, BaseConnectivity)
+    ConnectionRuleProperties, Connectivity, BaseConnectivity,
+    InverseConnectivity, _blocks_in_range)
 from nineml.units import Quantity
 from nineml.abstraction.ports import (
     SendPort, ReceivePort, EventPort, AnalogPort, Port)
 from nineml.user.component_array import ComponentArray
 from nineml.base import DocumentLevelObject
-from nineml.exceptions import NineMLUsageError
+from nineml.document import Document
+from nineml.exceptions import NineMLUsageError, NineMLSerializationError
 from future.utils import with_metaclass
-from nineml.utils import validate_identifier
+from nineml.utils import validate_identifier, check_numpy_generators
+
+
+class FlattenedConnectivity(Connectivity):
+    """
+    The connectivity of a connection group created by flattening a projection
+    (see Network.flatten), i.e. the connections between two of the 'pre',
+    'post', 'response' and 'plasticity' roles of the projection, where the
+    synapses (the response and plasticity component arrays) are indexed in
+    the order of the CSR matrix of the projection's connectivity.
+
+    The connections are derived from the projection's connectivity on
+    demand and the equivalent Explicit connection rule properties are only
+    created when they are accessed (e.g. when the connection group is
+    serialized or cloned). Connections between the pre and post roles are
+    streamed directly from the projection's connectivity, whereas
+    connections to and from the synapses require its CSR (and for the post
+    role the transposed) index.
+
+    Parameters
+    ----------
+    name : str
+        The name of the explicit connection rule properties
+    connectivity : Connectivity
+        The connectivity of the projection
+    sender_role : str
+        The role of the source of the connections in the projection
+    receiver_role : str
+        The role of the destination of the connections in the projection
+    source_size : int
+        The size of the source component array
+    destination_size : int
+        The size of the destination component array
+    """
+
+    def __init__(self, name, connectivity, sender_role, receiver_role,
+                 source_size, destination_size):
+        # NB: Connectivity.__init__ isn't called as the rule properties are
+        # created lazily
+        self._name = name
+        self._projection_connectivity = connectivity
+        self._sender_role = sender_role
+        self._receiver_role = receiver_role
+        self._source_size = source_size
+        self._destination_size = destination_size
+        self._explicit_properties = None
+        self._seed = getattr(connectivity, '_seed', None)
+        self._rng_cls = Random
+        self._keyed_rows = False
+        self._sampler = 'bernoulli'
+
+    @property
+    def projection_connectivity(self):
+        return self._projection_connectivity
+
+    @property
+    def _rule_properties(self):
+        if self._explicit_properties is None:
+            sources, destinations = self.connections_array()
+            self._explicit_properties = ConnectionRuleProperties(
+                name=self._name, definition=explicit_connection_rule,
+                properties={'sourceIndices': sources,
+                            'destinationIndices': destinations})
+        return self._explicit_properties
+
+    @property
+    def rule(self):
+        return explicit_connection_rule
+
+    @property
+    def lib_type(self):
+        return 'Explicit'
+
+    def has_been_sampled(self):
+        return self._projection_connectivity.has_been_sampled()
+
+    def connections(self, source_range=None, destination_range=None):
+        return chain.from_iterable(
+            zip(s.tolist(), d.tolist()) for s, d in self.iter_chunks(
+                source_range=source_range,
+                destination_range=destination_range))
+
+    def _connection_blocks(self, workers=None, source_range=None,
+                           destination_range=None, memoise=True):
+        conn = self._projection_connectivity
+        roles = (self._sender_role, self._receiver_role)
+        if roles == ('pre', 'post'):
+            return conn._connection_blocks(
+                workers=workers, source_range=source_range,
+                destination_range=destination_range, memoise=memoise)
+        blocks = self._role_blocks()
+        if source_range is not None or destination_range is not None:
+            blocks = _blocks_in_range(
+                blocks, self._check_range(source_range, self._source_size,
+                                          'source'),
+                self._check_range(destination_range, self._destination_size,
+                                  'destination'))
+        return blocks
+
+    def _role_blocks(self):
+        conn = self._projection_connectivity
+        roles = (self._sender_role, self._receiver_role)
+        if roles == ('post', 'pre'):
+            blocks = [InverseConnectivity(conn).connections_array()]
+        elif self._sender_role == 'pre':
+            sources = conn.to_csr().row_indices()
+            blocks = [(sources, numpy.arange(len(sources)))]
+        elif self._receiver_role == 'post':
+            destinations = conn.to_csr().indices
+            blocks = [(numpy.arange(len(destinations)), destinations)]
+        elif self._sender_role == 'post':
+            # Connections from each post-synaptic cell to its synapses are
+            # looked up from the transposed index
+            inverse = InverseConnectivity(conn)
+            blocks = [(inverse.to_csr().row_indices(),
+                       inverse.synapse_indices)]
+        elif self._receiver_role == 'pre':
+            destinations = conn.to_csr().row_indices()
+            blocks = [(numpy.arange(len(destinations)), destinations)]
+        else:
+            assert False
+        return iter(blocks)
+
+
+class ConnectionTable(object):
+    """
+    A columnar table of the connections in a connection group, consisting of
+    parallel arrays of the (int32) source and destination indices of each
+    connection and (float32) per-connection values, such as delays and
+    weights.
+
+    Parameters
+    ----------
+    sources : array_like(int)
+        The source index of each connection
+    destinations : array_like(int)
+        The destination index of each connection
+    columns : dict(str, array_like(float))
+        Per-connection values, e.g. 'delay' and 'weight'
+    units : dict(str, Unit)
+        The units of the per-connection values
+    """
+
+    index_dtype = numpy.int32
+    value_dtype = numpy.float32
+
+    def __init__(self, sources, destinations, columns=None, units=None):
+        self._sources = numpy.asarray(sources, dtype=self.index_dtype)
+        self._destinations = numpy.asarray(destinations,
+                                           dtype=self.index_dtype)
+        if len(self._sources) != len(self._destinations):
+            raise NineMLUsageError(
+                "Lengths of source ({}) and destination ({}) index arrays "
+                "do not match".format(len(self._sources),
+                                      len(self._destinations)))
+        self._columns = OrderedDict()
+        for name, values in sorted((columns or {}).items()):
+            values = numpy.asarray(values, dtype=self.value_dtype)
+            if len(values) != len(self._sources):
+                raise NineMLUsageError(
+                    "Length of '{}' column ({}) does not match the number of "
+                    "connections ({})".format(name, len(values),
+                                              len(self._sources)))
+            self._columns[name] = values
+        self._units = dict(units) if units is not None else {}
+
+    @classmethod
+    def from_values(cls, sources, destinations, rng=None, **quantities):
+        """
+        Creates a connection table with a column for each of the keyword
+        quantities, which are filled from their values in a single
+        vectorised pass: SingleValues are broadcast to every connection,
+        ArrayValues must provide a value for each connection and
+        RandomDistributionValues are sampled for each connection.
+
+        Parameters
+        ----------
+        sources : array_like(int)
+            The source index of each connection
+        destinations : array_like(int)
+            The destination index of each connection
+        rng : numpy.random.Generator | None
+            The generator used to sample RandomDistributionValues
+        quantities : dict(str, Quantity)
+            The quantities to create the value columns from
+        """
+        num_conns = len(sources)
+        columns = dict((n, q.value.to_array(num_conns, rng=rng))
+                       for n, q in quantities.items())
+        units = dict((n, q.units) for n, q in quantities.items())
+        return cls(sources, destinations, columns=columns, units=units)
+
+    def __len__(self):
+        return len(self._sources)
+
+    def __repr__(self):
+        return "{}(connections={}, columns=[{}])".format(
+            type(self).__name__, len(self), ', '.join(self._columns))
+
+    def __eq__(self, other):
+        try:
+            return (numpy.array_equal(self._sources, other._sources) and
+                    numpy.array_equal(self._destinations,
+                                      other._destinations) and
+                    list(self._columns) == list(other._columns) and
+                    all(numpy.array_equal(v, other._columns[n])
+                        for n, v in self._columns.items()) and
+                    self._units == other._units)
+        except AttributeError:
+            return False
+
+    def __ne__(self, other):
+        return not (self == other)
+
+    @property
+    def sources(self):
+        return self._sources
+
+    @property
+    def destinations(self):
+        return self._destinations
+
+    @property
+    def column_names(self):
+        return iter(self._columns)
+
+    def column(self, name):
+        try:
+            return self._columns[name]
+        except KeyError:
+            raise NineMLUsageError(
+                "No '{}' column in connection table (found '{}')"
+                .format(name, "', '".join(self._columns)))
+
+    def units(self, name):
+        return self._units.get(name)
+
+    def save(self, file):
+        """
+        Saves the table to a compressed NumPy (npz) file. The units of the
+        columns are stored in a serialized 9ML document alongside the arrays
+
+        Parameters
+        ----------
+        file : str | file
+            The path of (or handle to) the file to save the table to
+        """
+        from nineml.serialization import serialize
+        arrays = {'sources': self._sources,
+                  'destinations': self._destinations,
+                  'column_names': numpy.array(list(self._columns), dtype=str),
+                  'unit_names': numpy.array(
+                      [self._units[n].name if n in self._units else ''
+                       for n in self._columns], dtype=str),
+                  'units': numpy.array(serialize(
+                      Document(*set(self._units.values())), format='xml',
+                      to_str=True))}
+        for i, values in enumerate(self._columns.values()):
+            arrays['column{}'.format(i)] = values
+        numpy.savez_compressed(file, **arrays)
+
+    @classmethod
+    def load(cls, file):
+        """
+        Loads a table saved by `save`
+
+        Parameters
+        ----------
+        file : str | file
+            The path of (or handle to) the file to load the table from
+        """
+        from nineml.serialization import format_to_unserializer
+        with numpy.load(file) as saved:
+            column_names = saved['column_names'].tolist()
+            columns = dict((n, saved['column{}'.format(i)])
+                           for i, n in enumerate(column_names))
+            try:
+                document = format_to_unserializer['xml'](
+                    saved['units'].item()).unserialize()
+            except KeyError:
+                raise NineMLSerializationError(
+                    "Units of connection table columns were not saved in "
+                    "'{}'".format(file))
+            units = dict((n, document[u]) for n, u in zip(
+                column_names, saved['unit_names'].tolist()) if u)
+            return cls(saved['sources'], saved['destinations'],
+                       columns=columns, units=units)
 
 
 class BaseConnectionGroup(
@@ -30,7 +322,7 @@ class BaseConnectionGroup(
     def __init__(self, name, source, destination, source_port,
                  destination_port, delay, connectivity=None,
                  connection_rule_properties=None,
-                 connectivity_class=Connectivity):
+                 connectivity_class=Connectivity, connection_table=None):
         self._name = validate_identifier(name)
         BaseULObject.__init__(self)
         DocumentLevelObject.__init__(self)
@@ -50,6 +342,7 @@ class BaseConnectionGroup(
                 connection_rule_properties, source.size, destination.size)
         self._connectivity = connectivity
         self._delay = delay
+        self._connection_table = connection_table
         if isinstance(source_port, Port):
             self._check_ports(source_port, destination_port)
 
@@ -85,64 +378,113 @@ class BaseConnectionGroup(
     def connections(self):
         return self._connectivity.connections()
 
+    @property
+    def connection_table(self):
+        """
+        A columnar table of the source and destination indices and delay of
+        each connection (see ConnectionTable). If it wasn't provided when the
+        connection group was created it is built from the connectivity and
+        delay on first access.
+        """
+        if self._connection_table is None:
+            sources, destinations = self._connectivity.connections_array()
+            quantities = {}
+            if self.delay is not None:
+                quantities['delay'] = self.delay
+            self._connection_table = ConnectionTable.from_values(
+                sources, destinations, rng=self._values_rng(), **quantities)
+        return self._connection_table
+
+    def _values_rng(self):
+        """
+        The generator the random per-connection values are drawn from. It is
+        seeded by a child of the connectivity's random seed so that its
+        stream is independent of the one the connections are sampled from
+        (e.g. the PCG64 stream used by the geometric sampler).
+        """
+        check_numpy_generators("Sampling per-connection values")
+        seed = getattr(self._connectivity, '_seed', None)
+        if seed is None:
+            return numpy.random.default_rng()
+        return numpy.random.default_rng(
+            numpy.random.SeedSequence(abs(seed)).spawn(1)[0])
+
+    def connection_chunks(self, max_pairs=None):
+        """
+        Iterates over the connections of the connection group in chunks of
+        source and destination index arrays (see `Connectivity.iter_chunks`)
+        """
+        return self._connectivity.iter_chunks(max_pairs=max_pairs)
+
     @classmethod
-    def from_port_connection(self, port_conn, projection, component_arrays):
+    def from_port_connection(self, port_conn, projection, component_arrays,
+                             connectivity=None):
+        """
+        Creates the connection group for a port connection of a flattened
+        projection
+
+        Parameters
+        ----------
+        port_conn : BasePortConnection
+            The port connection of the projection
+        projection : Projection
+            The projection being flattened
+        component_arrays : dict(str, ComponentArray)
+            The component arrays the network has been flattened to
+        connectivity : Connectivity | None
+            The connectivity to derive the connections from in place of the
+            projection's connectivity (e.g. connections that have already
+            been sampled from it)
+        """
+        if connectivity is None:
+            connectivity = projection.connectivity
         if isinstance(port_conn, EventPortConnection):
-            cls = AnalogConnectionGroup
-        else:
             cls = EventConnectionGroup
+        else:
+            cls = AnalogConnectionGroup
         name = '__'.join((
             projection.name, port_conn.sender_role,
             port_conn.send_port_name, port_conn.receiver_role,
             port_conn.receive_port_name))
-        if (port_conn.sender_role in ('response', 'plasticity') and
-                port_conn.receiver_role in ('response', 'plasticity')):
-            conn_props = ConnectionRuleProperties(
-                name=name + '_connectivity',
-                definition=one_to_one_connection_rule)
-        else:
-            if (port_conn.sender_role == 'pre' and
-                    port_conn.receiver_role == 'post'):
-                source_inds, dest_inds = list(zip(*projection.connections()))
-            elif (port_conn.sender_role == 'post' and
-                  port_conn.receiver_role == 'pre'):
-                source_inds, dest_inds = list(zip(*(
-                    (d, s) for s, d in projection.connections())))
-            elif port_conn.sender_role == 'pre':
-                source_inds, dest_inds = list(zip(*(
-                    (s, i) for i, (s, _) in enumerate(
-                        sorted(projection.connections())))))
-            elif port_conn.receiver_role == 'post':
-                source_inds, dest_inds = list(zip(*(
-                    (i, d) for i, (_, d) in enumerate(
-                        sorted(projection.connections())))))
-            else:
-                assert False
-            conn_props = ConnectionRuleProperties(
-                name=name + '_connectivity',
-                definition=explicit_connection_rule,
-                properties={'sourceIndices': source_inds,
-                            'destinationIndices': dest_inds})
         # FIXME: This will need to change in version 2, when each connection
-        #        has its own delay
+        #        has its own delay (per-connection delays are provided by the
+        #        connection table in the meantime)
         if port_conn.sender_role == 'pre':
             delay = projection.delay
         else:
             delay = None
-        source = component_arrays[
-            (projection.pre.name
-             if port_conn.sender_role in ('pre', 'post')
-             else projection.name) +
-            ComponentArray.suffix[port_conn.sender_role]]
-        destination = component_arrays[
-            (projection.pre.name
-             if port_conn.receiver_role in ('pre', 'post')
-             else projection.name) +
-            ComponentArray.suffix[port_conn.receiver_role]]
+        array_names = {'pre': projection.pre.name,
+                       'post': projection.post.name,
+                       'response': projection.name,
+                       'plasticity': projection.name}
+        try:
+            source = component_arrays[
+                array_names[port_conn.sender_role] +
+                ComponentArray.suffix[port_conn.sender_role]]
+            destination = component_arrays[
+                array_names[port_conn.receiver_role] +
+                ComponentArray.suffix[port_conn.receiver_role]]
+        except KeyError as e:
+            raise NineMLUsageError(
+                "Could not find component array '{}' when flattening '{}' "
+                "projection (flattening projections to or from selections is "
+                "not supported)".format(e.args[0], projection.name))
+        if (port_conn.sender_role in ('response', 'plasticity') and
+                port_conn.receiver_role in ('response', 'plasticity')):
+            connectivity = Connectivity(
+                ConnectionRuleProperties(
+                    name=name + '_connectivity',
+                    definition=one_to_one_connection_rule),
+                source.size, destination.size)
+        else:
+            connectivity = FlattenedConnectivity(
+                name + '_connectivity', connectivity,
+                port_conn.sender_role, port_conn.receiver_role,
+                source.size, destination.size)
         return cls(name, source, destination,
                    source_port=port_conn.send_port_name,
                    destination_port=port_conn.receive_port_name,
-                   connection_rule_properties=conn_props, delay=delay)
+                   connectivity=connectivity, delay=delay)
 
     @abstractmethod
     def _check_ports(self, source_port, destination_port):
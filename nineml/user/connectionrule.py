@@ -3,12 +3,18 @@ from builtins import range
 import sys
 from itertools import chain, product
 import math
+import weakref
+from functools import partial
+from collections import namedtuple, OrderedDict
 from abc import ABCMeta, abstractmethod
-from itertools import repeat
+from itertools import repeat, islice
 from random import Random, randint
+from multiprocessing import Pool
+import numpy
 from nineml.base import BaseNineMLObject
 from nineml.exceptions import NineMLUsageError, NineMLUsageError
 from nineml.user.component import Component
+from nineml.utils import check_numpy_generators
 from future.utils import with_metaclass
 
 
@@ -95,6 +101,14 @@ class BaseConnectivity(with_metaclass(ABCMeta, BaseNineMLObject)):
     def connections(self):
         pass
 
+    @abstractmethod
+    def connections_array(self):
+        pass
+
+    @abstractmethod
+    def iter_chunks(self, max_pairs=None):
+        pass
+
     @abstractmethod
     def has_been_sampled(self):
         pass
@@ -106,8 +120,22 @@ class Connectivity(BaseConnectivity):
     """
     nineml_type = '_Connectivity'
 
+    # The (approximate) maximum number of candidate pairs/random draws that
+    # are held in memory at any one time when generating connection arrays
+    array_block_size = 2 ** 22
+
+    # An optional ConnectivityCache in which generated connections are stored
+    # on disk and reloaded on subsequent runs instead of being regenerated
+    cache = None
+
+    # An optional, memory-capped SampledConnectionsMemo in which sampled
+    # connection arrays are stored so that each connectivity is only sampled
+    # once per process
+    memo = None
+
     def __init__(self, rule_properties, source_size,
                  destination_size, random_seed=None, rng_cls=None,
+                 keyed_rows=False, sampler='bernoulli',
                  **kwargs):  # @UnusedVariable
         """
         Parameters
@@ -126,6 +154,20 @@ class Connectivity(BaseConnectivity):
             Class for the random generator. Can be any random generator that
             implements the 'random' method to return a float between 0 and 1
             (e.g. numpy.Random). If not supplied then random.Random is used
+        keyed_rows : bool
+            If True, the random draws for each "row" (the source index for
+            Probabilistic and RandomFanOut rules and the destination index for
+            RandomFanIn rules) are taken from a separate counter-based Philox
+            generator keyed on the random seed and the row index (rng_cls is
+            ignored). This allows rows to be generated independently, and
+            therefore in parallel, with identical results.
+        sampler : str
+            The algorithm used to sample Probabilistic connections. Either
+            'bernoulli' (default), which draws a random number for every
+            candidate pair, or 'geometric', which jumps between connected pairs
+            by drawing geometrically distributed gaps from a NumPy generator
+            (rng_cls is ignored) so its cost scales with the number of
+            connections instead of the number of candidate pairs.
         """
         super(Connectivity, self).__init__(
             rule_properties, source_size, destination_size)
@@ -135,13 +177,73 @@ class Connectivity(BaseConnectivity):
         if rng_cls is None:
             rng_cls = Random
         self._rng_cls = rng_cls
+        self._keyed_rows = bool(keyed_rows)
+        if sampler not in self.samplers:
+            raise NineMLUsageError(
+                "Unrecognised sampler '{}', can be one of '{}'"
+                .format(sampler, "', '".join(self.samplers)))
+        self._sampler = sampler
+        # The keyed-row and geometric samplers draw from NumPy Generators
+        if self._keyed_rows:
+            check_numpy_generators("Keyed-row sampling of connections")
+        if sampler == 'geometric':
+            check_numpy_generators("The geometric connection sampler")
 
-    def connections(self):
+    samplers = ('bernoulli', 'geometric')
+
+    @property
+    def keyed_rows(self):
+        return self._keyed_rows
+
+    @property
+    def num_connections(self):
+        """
+        The number of connections, which is derived from the connection rule
+        if it fixes the number, or otherwise counted chunk by chunk
+        """
+        stats = self.statistics()
+        if stats['analytic'] and not stats['num_connections_variance']:
+            # The number of connections is fixed by the connection rule so
+            # the connections don't need to be generated
+            return int(stats['num_connections'])
+        return sum(len(s) for s, _ in self.iter_chunks())
+
+    @property
+    def sampler(self):
+        return self._sampler
+
+    def connections(self, source_range=None, destination_range=None):
         """
         Returns an iterator over all the source/destination index pairings
         with a connection.
-        `src`  -- the indices to get the connections from
-        `dest` -- the indices to get the connections to
+
+        Parameters
+        ----------
+        source_range : tuple(int, int) | None
+            If provided, only the connections from sources with indices in
+            the half-open range [lo, hi) are returned
+        destination_range : tuple(int, int) | None
+            If provided, only the connections to destinations with indices
+            in the half-open range [lo, hi) are returned
+        """
+        # The connections are only read from the full arrays if they have
+        # already been memoised, otherwise they are streamed
+        memoised = (self.memo is not None and
+                    self.memo.get(self, 'pairs') is not None)
+        if (self._is_array_sampled() or self.cache is not None or memoised or
+                source_range is not None or destination_range is not None):
+            conn = chain.from_iterable(
+                zip(s.tolist(), d.tolist()) for s, d in self.iter_chunks(
+                    source_range=source_range,
+                    destination_range=destination_range))
+        else:
+            conn = self._generator_connections()
+        return conn
+
+    def _generator_connections(self):
+        """
+        Returns the connections from the pure-Python generators, which draw
+        from random generators of class 'rng_cls'
         """
         if self.lib_type == 'AllToAll':
             conn = self._all_to_all()
@@ -159,6 +261,590 @@ class Connectivity(BaseConnectivity):
             assert False
         return conn
 
+    def connections_array(self, workers=None, source_range=None,
+                          destination_range=None):
+        """
+        Returns the source/destination index pairings with a connection as a
+        pair of integer arrays. The connections are generated in the same
+        order as those returned by `connections`, and when the default
+        random.Random generator is used the random draws are identical so
+        both methods produce exactly the same connections.
+
+        Parameters
+        ----------
+        workers : int | None
+            The number of processes to split the generation of random
+            connections over. Requires 'keyed_rows' to be set, so that the
+            result is identical for any number of workers.
+        source_range : tuple(int, int) | None
+            If provided, only the connections from sources with indices in
+            the half-open range [lo, hi) are returned
+        destination_range : tuple(int, int) | None
+            If provided, only the connections to destinations with indices
+            in the half-open range [lo, hi) are returned
+
+        Returns
+        -------
+        source_indices : numpy.ndarray(int)
+            The indices of the sources of each connection
+        destination_indices : numpy.ndarray(int)
+            The indices of the destinations of each connection. If the memo
+            is enabled, the full arrays are the ones stored in it and are
+            therefore read-only
+        """
+        if (self.memo is not None and source_range is None and
+                destination_range is None):
+            return self._memoised('pairs', lambda: _concatenate_blocks(list(
+                self._connection_blocks(workers=workers, memoise=False))))
+        return _concatenate_blocks(list(self._connection_blocks(
+            workers=workers, source_range=source_range,
+            destination_range=destination_range)))
+
+    def iter_chunks(self, max_pairs=None, source_range=None,
+                    destination_range=None):
+        """
+        Iterates over the connections in chunks of source and destination
+        index arrays, so that the connections of large projections can be
+        processed without holding the full connection list in memory. The
+        chunks are yielded in the same order as `connections_array`, i.e.
+        source-row order except for RandomFanIn (for which the sources are
+        drawn separately for each destination) and Explicit (in which the
+        order of the index lists is preserved) rules.
+
+        Parameters
+        ----------
+        max_pairs : int | None
+            The number of connections in each chunk (the final chunk may be
+            smaller). If None, `array_block_size` is used.
+        source_range : tuple(int, int) | None
+            If provided, only the connections from sources with indices in
+            the half-open range [lo, hi) are returned
+        destination_range : tuple(int, int) | None
+            If provided, only the connections to destinations with indices
+            in the half-open range [lo, hi) are returned
+
+        Returns
+        -------
+        chunks : iterator((numpy.ndarray(int), numpy.ndarray(int)))
+            Iterator over source and destination index array pairs
+        """
+        if max_pairs is None:
+            max_pairs = self.array_block_size
+        max_pairs = int(max_pairs)
+        if max_pairs < 1:
+            raise NineMLUsageError(
+                "'max_pairs' must be a positive integer ({})"
+                .format(max_pairs))
+        source_bufs, dest_bufs, num_buffered = [], [], 0
+        for sources, destinations in self._connection_blocks(
+                source_range=source_range,
+                destination_range=destination_range):
+            while len(sources):
+                n = min(max_pairs - num_buffered, len(sources))
+                source_bufs.append(sources[:n])
+                dest_bufs.append(destinations[:n])
+                num_buffered += n
+                sources = sources[n:]
+                destinations = destinations[n:]
+                if num_buffered == max_pairs:
+                    yield (numpy.concatenate(source_bufs),
+                           numpy.concatenate(dest_bufs))
+                    source_bufs, dest_bufs, num_buffered = [], [], 0
+        if num_buffered:
+            yield numpy.concatenate(source_bufs), numpy.concatenate(dest_bufs)
+
+    def to_csr(self):
+        """
+        Compresses the connections into a sparse matrix in compressed sparse
+        row (CSR) format, i.e. the destinations of each source in a single
+        array, ordered by source and then destination index.
+
+        Returns
+        -------
+        csr : CompressedConnectivity
+            The 'indptr' and 'indices' arrays of the CSR matrix
+        """
+        return self._memoised('csr', lambda: CompressedConnectivity.from_pairs(
+            *self.connections_array(), num_rows=self._source_size))
+
+    def to_csc(self):
+        """
+        Compresses the connections into a sparse matrix in compressed sparse
+        column (CSC) format, i.e. the sources of each destination in a single
+        array, ordered by destination and then source index.
+
+        Returns
+        -------
+        csc : CompressedConnectivity
+            The 'indptr' and 'indices' arrays of the CSC matrix
+        """
+        return self._memoised('csc', lambda: CompressedConnectivity.from_pairs(
+            *reversed(self.connections_array()),
+            num_rows=self._destination_size))
+
+    def destinations_of(self, index):
+        "The destinations connected to source 'index'"
+        return self.to_csr().neighbours(index)
+
+    def sources_of(self, index):
+        "The sources connected to destination 'index'"
+        return self.to_csc().neighbours(index)
+
+    def out_degrees(self):
+        """
+        The number of connections from each source (counted chunk by chunk
+        without compressing the connectivity)
+        """
+        degrees = numpy.zeros(self._source_size, dtype=numpy.int64)
+        for sources, _ in self.iter_chunks():
+            degrees += numpy.bincount(sources, minlength=self._source_size)
+        return degrees
+
+    def in_degrees(self):
+        """
+        The number of connections to each destination (counted chunk by chunk
+        without compressing the connectivity)
+        """
+        degrees = numpy.zeros(self._destination_size, dtype=numpy.int64)
+        for _, destinations in self.iter_chunks():
+            degrees += numpy.bincount(destinations,
+                                      minlength=self._destination_size)
+        return degrees
+
+    def statistics(self, analytic=True):
+        """
+        Returns statistics of the number of connections and the in/out
+        degrees of the connectivity, along with an estimate of the memory
+        required to hold its source and destination index arrays.
+
+        The statistics are derived analytically from the connection rule
+        where possible (AllToAll, OneToOne, Probabilistic, RandomFanIn and
+        RandomFanOut rules), in which case they are the expected values and
+        variances over all possible samples of the connectivity. Otherwise,
+        the connections are streamed through in chunks and the statistics of
+        the sampled connectivity are returned.
+
+        Parameters
+        ----------
+        analytic : bool
+            Whether to derive the statistics analytically where possible
+            (otherwise the sampled connections are always counted)
+
+        Returns
+        -------
+        statistics : dict(str, float)
+            The (expected) 'num_connections' and its variance
+            ('num_connections_variance'), the 'mean_out_degree' and
+            'out_degree_variance' of the sources, the 'mean_in_degree' and
+            'in_degree_variance' of the destinations, the 'memory_bytes'
+            required to hold the index arrays and whether the statistics were
+            derived 'analytic'ally
+        """
+        S = self._source_size
+        D = self._destination_size
+        lib_type = self.lib_type
+        if not analytic or lib_type not in self._analytic_lib_types:
+            out_degrees = numpy.zeros(S, dtype=numpy.int64)
+            in_degrees = numpy.zeros(D, dtype=numpy.int64)
+            for sources, destinations in self.iter_chunks():
+                out_degrees += numpy.bincount(sources, minlength=S)
+                in_degrees += numpy.bincount(destinations, minlength=D)
+            num_conns = float(out_degrees.sum())
+            stats = {
+                'num_connections': num_conns,
+                'num_connections_variance': 0.0,
+                'mean_out_degree': num_conns / S if S else 0.0,
+                'out_degree_variance': (float(out_degrees.var())
+                                        if S else 0.0),
+                'mean_in_degree': num_conns / D if D else 0.0,
+                'in_degree_variance': float(in_degrees.var()) if D else 0.0}
+        else:
+            if lib_type == 'AllToAll':
+                out_mean, out_var, in_mean, in_var = D, 0.0, S, 0.0
+                num_conns, num_var = S * D, 0.0
+            elif lib_type == 'OneToOne':
+                out_mean, out_var, in_mean, in_var = 1, 0.0, 1, 0.0
+                num_conns, num_var = S, 0.0
+            elif lib_type == 'Probabilistic':
+                # Every candidate pair is an independent Bernoulli trial so
+                # the counts are binomially distributed
+                p = float(self._rule_properties.property('probability').value)
+                out_mean, out_var = D * p, D * p * (1 - p)
+                in_mean, in_var = S * p, S * p * (1 - p)
+                num_conns, num_var = S * D * p, S * D * p * (1 - p)
+            else:
+                # Each "fan" draws 'number' connections uniformly (with
+                # replacement) from the other side, so the opposite degrees
+                # are binomially distributed
+                n = int(self._rule_properties.property('number').value)
+                if lib_type == 'RandomFanIn':
+                    fixed, other, num_fans = 'in', S, D
+                else:
+                    fixed, other, num_fans = 'out', D, S
+                num_trials = num_fans * n
+                p = 1.0 / other if other else 0.0
+                fan_mean, fan_var = n, 0.0
+                opp_mean = float(num_trials) / other if other else 0.0
+                opp_var = num_trials * p * (1 - p)
+                if fixed == 'in':
+                    in_mean, in_var, out_mean, out_var = (
+                        fan_mean, fan_var, opp_mean, opp_var)
+                else:
+                    out_mean, out_var, in_mean, in_var = (
+                        fan_mean, fan_var, opp_mean, opp_var)
+                num_conns, num_var = num_trials, 0.0
+            stats = {
+                'num_connections': float(num_conns),
+                'num_connections_variance': float(num_var),
+                'mean_out_degree': float(out_mean),
+                'out_degree_variance': float(out_var),
+                'mean_in_degree': float(in_mean),
+                'in_degree_variance': float(in_var)}
+        stats['memory_bytes'] = int(math.ceil(
+            stats['num_connections'] * 2 * numpy.dtype(numpy.int64).itemsize))
+        stats['analytic'] = analytic and lib_type in self._analytic_lib_types
+        return stats
+
+    _analytic_lib_types = ('AllToAll', 'OneToOne', 'Probabilistic',
+                           'RandomFanIn', 'RandomFanOut')
+
+    def _connection_blocks(self, workers=None, source_range=None,
+                           destination_range=None, memoise=True):
+        """
+        Iterates over blocks of source and destination index arrays, reusing
+        previously sampled arrays from the in-memory memo (unless 'memoise'
+        is False) or the on-disk connectivity cache if they are enabled
+        """
+        if source_range is not None or destination_range is not None:
+            return self._ranged_blocks(source_range, destination_range)
+        memo = self.memo if memoise else None
+        if memo is not None:
+            arrays = memo.get(self, 'pairs')
+            if arrays is not None:
+                return iter([arrays])
+        key = self.cache.key(self) if self.cache is not None else None
+        if key is None:
+            blocks = self._generate_blocks(workers)
+            if memo is not None:
+                blocks = self._memoise_blocks(blocks)
+            return blocks
+        arrays = self.cache.load(key)
+        if arrays is None:
+            arrays = _concatenate_blocks(list(self._generate_blocks(workers)))
+            self.cache.save(key, *arrays)
+            if memo is not None:
+                arrays = memo.put(self, 'pairs', arrays)
+            return iter([arrays])
+        blocks = self._cached_blocks(arrays)
+        if memo is not None:
+            blocks = self._memoise_blocks(blocks)
+        return blocks
+
+    def _cached_blocks(self, arrays):
+        """
+        Iterates over blocks of the memory-mapped arrays loaded from the
+        connectivity cache, so that only `array_block_size` connections are
+        read into memory (and cast to int64) at a time
+        """
+        sources, destinations = arrays
+        for start in range(0, len(sources), self.array_block_size):
+            end = start + self.array_block_size
+            yield (numpy.array(sources[start:end], dtype=numpy.int64),
+                   numpy.array(destinations[start:end], dtype=numpy.int64))
+
+    def _ranged_blocks(self, source_range, destination_range):
+        """
+        Iterates over blocks of the connections from sources in
+        'source_range' to destinations in 'destination_range', in the same
+        order as they appear in the full list of connections.
+
+        Only the connections in the ranges are generated for deterministic
+        rules. For random rules with 'keyed_rows' set, only the rows (sources
+        for Probabilistic and RandomFanOut, destinations for RandomFanIn) in
+        the corresponding range are generated. Otherwise, the random streams
+        are sequential, so the draws for the preceding rows are still made
+        (but are discarded block by block) and generation stops after the
+        last row in the range.
+        """
+        src_lo, src_hi = self._check_range(source_range, self._source_size,
+                                           'source')
+        dest_lo, dest_hi = self._check_range(
+            destination_range, self._destination_size, 'destination')
+        in_range = partial(_blocks_in_range, src_range=(src_lo, src_hi),
+                           dest_range=(dest_lo, dest_hi))
+        # Reuse previously sampled connections if they are available
+        if self.memo is not None:
+            arrays = self.memo.get(self, 'pairs')
+            if arrays is not None:
+                return in_range([arrays])
+        if self.cache is not None:
+            key = self.cache.key(self)
+            if key is not None:
+                arrays = self.cache.load(key)
+                if arrays is not None:
+                    return in_range(self._cached_blocks(arrays))
+        if self.lib_type == 'AllToAll':
+            num_dests = dest_hi - dest_lo
+            return ((numpy.repeat(numpy.arange(s, e, dtype=numpy.int64),
+                                  num_dests),
+                     numpy.tile(numpy.arange(dest_lo, dest_hi,
+                                             dtype=numpy.int64), e - s))
+                    for s, e in self._row_ranges(src_hi, num_dests,
+                                                 start=src_lo))
+        elif self.lib_type == 'OneToOne':
+            indices = numpy.arange(max(src_lo, dest_lo),
+                                   min(src_hi, dest_hi), dtype=numpy.int64)
+            return iter([(indices, indices.copy())])
+        elif self.lib_type == 'Explicit':
+            return in_range(self._explicit_connection_list_blocks())
+        if self.lib_type == 'RandomFanIn':
+            row_lo, row_hi, rows_are_sources = dest_lo, dest_hi, False
+        else:
+            row_lo, row_hi, rows_are_sources = src_lo, src_hi, True
+        if self._keyed_rows:
+            blocks = (_keyed_rows_connections(self._keyed_rows_args(s, e))
+                      for s, e in self._row_ranges(row_hi, self._row_size,
+                                                   start=row_lo))
+        else:
+            blocks = self._generate_blocks()
+        return in_range(blocks, row_hi=row_hi,
+                        rows_are_sources=rows_are_sources)
+
+    @classmethod
+    def _check_range(cls, index_range, size, name):
+        if index_range is None:
+            return 0, size
+        try:
+            lo, hi = (int(i) for i in index_range)
+        except (TypeError, ValueError):
+            raise NineMLUsageError(
+                "{} range must be a pair of integers, (lo, hi), not {}"
+                .format(name.capitalize(), index_range))
+        if not 0 <= lo <= hi <= size:
+            raise NineMLUsageError(
+                "{} range ({}, {}) is not within the {} size ({})"
+                .format(name.capitalize(), lo, hi, name, size))
+        return lo, hi
+
+    def _memoise_blocks(self, blocks):
+        """
+        Passes through the generated blocks, storing them in the memo once
+        they have all been generated unless they exceed its capacity
+        """
+        stored, nbytes = [], 0
+        for block in blocks:
+            if stored is not None:
+                nbytes += block[0].nbytes + block[1].nbytes
+                if nbytes > self.memo.max_bytes:
+                    stored = None  # Too large, so don't hold on to them
+                else:
+                    stored.append(block)
+            yield block
+        if stored is not None:
+            self.memo.put(self, 'pairs', _concatenate_blocks(stored))
+
+    def _memoised(self, name, compute):
+        if self.memo is None:
+            return compute()
+        value = self.memo.get(self, name)
+        if value is None:
+            value = self.memo.put(self, name, compute())
+        return value
+
+    def _generate_blocks(self, workers=None):
+        """
+        Iterates over blocks of source and destination index arrays, generated
+        a range of source (or destination for RandomFanIn) indices at a time
+        so that the temporary random draws held in memory are bounded by
+        `array_block_size`.
+        """
+        if workers is not None and workers > 1 and self.rule.is_random():
+            if not self._keyed_rows:
+                raise NineMLUsageError(
+                    "Connections can only be generated in parallel when "
+                    "'keyed_rows' is set, otherwise the random stream is "
+                    "sequential ({})".format(self))
+            blocks = iter(self._parallel_keyed_row_blocks(workers))
+        elif self.lib_type == 'AllToAll':
+            blocks = self._all_to_all_blocks()
+        elif self.lib_type == 'OneToOne':
+            blocks = self._one_to_one_blocks()
+        elif self.lib_type == 'Explicit':
+            blocks = self._explicit_connection_list_blocks()
+        elif self._keyed_rows:
+            blocks = (_keyed_rows_connections(self._keyed_rows_args(s, e))
+                      for s, e in self._row_ranges(
+                          self._num_rows, self._row_size))
+        elif self._uses_geometric_sampler():
+            blocks = self._geometric_probabilistic_blocks()
+        elif not self._has_array_rng():
+            # The stream of a generic random generator class can't be
+            # reproduced with NumPy so fall back to the Python generator
+            blocks = self._generator_blocks()
+        elif self.lib_type == 'Probabilistic':
+            blocks = self._probabilistic_connectivity_blocks()
+        elif self.lib_type == 'RandomFanIn':
+            blocks = self._random_fan_in_blocks()
+        elif self.lib_type == 'RandomFanOut':
+            blocks = self._random_fan_out_blocks()
+        else:
+            assert False
+        return blocks
+
+    def _has_array_rng(self):
+        return self._rng_cls is Random
+
+    def _uses_geometric_sampler(self):
+        return (self.lib_type == 'Probabilistic' and
+                self._sampler == 'geometric')
+
+    def _is_array_sampled(self):
+        """
+        Whether the connections are only generated by the NumPy sampling
+        methods (i.e. there is no equivalent pure-Python generator)
+        """
+        return self.rule.is_random() and (self._keyed_rows or
+                                          self._uses_geometric_sampler())
+
+    def _array_rng(self):
+        """
+        Returns a NumPy random generator that reproduces the stream of
+        random.Random(self._seed). Both use the MT19937 algorithm, and seeding
+        NumPy's legacy RandomState with the 32-bit words of the seed (passed
+        as a list so it is seeded via 'init_by_array' like random.Random)
+        makes their 'random' streams identical.
+        """
+        seed = abs(self._seed)
+        key = [seed & 0xFFFFFFFF]
+        seed >>= 32
+        while seed:
+            key.append(seed & 0xFFFFFFFF)
+            seed >>= 32
+        return numpy.random.RandomState(key)
+
+    def _row_ranges(self, num_rows, row_size, start=0):
+        rows_per_block = max(1, self.array_block_size // max(1, row_size))
+        for block_start in range(start, num_rows, rows_per_block):
+            yield block_start, min(block_start + rows_per_block, num_rows)
+
+    def _all_to_all_blocks(self):
+        for start, end in self._row_ranges(self._source_size,
+                                           self._destination_size):
+            yield (numpy.repeat(numpy.arange(start, end, dtype=numpy.int64),
+                                self._destination_size),
+                   numpy.tile(numpy.arange(self._destination_size,
+                                           dtype=numpy.int64), end - start))
+
+    def _one_to_one_blocks(self):
+        assert self._source_size == self._destination_size
+        for start, end in self._row_ranges(self._source_size, 1):
+            indices = numpy.arange(start, end, dtype=numpy.int64)
+            yield indices, indices
+
+    def _explicit_connection_list_blocks(self):
+        # NB: Integer index arrays aren't copied
+        yield (
+            numpy.asarray(self._rule_properties.property(
+                'sourceIndices').value.values, dtype=numpy.int64),
+            numpy.asarray(self._rule_properties.property(
+                'destinationIndices').value.values, dtype=numpy.int64))
+
+    def _probabilistic_connectivity_blocks(self):
+        rng = self._array_rng()
+        p = float(self._rule_properties.property('probability').value)
+        for start, end in self._row_ranges(self._source_size,
+                                           self._destination_size):
+            sources, destinations = numpy.nonzero(
+                rng.random_sample((end - start, self._destination_size)) < p)
+            yield sources.astype(numpy.int64) + start, destinations.astype(
+                numpy.int64)
+
+    def _geometric_probabilistic_blocks(self):
+        p = float(self._rule_properties.property('probability').value)
+        rng = numpy.random.default_rng(abs(self._seed))
+        for positions in _geometric_positions(
+                rng, p, self._source_size * self._destination_size,
+                self.array_block_size):
+            yield (positions // self._destination_size,
+                   positions % self._destination_size)
+
+    def _random_fan_in_blocks(self):
+        N = int(self._rule_properties.property('number').value)
+        rng = self._array_rng()
+        for start, end in self._row_ranges(self._destination_size, N):
+            yield (
+                numpy.floor(rng.random_sample((end - start) * N) *
+                            self._source_size).astype(numpy.int64),
+                numpy.repeat(numpy.arange(start, end, dtype=numpy.int64), N))
+
+    def _random_fan_out_blocks(self):
+        N = int(self._rule_properties.property('number').value)
+        rng = self._array_rng()
+        for start, end in self._row_ranges(self._source_size, N):
+            yield (
+                numpy.repeat(numpy.arange(start, end, dtype=numpy.int64), N),
+                numpy.floor(rng.random_sample((end - start) * N) *
+                            self._destination_size).astype(numpy.int64))
+
+    @property
+    def _num_rows(self):
+        "The number of independently drawn rows of a random rule"
+        if self.lib_type == 'RandomFanIn':
+            num_rows = self._destination_size
+        else:
+            num_rows = self._source_size
+        return num_rows
+
+    @property
+    def _row_size(self):
+        "The number of random draws per row of a random rule"
+        if self.lib_type == 'Probabilistic':
+            row_size = self._destination_size
+        else:
+            row_size = int(self._rule_properties.property('number').value)
+        return row_size
+
+    def _keyed_rows_args(self, start, end):
+        if self.lib_type == 'Probabilistic':
+            param = float(self._rule_properties.property('probability').value)
+        else:
+            param = int(self._rule_properties.property('number').value)
+        return (self.lib_type, param, self._source_size,
+                self._destination_size, self._seed, self._sampler, start, end)
+
+    def _parallel_keyed_row_blocks(self, workers):
+        """
+        Splits the rows into contiguous ranges that are generated over a pool
+        of worker processes. As the draws of each row only depend on the seed
+        and the row index, and the ranges are reassembled in order, the
+        connections are independent of the number of workers.
+        """
+        num_rows = self._num_rows
+        if not num_rows:
+            return []
+        # Use a few ranges per worker to balance the load between them
+        num_ranges = min(num_rows, workers * 4)
+        bounds = [(i * num_rows) // num_ranges for i in range(num_ranges + 1)]
+        pool = Pool(workers)
+        try:
+            blocks = pool.map(
+                _keyed_rows_connections,
+                [self._keyed_rows_args(s, e)
+                 for s, e in zip(bounds[:-1], bounds[1:])])
+        finally:
+            pool.close()
+            pool.join()
+        return blocks
+
+    def _generator_blocks(self):
+        conns = iter(self._generator_connections())
+        while True:
+            block = list(islice(conns, self.array_block_size))
+            if not block:
+                break
+            block = numpy.array(block, dtype=numpy.int64)
+            yield block[:, 0], block[:, 1]
+
     def _all_to_all(self):  # @UnusedVariable
         return product(range(self._source_size),
                        range(self._destination_size))
@@ -168,9 +854,8 @@ class Connectivity(BaseConnectivity):
         return ((i, i) for i in range(self._source_size))
 
     def _explicit_connection_list(self):  # @UnusedVariable
-        return zip(
-            self._rule_properties.property('sourceIndices').value.values,
-            self._rule_properties.property('destinationIndices').value.values)
+        return zip(*(b.tolist() for b in next(
+            self._explicit_connection_list_blocks())))
 
     def _probabilistic_connectivity(self):  # @UnusedVariable
         # Reinitialize the connectivity generator with the same RNG so that
@@ -178,9 +863,8 @@ class Connectivity(BaseConnectivity):
         rng = self._rng_cls(self._seed)
         p = float(self._rule_properties.property('probability').value)
         # Get an iterator over all of the source dest pairs to test
-        return chain(*(((s, d) for d in range(self._destination_size)
-                        if rng.random() < p)
-                       for s in range(self._source_size)))
+        return ((s, d) for s in range(self._source_size)
+                for d in range(self._destination_size) if rng.random() < p)
 
     def _random_fan_in(self):  # @UnusedVariable
         N = int(self._rule_properties.property('number').value)
@@ -211,37 +895,323 @@ class Connectivity(BaseConnectivity):
         return True  # Because seed and RNG class is set at start
 
 
-class InverseConnectivity(BaseNineMLObject):
+class CompressedConnectivity(
+        namedtuple('CompressedConnectivity', 'indptr indices')):
+    """
+    Connectivity compressed into a sparse matrix format (CSR or CSC), where
+    the indices connected to row 'i' are
+    ``indices[indptr[i]:indptr[i + 1]]``. Rows are source indices for CSR
+    matrices and destination indices for CSC matrices.
+    """
+
+    __slots__ = ()
+
+    @classmethod
+    def from_pairs(cls, rows, columns, num_rows):
+        """
+        Compresses arrays of row and column indices of each connection, sorting
+        the columns within each row (repeated connections are kept)
+        """
+        order = numpy.lexsort((columns, rows))
+        indptr = numpy.zeros(num_rows + 1, dtype=numpy.int64)
+        numpy.cumsum(numpy.bincount(rows, minlength=num_rows),
+                     out=indptr[1:])
+        return cls(indptr, numpy.asarray(columns, dtype=numpy.int64)[order])
+
+    @property
+    def num_rows(self):
+        return len(self.indptr) - 1
+
+    @property
+    def num_connections(self):
+        return len(self.indices)
+
+    @property
+    def degrees(self):
+        "The number of connections in each row"
+        return numpy.diff(self.indptr)
+
+    def neighbours(self, index):
+        "The column indices connected to the row 'index'"
+        return self.indices[self.indptr[index]:self.indptr[index + 1]]
+
+    def row_indices(self):
+        "The row index of each connection, aligned with 'indices'"
+        return numpy.repeat(numpy.arange(self.num_rows, dtype=numpy.int64),
+                            self.degrees)
+
+
+class SampledConnectionsMemo(object):
+    """
+    An in-memory store of the arrays sampled by Connectivity objects (e.g.
+    their source/destination index pairs and CSR/CSC matrices), so that
+    repeated requests for the connections of the same projection don't
+    resample them. Entries are dropped when their connectivity object is
+    garbage collected (e.g. after `Projection.resample_connectivity`) or its
+    source/destination sizes change, and the least recently used entries are
+    evicted when the total size of the stored arrays exceeds `max_bytes`.
+
+    The stored arrays are returned read-only, without copying, as they are
+    shared between all callers.
+
+    The memo is disabled by default and is enabled for all Connectivity
+    objects in the process by setting the `memo` attribute of the
+    Connectivity class, e.g.
+
+        Connectivity.memo = SampledConnectionsMemo(max_bytes=2 ** 28)
+
+    Parameters
+    ----------
+    max_bytes : int
+        The maximum total size of the stored arrays in bytes
+    """
+
+    def __init__(self, max_bytes=2 ** 28):
+        self.max_bytes = max_bytes
+        # Maps (id(connectivity), name) to the entry tuples
+        # (weakref(connectivity), sizes, arrays, nbytes) in LRU order
+        self._entries = OrderedDict()
+        self._nbytes = 0
+
+    @property
+    def nbytes(self):
+        "The total size of the stored arrays in bytes"
+        return self._nbytes
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __repr__(self):
+        return "{}(max_bytes={}, nbytes={}, entries={})".format(
+            type(self).__name__, self.max_bytes, self._nbytes, len(self))
+
+    def get(self, connectivity, name):
+        """
+        Returns the arrays stored under 'name' for the connectivity object or
+        None if they have not been stored or are no longer valid
+        """
+        key = (id(connectivity), name)
+        try:
+            ref, sizes, arrays, nbytes = self._entries.pop(key)
+        except KeyError:
+            return None
+        if (ref() is not connectivity or
+                sizes != (connectivity.source_size,
+                          connectivity.destination_size)):
+            self._nbytes -= nbytes
+            return None
+        # Reinsert the entry to mark it as the most recently used
+        self._entries[key] = (ref, sizes, arrays, nbytes)
+        return arrays
+
+    def put(self, connectivity, name, arrays):
+        """
+        Stores a tuple of arrays under 'name' for the connectivity object,
+        evicting the least recently used entries if required, and returns
+        them (marked read-only if they are stored)
+        """
+        nbytes = sum(a.nbytes for a in arrays)
+        self.discard(connectivity, name)
+        if nbytes > self.max_bytes:
+            return arrays
+        for array in arrays:
+            array.setflags(write=False)
+        while self._entries and self._nbytes + nbytes > self.max_bytes:
+            _, (_, _, _, evicted) = self._entries.popitem(last=False)
+            self._nbytes -= evicted
+        key = (id(connectivity), name)
+        ref = weakref.ref(connectivity,
+                          partial(self._discard_all, id(connectivity)))
+        self._entries[key] = (
+            ref, (connectivity.source_size, connectivity.destination_size),
+            arrays, nbytes)
+        self._nbytes += nbytes
+        return arrays
+
+    def discard(self, connectivity, name=None):
+        """
+        Drops the stored arrays for the connectivity object (all of them if
+        name is None)
+        """
+        if name is None:
+            self._discard_all(id(connectivity))
+        else:
+            entry = self._entries.pop((id(connectivity), name), None)
+            if entry is not None:
+                self._nbytes -= entry[3]
+
+    def clear(self):
+        self._entries.clear()
+        self._nbytes = 0
+
+    def _discard_all(self, conn_id, ref=None):  # @UnusedVariable
+        for key in [k for k in self._entries if k[0] == conn_id]:
+            self._nbytes -= self._entries.pop(key)[3]
+
+
+def _concatenate_blocks(blocks):
+    if not blocks:
+        return (numpy.zeros(0, dtype=numpy.int64),
+                numpy.zeros(0, dtype=numpy.int64))
+    return (numpy.concatenate([s for s, _ in blocks]),
+            numpy.concatenate([d for _, d in blocks]))
+
+
+def _blocks_in_range(blocks, src_range, dest_range, row_hi=None,
+                     rows_are_sources=True):
+    """
+    Filters blocks of connections to those from sources in 'src_range' to
+    destinations in 'dest_range'. If 'row_hi' is provided, the blocks are
+    assumed to be in ascending row order (sources or destinations depending
+    on 'rows_are_sources') and iteration stops once a block passes it.
+    """
+    src_lo, src_hi = src_range
+    dest_lo, dest_hi = dest_range
+    for sources, destinations in blocks:
+        mask = ((sources >= src_lo) & (sources < src_hi) &
+                (destinations >= dest_lo) & (destinations < dest_hi))
+        if mask.any():
+            yield sources[mask], destinations[mask]
+        if row_hi is not None and len(sources):
+            rows = sources if rows_are_sources else destinations
+            if rows[-1] >= row_hi:
+                break
+
+
+def _row_rng(seed, row):
+    """
+    Returns a counter-based random generator keyed on the seed and the row
+    index, so the draws for each row don't depend on those of other rows
+    """
+    return numpy.random.Generator(numpy.random.Philox(
+        key=[abs(seed) % 2 ** 64, row]))
+
+
+def _geometric_positions(rng, p, size, max_batch):
+    """
+    Samples the positions in range(size) that are selected by independent
+    Bernoulli trials with probability p, by drawing the geometrically
+    distributed gaps between selected positions
+
+    Parameters
+    ----------
+    rng : numpy.random.Generator
+        The random generator to draw the gaps from
+    p : float
+        The probability that each position is selected
+    size : int
+        The number of positions to select from
+    max_batch : int
+        The maximum number of gaps drawn at a time
+
+    Returns
+    -------
+    positions : iterator(numpy.ndarray(int))
+        Iterator over sorted arrays of the selected positions
+    """
+    if p <= 0.0 or size == 0:
+        return
+    p = min(p, 1.0)
+    # Draw slightly more gaps than expected to be needed in each batch
+    expected = size * p
+    batch = int(max(1, min(max_batch,
+                           expected + 5 * math.sqrt(expected) + 16)))
+    last = -1
+    while True:
+        positions = last + numpy.cumsum(rng.geometric(p, size=batch))
+        finished = positions[-1] >= size
+        if finished:
+            positions = positions[:numpy.searchsorted(positions, size)]
+        if len(positions):
+            last = positions[-1]
+            yield positions
+        if finished:
+            break
+
+
+def _keyed_rows_connections(args):
+    """
+    Generates the connections for a range of rows of a random connection
+    rule using keyed row generators. Defined at the module level (and taking a
+    single tuple of arguments) so it can be mapped over a process pool.
+
+    Parameters
+    ----------
+    args : tuple
+        lib_type, rule parameter (probability or number), source size,
+        destination size, seed, sampler, start row and end row
+
+    Returns
+    -------
+    source_indices : numpy.ndarray(int)
+        The indices of the sources of each connection
+    destination_indices : numpy.ndarray(int)
+        The indices of the destinations of each connection
+    """
+    (lib_type, param, source_size, destination_size, seed, sampler, start,
+     end) = args
+    sources, destinations = [], []
+    for row in range(start, end):
+        rng = _row_rng(seed, row)
+        if lib_type == 'Probabilistic':
+            if sampler == 'geometric':
+                dests = numpy.concatenate(
+                    [numpy.zeros(0, dtype=numpy.int64)] +
+                    list(_geometric_positions(rng, param, destination_size,
+                                              destination_size)))
+            else:
+                dests = numpy.nonzero(rng.random(destination_size) < param)[0]
+            srcs = numpy.full(len(dests), row, dtype=numpy.int64)
+        elif lib_type == 'RandomFanIn':
+            srcs = numpy.floor(rng.random(param) * source_size)
+            dests = numpy.full(param, row, dtype=numpy.int64)
+        elif lib_type == 'RandomFanOut':
+            srcs = numpy.full(param, row, dtype=numpy.int64)
+            dests = numpy.floor(rng.random(param) * destination_size)
+        else:
+            assert False
+        sources.append(srcs.astype(numpy.int64))
+        destinations.append(dests.astype(numpy.int64))
+    if not sources:
+        return (numpy.zeros(0, dtype=numpy.int64),
+                numpy.zeros(0, dtype=numpy.int64))
+    return numpy.concatenate(sources), numpy.concatenate(destinations)
+
+
+class InverseConnectivity(BaseConnectivity):
     """
     Inverts the connectivity so that the source and destination are effectively
     flipped. Used when mapping a projection connectivity to a reverse
     connection to from the synapse or post-synaptic cell to the pre-synaptic
-    cell
+    cell.
+
+    The inverted connections are looked up from a transposed sparse index
+    (i.e. the CSC matrix of the forward connectivity), which is built once
+    from the forward connectivity the first time it is required, so the
+    connections of each (inverted) source are found in O(degree) time.
     """
     nineml_type = '_InverseConnectivity'
+    nineml_attr = ()
     nineml_child = {'connectivity': Connectivity}
 
     def __init__(self, connectivity):  # @UnusedVariable
         self._connectivity = connectivity
+        self._index = None
+        self._synapse_indices = None
 
     @property
     def connectivity(self):
         return self._connectivity
 
     def __eq__(self, other):
-        return self._connectivity == other._connectivity
+        try:
+            return self._connectivity == other._connectivity
+        except AttributeError:
+            return False
 
     @property
     def rule_properties(self):
-        return self._connectivity._rule_props
-
-    @property
-    def rule(self):
-        return self.rule_properties.component_class
-
-    @property
-    def lib_type(self):
-        return self.rule_properties.lib_type
+        return self._connectivity.rule_properties
 
     @property
     def source_size(self):
@@ -251,15 +1221,107 @@ class InverseConnectivity(BaseNineMLObject):
     def destination_size(self):
         return self._connectivity.source_size
 
-    def __repr__(self):
-        return ("{}(rule={}, src_size={}, dest_size={})"
-                .format(self.__class__.__name__, self.lib_type,
-                        self.source_size, self.destination_size))
+    def connections(self, source_range=None, destination_range=None):
+        sources, destinations = self.connections_array(
+            source_range=source_range, destination_range=destination_range)
+        return zip(sources.tolist(), destinations.tolist())
 
-    @abstractmethod
-    def connections(self):
-        return ((j, i) for i, j in self._connectivity.connections)
+    def connections_array(self, source_range=None, destination_range=None):
+        """
+        Returns the inverted source/destination index pairings (i.e. the
+        forward destination/source pairings) ordered by inverted source and
+        then destination index, optionally restricted to sources and/or
+        destinations in half-open [lo, hi) ranges
+        """
+        index = self.to_csr()
+        src_lo, src_hi = Connectivity._check_range(
+            source_range, self.source_size, 'source')
+        # The connections of a range of (inverted) sources are contiguous in
+        # the transposed index
+        start, end = index.indptr[src_lo], index.indptr[src_hi]
+        sources = index.row_indices()[start:end]
+        destinations = index.indices[start:end].copy()
+        if destination_range is not None:
+            dest_lo, dest_hi = Connectivity._check_range(
+                destination_range, self.destination_size, 'destination')
+            mask = (destinations >= dest_lo) & (destinations < dest_hi)
+            sources, destinations = sources[mask], destinations[mask]
+        return sources, destinations
+
+    def iter_chunks(self, max_pairs=None, source_range=None,
+                    destination_range=None):
+        if max_pairs is None:
+            max_pairs = self._connectivity.array_block_size
+        max_pairs = int(max_pairs)
+        if max_pairs < 1:
+            raise NineMLUsageError(
+                "'max_pairs' must be a positive integer ({})"
+                .format(max_pairs))
+        sources, destinations = self.connections_array(
+            source_range=source_range, destination_range=destination_range)
+        for start in range(0, len(sources), max_pairs):
+            yield (sources[start:start + max_pairs],
+                   destinations[start:start + max_pairs])
+
+    def to_csr(self):
+        """
+        The transposed sparse index of the forward connectivity, i.e. the
+        forward sources connected to each forward destination
+        """
+        if self._index is None:
+            self._build_index()
+        return self._index
+
+    def to_csc(self):
+        return self._connectivity.to_csr()
+
+    def destinations_of(self, index):
+        """
+        The destinations connected to (inverted) source 'index', i.e. the
+        sources of destination 'index' in the forward connectivity
+        """
+        return self.to_csr().neighbours(index)
+
+    @property
+    def synapse_indices(self):
+        """
+        The position of each inverted connection in the forward CSR matrix
+        (i.e. the index of the synapse in the flattened response/plasticity
+        component arrays), aligned with the inverted connections
+        """
+        if self._synapse_indices is None:
+            self._build_index()
+        return self._synapse_indices
+
+    def synapses_of(self, index):
+        """
+        The indices of the synapses (see `synapse_indices`) onto forward
+        destination 'index'
+        """
+        index_ptr = self.to_csr().indptr
+        return self.synapse_indices[index_ptr[index]:index_ptr[index + 1]]
 
-    @abstractmethod
     def has_been_sampled(self):
-        return self._connectivity.has_been_sampled
+        return self._connectivity.has_been_sampled()
+
+    def statistics(self, analytic=True):
+        "See Connectivity.statistics (with in and out degrees swapped)"
+        stats = self._connectivity.statistics(analytic=analytic)
+        stats['mean_out_degree'], stats['mean_in_degree'] = (
+            stats['mean_in_degree'], stats['mean_out_degree'])
+        stats['out_degree_variance'], stats['in_degree_variance'] = (
+            stats['in_degree_variance'], stats['out_degree_variance'])
+        return stats
+
+    def _build_index(self):
+        forward = self._connectivity.to_csr()
+        # A stable sort of the destinations keeps the sources of each
+        # destination in ascending order
+        order = numpy.argsort(forward.indices, kind='stable')
+        indptr = numpy.zeros(self.source_size + 1, dtype=numpy.int64)
+        numpy.cumsum(numpy.bincount(forward.indices,
+                                    minlength=self.source_size),
+                     out=indptr[1:])
+        self._index = CompressedConnectivity(
+            indptr, forward.row_indices()[order])
+        self._synapse_indices = order
@@ -0,0 +1,212 @@
+"""
+An opt-in, on-disk cache of generated connectivity, which allows processes
+that build the same projections (e.g. repeated runs of a simulation script)
+to skip the generation of identical connections.
+
+The cache is enabled by setting the `cache` attribute of the Connectivity
+class, e.g.
+
+    Connectivity.cache = ConnectivityCache('/path/to/cache/dir')
+"""
+from builtins import object
+import os
+import errno
+import hashlib
+import tempfile
+import numpy
+from nineml.exceptions import NineMLUsageError
+
+
+class ConnectivityCache(object):
+    """
+    Stores the source and destination index arrays of generated connectivity
+    in uncompressed NumPy (npy) files, keyed by a structural hash of the
+    connection rule properties, the source and destination sizes and (for
+    random connection rules) the random seed, generator class and sampling
+    options. The least recently used entries are evicted when the total size
+    of the cache exceeds `max_size`.
+
+    The sources and destinations are stored as the two rows of a single array
+    so that entries can be memory-mapped when they are loaded, and therefore
+    read block by block without holding the whole connection list in memory.
+
+    Parameters
+    ----------
+    directory : str
+        The directory to store the cache entries in. It is created if it
+        doesn't exist
+    max_size : int
+        The maximum total size (in bytes) of the cache entries
+    """
+
+    file_ext = '.npy'
+
+    # Incremented if changes to the connection generation mean previously
+    # cached connections are no longer valid
+    format_version = 2
+
+    def __init__(self, directory, max_size=2 ** 30):
+        if max_size < 0:
+            raise NineMLUsageError(
+                "'max_size' of connectivity cache must be non-negative ({})"
+                .format(max_size))
+        self._directory = os.path.abspath(directory)
+        self._max_size = int(max_size)
+        try:
+            os.makedirs(self._directory)
+        except OSError as e:
+            if e.errno != errno.EEXIST:
+                raise
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def directory(self):
+        return self._directory
+
+    @property
+    def max_size(self):
+        return self._max_size
+
+    @property
+    def size(self):
+        "The total size of the cache entries in bytes"
+        return sum(s for _, s, _ in self._entries())
+
+    def __len__(self):
+        return len(self._entries())
+
+    def __repr__(self):
+        return "{}(directory='{}', max_size={})".format(
+            type(self).__name__, self.directory, self.max_size)
+
+    def key(self, connectivity):
+        """
+        Returns a hash of the properties that determine the connections
+        generated by the connectivity object, or None if the connectivity
+        can't be cached (e.g. if it has random properties)
+        """
+        props = connectivity.rule_properties
+        components = [str(self.format_version), connectivity.lib_type,
+                      str(props.standard_library),
+                      str(connectivity.source_size),
+                      str(connectivity.destination_size)]
+        for prop in sorted(props.properties, key=lambda p: p.name):
+            value = prop.value
+            if value.is_single():
+                value_str = repr(float(value.value))
+            elif value.is_array():
+                value_str = hashlib.sha1(numpy.ascontiguousarray(
+                    value.values, dtype=numpy.float64).tobytes()).hexdigest()
+            else:
+                return None
+            components.extend((prop.name, value_str, prop.units.name,
+                               repr(prop.units.power),
+                               repr(prop.units.offset)))
+        if connectivity.rule.is_random():
+            rng_cls = connectivity._rng_cls
+            components.extend((
+                str(connectivity._seed),
+                '{}.{}'.format(rng_cls.__module__, rng_cls.__name__),
+                str(connectivity.keyed_rows), connectivity.sampler))
+        return hashlib.sha1(
+            '\n'.join(components).encode('utf-8')).hexdigest()
+
+    def load(self, key):
+        """
+        Loads the source and destination index arrays stored under 'key',
+        returning None if there is no (valid) entry for it. The arrays are
+        memory-mapped read-only from the cache entry (and stored in the
+        smallest integer type that can hold the indices), so they should be
+        sliced and cast block by block rather than copied as a whole.
+        """
+        path = self._path(key)
+        try:
+            entry = numpy.load(path, mmap_mode='r')
+        except (IOError, OSError):
+            self.misses += 1
+            return None
+        except ValueError:
+            # Remove corrupted entries (e.g. from a full disk)
+            self._remove(path)
+            self.misses += 1
+            return None
+        if (entry.ndim != 2 or entry.shape[0] != 2 or
+                entry.dtype.kind not in 'iu'):
+            del entry
+            self._remove(path)
+            self.misses += 1
+            return None
+        # Mark the entry as recently used
+        try:
+            os.utime(path, None)
+        except OSError:
+            pass  # Entry was evicted by another process
+        self.hits += 1
+        return entry[0], entry[1]
+
+    def save(self, key, sources, destinations):
+        """
+        Stores the source and destination index arrays under 'key' and evicts
+        the least recently used entries if the cache has grown past its
+        maximum size
+        """
+        # Use the smallest integer type that can hold the indices to save
+        # space
+        max_index = max(sources.max() if len(sources) else 0,
+                        destinations.max() if len(destinations) else 0)
+        dtype = numpy.min_scalar_type(max_index)
+        fd, tmp_path = tempfile.mkstemp(suffix='.tmp', dir=self._directory)
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                entry = numpy.empty((2, len(sources)), dtype=dtype)
+                entry[0] = sources
+                entry[1] = destinations
+                numpy.save(f, entry)
+            # Renaming is atomic so concurrent readers will never see a
+            # partially written entry
+            os.rename(tmp_path, self._path(key))
+        except Exception:
+            self._remove(tmp_path)
+            raise
+        self._evict()
+
+    def clear(self):
+        "Removes all entries from the cache"
+        for _, _, path in self._entries():
+            self._remove(path)
+
+    def _path(self, key):
+        return os.path.join(self._directory, key + self.file_ext)
+
+    def _entries(self):
+        """
+        Returns the modification time, size and path of each entry in the
+        cache
+        """
+        entries = []
+        for fname in os.listdir(self._directory):
+            if fname.endswith(self.file_ext):
+                path = os.path.join(self._directory, fname)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue  # Entry was evicted by another process
+                entries.append((stat.st_mtime, stat.st_size, path))
+        return entries
+
+    def _evict(self):
+        entries = sorted(self._entries())
+        total = sum(s for _, s, _ in entries)
+        for _, size, path in entries:
+            if total <= self._max_size:
+                break
+            self._remove(path)
+            total -= size
+
+    @classmethod
+    def _remove(cls, path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
@@ -1,8 +1,15 @@
 import re
 import math
+import numpy
 from itertools import chain
+from collections import OrderedDict
+from multiprocessing import Pool
 from .component import Property
 import nineml.units as un
+from nineml.units import Unit, Dimension
+from nineml.abstraction.componentclass import ComponentClass
+from nineml.abstraction.connectionrule import explicit_connection_rule
+from nineml.visitors.cloner import Cloner
 from .population import Population
 from .projection import Projection
 from .selection import Selection
@@ -12,8 +19,9 @@ from nineml.base import DocumentLevelObject, ContainerObject
 from nineml.utils import validate_identifier
 from .component_array import ComponentArray
 from .connection_group import BaseConnectionGroup
-from nineml.values import RandomDistributionValue
-from nineml.exceptions import NineMLRandomDistributionDelayException
+from .connectionrule import ConnectionRuleProperties, Connectivity
+from .partition import NetworkPartition
+from .population_graph import PopulationGraph
 
 
 class Network(BaseULObject, DocumentLevelObject, ContainerObject):
@@ -43,9 +51,7 @@ class Network(BaseULObject, DocumentLevelObject, ContainerObject):
         BaseULObject.__init__(self)
         DocumentLevelObject.__init__(self)
         ContainerObject.__init__(self)
-        self.add(*populations)
-        self.add(*projections)
-        self.add(*selections)
+        self.add(*chain(populations, projections, selections))
 
     @property
     def name(self):
@@ -121,28 +127,76 @@ class Network(BaseULObject, DocumentLevelObject, ContainerObject):
     def connectivity_has_been_sampled(self):
         return any(p.connectivity.has_been_sampled() for p in self.projections)
 
-    def delay_limits(self):
+    def delay_limits(self, quantile=None, si_units=False):
         """
         Returns the minimum delay and the maximum delay of projections in the
-        network in ms
+        network (see Projection.delay_bounds)
+
+        Parameters
+        ----------
+        quantile : float | None
+            Random delays are bounded by the 'quantile' and 1 - 'quantile'
+            quantiles of their distributions instead of their support (which
+            is required for distributions with infinite support)
+        si_units : bool
+            Whether to return the limits as floats in seconds instead of
+            quantities in the units of the projections' delays they are
+            taken from
+
+        Returns
+        -------
+        limits : dict
+            The 'min_delay' and 'max_delay' of the projections
         """
         if not self.num_projections:
-            min_delay = 0.0 * un.s
-            max_delay = 0.0 * un.s
-        else:
-            min_delay = float('inf') * un.ms
-            max_delay = 0.0 * un.ms
-            for proj in self.projections:
-                delay = proj.delay
-                if isinstance(delay.value, RandomDistributionValue):
-                    raise NineMLRandomDistributionDelayException(
-                        "Delay of '{}' projection is randomly distributed "
-                        "so cannot determine delay limits".format(proj.name))
-                if delay > max_delay:
-                    max_delay = delay
-                if delay < min_delay:
-                    min_delay = delay
-        return {'min_delay': min_delay, 'max_delay': max_delay}
+            if si_units:
+                return {'min_delay': 0.0, 'max_delay': 0.0}
+            return {'min_delay': 0.0 * un.s, 'max_delay': 0.0 * un.s}
+        projections = list(self.projections)
+        # The bounds are compared in SI units
+        bounds = numpy.array([p.delay_bounds(quantile=quantile)
+                              for p in projections])
+        min_index = int(bounds[:, 0].argmin())
+        max_index = int(bounds[:, 1].argmax())
+        if si_units:
+            return {'min_delay': float(bounds[min_index, 0]),
+                    'max_delay': float(bounds[max_index, 1])}
+        # Return the limits in the units of the projections they are from
+        return {
+            'min_delay': projections[min_index].delay_bounds(
+                quantile=quantile, si_units=False)[0],
+            'max_delay': projections[max_index].delay_bounds(
+                quantile=quantile, si_units=False)[1]}
+
+    def statistics(self, analytic=True):
+        """
+        Returns the connectivity statistics of each projection in the network
+        (see Connectivity.statistics) and their totals
+
+        Parameters
+        ----------
+        analytic : bool
+            Whether to derive the statistics analytically where possible
+            (otherwise the sampled connections are always counted)
+
+        Returns
+        -------
+        statistics : dict
+            The total (expected) 'num_connections', its variance
+            ('num_connections_variance') and the 'memory_bytes' required to
+            hold the connection index arrays of all projections, and the
+            statistics of each projection keyed by name in 'projections'
+        """
+        proj_stats = dict((p.name, p.connectivity.statistics(
+            analytic=analytic)) for p in self.projections)
+        return {
+            'num_connections': sum(s['num_connections']
+                                   for s in proj_stats.values()),
+            'num_connections_variance': sum(
+                s['num_connections_variance'] for s in proj_stats.values()),
+            'memory_bytes': sum(s['memory_bytes']
+                                for s in proj_stats.values()),
+            'projections': proj_stats}
 
     def serialize_node(self, node, **options):  # @UnusedVariable
         node.attr('name', self.name, **options)
@@ -163,11 +217,22 @@ class Network(BaseULObject, DocumentLevelObject, ContainerObject):
     _conn_group_name_re = re.compile(
         r'(\w+)__(\w+)_(\w+)__(\w+)_(\w+)__connection_group')
 
-    def flatten(self):
+    def flatten(self, workers=None):
         """
         Flattens the populations and projections of the network into
         component arrays and connection groups (i.e. core 9ML objects)
 
+        Parameters
+        ----------
+        workers : int | None
+            The number of processes to flatten the dynamics of the
+            populations and projections (and sample the connectivity of the
+            projections) over. The connections sampled by the workers are
+            held by the connection groups so they aren't sampled again. The
+            component arrays and connection groups are assembled in the same
+            order, and with identical connections, for any number of
+            workers.
+
         Returns
         -------
         component_arrays : list(ComponentArray)
@@ -176,27 +241,113 @@ class Network(BaseULObject, DocumentLevelObject, ContainerObject):
         connection_groups : list(ConnectionGroup)
             List of connection groups the projections have been flattened to
         """
+        populations = list(self.populations)
+        projections = list(self.projections)
+        # Each distinct dynamics properties object is flattened once, so
+        # populations and projections that share their dynamics properties
+        # share the flattened ones too. Only the dynamics properties and the
+        # connectivities of the projections are passed to the workers
+        dynamics = OrderedDict()
+        for props in chain((p.cell for p in populations),
+                           (p.response for p in projections),
+                           (p.plasticity for p in projections)):
+            if props is not None:
+                dynamics.setdefault(id(props), props)
+        connectivities = [p.connectivity for p in projections]
+        if workers is not None and workers > 1:
+            pool = Pool(workers)
+            try:
+                flat_dynamics = pool.map(_flatten_dynamics,
+                                         list(dynamics.values()))
+                sampled = pool.map(_sample_connectivity,
+                                   [(c, True) for c in connectivities])
+            finally:
+                pool.close()
+                pool.join()
+        else:
+            flat_dynamics = [_flatten_dynamics(d) for d in dynamics.values()]
+            sampled = [_sample_connectivity((c, False))
+                       for c in connectivities]
+        # Map the results back onto the original objects
+        flattened = dict(zip(dynamics, flat_dynamics))
+        flat_connectivities = {}
+        for projection, (_, connections) in zip(projections, sampled):
+            if connections is not None:
+                # Reuse the connections sampled by the worker process
+                flat_connectivities[projection.name] = _sampled_connectivity(
+                    projection.connectivity, connections)
         component_arrays = dict((ca.name, ca) for ca in chain(
             (ComponentArray(p.name + ComponentArray.suffix['post'], len(p),
-                            p.cell.flatten())
-             for p in self.populations),
-            (ComponentArray(p.name + ComponentArray.suffix['response'], len(p),
-                            p.response.flatten())
-             for p in self.projections),
+                            flattened[id(p.cell)])
+             for p in populations),
+            (ComponentArray(p.name + ComponentArray.suffix['response'], size,
+                            flattened[id(p.response)])
+             for p, (size, _) in zip(projections, sampled)),
             (ComponentArray(p.name + ComponentArray.suffix['plasticity'],
-                            len(p), p.plasticity.flatten())
-             for p in self.projections if p.plasticity is not None)))
-        connection_groups = list(chain(*(
-            (BaseConnectionGroup.from_port_connection(pc, p, component_arrays)
-             for pc in p.port_connections)
-            for p in self.projections)))
+                            size, flattened[id(p.plasticity)])
+             for p, (size, _) in zip(projections, sampled)
+             if p.plasticity is not None)))
+        connection_groups = [
+            BaseConnectionGroup.from_port_connection(
+                pc, p, component_arrays,
+                connectivity=flat_connectivities.get(p.name))
+            for p in projections for pc in p.port_connections]
         return list(component_arrays.values()), connection_groups
 
+    def population_graph(self, analytic=True, quantile=None):
+        """
+        Returns the graph of projections between the populations of the
+        network, with the (expected) number of connections and delay of each
+        edge (see PopulationGraph)
+
+        Parameters
+        ----------
+        analytic : bool
+            Whether to derive the number of connections analytically where
+            possible (otherwise the connections are sampled)
+        quantile : float | None
+            The quantile used to bound random delays (see
+            Projection.delay_bounds)
+        """
+        return PopulationGraph(self, analytic=analytic, quantile=quantile)
+
+    def partition(self, num_ranks, synapse_weight=1.0, workers=None):
+        """
+        Partitions the flattened network over a number of ranks of a
+        distributed simulation (see NetworkPartition)
+
+        Parameters
+        ----------
+        num_ranks : int
+            The number of ranks to partition the network over
+        synapse_weight : float
+            The cost of an incoming connection relative to that of a cell
+            when balancing the ranks
+        workers : int | None
+            The number of processes to flatten the network over
+
+        Returns
+        -------
+        partition : NetworkPartition
+            The partition, which provides the document of each rank and the
+            mapping from global to rank-local indices
+        """
+        return NetworkPartition(self, num_ranks,
+                                synapse_weight=synapse_weight,
+                                workers=workers)
+
     def scale(self, scale):
         """
         Scales the size of the populations in the network and corresponding
         projection sizes
 
+        The component classes, units and dimensions, which aren't modified
+        in place, are shared with the original network instead of being
+        cloned, so networks can be cheaply scaled many times (e.g. in
+        parameter sweeps). All other objects (including the properties and
+        values) are copied so the scaled network can be modified without
+        affecting the original.
+
         Parameters
         ----------
         scale : float
@@ -207,7 +358,7 @@ class Network(BaseULObject, DocumentLevelObject, ContainerObject):
         scaled : Network
             A scaled copy of the network
         """
-        scaled = self.clone()
+        scaled = self.clone(cloner=Cloner(share=self._scale_shared_types))
         # rescale populations
         for pop in scaled.populations:
             pop.size = int(math.ceil(pop.size * scale))
@@ -222,3 +373,49 @@ class Network(BaseULObject, DocumentLevelObject, ContainerObject):
                     number.name,
                     int(math.ceil(float(number.value) * scale)) * un.unitless))
         return scaled
+
+    # Immutable objects that can be shared between the original and scaled
+    # networks
+    _scale_shared_types = (ComponentClass, Unit, Dimension)
+
+
+def _flatten_dynamics(dynamics_properties):
+    """
+    Flattens the dynamics properties of a population or projection (run in a
+    worker process by Network.flatten)
+    """
+    return dynamics_properties.flatten()
+
+
+def _sample_connectivity(args):
+    """
+    Determines the number of connections of a projection's connectivity (run
+    in a worker process by Network.flatten). If the connections have to be
+    sampled to count them, the sampled source and destination index arrays
+    are also returned if requested, so the parent process doesn't need to
+    resample them.
+    """
+    connectivity, return_connections = args
+    stats = connectivity.statistics()
+    if ((stats['analytic'] and not stats['num_connections_variance']) or
+            not return_connections):
+        return connectivity.num_connections, None
+    connections = connectivity.connections_array()
+    return len(connections[0]), connections
+
+
+def _sampled_connectivity(connectivity, connections):
+    """
+    Wraps the connections sampled from a projection's connectivity in an
+    explicit connectivity, which takes the seed of the original so the
+    per-connection values drawn for the connection groups are unchanged
+    """
+    sources, destinations = connections
+    return Connectivity(
+        ConnectionRuleProperties(
+            name=connectivity.rule_properties.name + '_sampled',
+            definition=explicit_connection_rule,
+            properties={'sourceIndices': sources,
+                        'destinationIndices': destinations}),
+        connectivity.source_size, connectivity.destination_size,
+        random_seed=connectivity._seed)
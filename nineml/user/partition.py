@@ -0,0 +1,417 @@
+"""
+Partitioning of networks over the ranks of a distributed simulation, where
+each rank is given a document containing its share of the component arrays
+and connection groups the network flattens to (see Network.partition).
+"""
+from builtins import range, zip
+import os
+import errno
+from collections import OrderedDict
+import numpy
+from nineml.exceptions import NineMLUsageError
+from .component_array import ComponentArray
+from .connectionrule import ConnectionRuleProperties, Connectivity
+from nineml.abstraction.connectionrule import explicit_connection_rule
+
+
+class NetworkPartition(object):
+    """
+    Partitions the component arrays and connection groups a network flattens
+    to over a number of ranks.
+
+    The cells of each population are assigned to ranks in contiguous index
+    ranges so that the cost of each rank, where the cost of a cell is 1 plus
+    `synapse_weight` times its number of incoming connections, is balanced.
+    To minimise the number of connections that cross ranks, the populations
+    are laid out before they are split so that strongly connected
+    populations are adjacent. The synapses of each projection (i.e. the
+    elements of its response and plasticity component arrays) are assigned
+    to the rank of their post-synaptic cell.
+
+    Connections within a rank are included in the connection groups of its
+    document (with rank-local indices). Connections from a source on a
+    different rank can't be represented by the connection groups of a
+    single document, so they are recorded (by the global source index, rank
+    of the source and local destination index) in the mapping instead, which
+    also maps the global index of each element of each component array to
+    its rank and rank-local index.
+
+    Parameters
+    ----------
+    network : Network
+        The network to partition
+    num_ranks : int
+        The number of ranks to partition the network over
+    synapse_weight : float
+        The cost of an incoming connection relative to that of a cell
+    workers : int | None
+        The number of processes to flatten the network over (see
+        Network.flatten)
+    """
+
+    def __init__(self, network, num_ranks, synapse_weight=1.0, workers=None):
+        num_ranks = int(num_ranks)
+        if num_ranks < 1:
+            raise NineMLUsageError(
+                "Number of ranks to partition '{}' network over must be "
+                "positive ({})".format(network.name, num_ranks))
+        if synapse_weight < 0:
+            raise NineMLUsageError(
+                "'synapse_weight' must be non-negative ({})"
+                .format(synapse_weight))
+        self._network = network
+        self._num_ranks = num_ranks
+        self._synapse_weight = float(synapse_weight)
+        component_arrays, connection_groups = network.flatten(
+            workers=workers)
+        self._component_arrays = OrderedDict(
+            (ca.name, ca) for ca in component_arrays)
+        self._connection_groups = connection_groups
+        self._ranks = {}
+        self._local_indices = {}
+        self._rank_orders = {}
+        self._partition_cells()
+        self._assign_synapses()
+        self._split_connection_groups()
+        self._documents = None
+
+    @property
+    def network(self):
+        return self._network
+
+    @property
+    def num_ranks(self):
+        return self._num_ranks
+
+    @property
+    def synapse_weight(self):
+        return self._synapse_weight
+
+    @property
+    def population_order(self):
+        "The order the populations were laid out in before being split"
+        return list(self._population_order)
+
+    @property
+    def cross_rank_edges(self):
+        "The total number of connections between elements on different ranks"
+        return sum(int(numpy.count_nonzero(~split[-1]))
+                   for split in self._split.values())
+
+    def rank_sizes(self, array_name=None):
+        """
+        Returns the number of elements of the given component array (or of
+        all component arrays) on each rank
+        """
+        names = ([array_name] if array_name is not None
+                 else list(self._component_arrays))
+        return sum(numpy.bincount(self._array_ranks(n),
+                                  minlength=self.num_ranks)
+                   for n in names)
+
+    def rank_costs(self):
+        "Returns the total cost of the cells assigned to each rank"
+        costs = numpy.zeros(self.num_ranks)
+        for pop in self._network.populations:
+            name = pop.name + ComponentArray.suffix['post']
+            costs += numpy.bincount(self._ranks[name],
+                                    weights=self._cell_costs[pop.name],
+                                    minlength=self.num_ranks)
+        return costs
+
+    def global_to_local(self, array_name, indices):
+        """
+        Maps global indices into a component array to ranks and rank-local
+        indices
+
+        Parameters
+        ----------
+        array_name : str
+            The name of the component array
+        indices : int | array(int)
+            The global indices into the component array
+
+        Returns
+        -------
+        ranks : array(int)
+            The ranks the elements are assigned to
+        local_indices : array(int)
+            The indices of the elements within the component array of their
+            rank
+        """
+        indices = numpy.asarray(indices)
+        return (self._array_ranks(array_name)[indices],
+                self._local_indices[array_name][indices])
+
+    def local_to_global(self, array_name, rank, local_indices):
+        """
+        Maps rank-local indices into a component array back to their global
+        indices
+        """
+        self._array_ranks(array_name)  # Check the array name
+        order, bounds = self._rank_orders[array_name]
+        return order[bounds[rank]:bounds[rank + 1]][
+            numpy.asarray(local_indices, dtype=int)]
+
+    def remote_connections(self, group_name, rank):
+        """
+        Returns the connections of a connection group that arrive at the
+        given rank from sources on other ranks
+
+        Returns
+        -------
+        sources : array(int)
+            The global indices of the sources
+        source_ranks : array(int)
+            The ranks the sources are assigned to
+        destinations : array(int)
+            The local indices of the destinations
+        """
+        sources, src_ranks, _, local_dests, is_local = (
+            self._rank_connections(group_name, rank))
+        remote = ~is_local
+        return sources[remote], src_ranks[remote], local_dests[remote]
+
+    def document(self, rank):
+        """
+        Returns the document of the component arrays and connection groups
+        assigned to the given rank
+        """
+        self._check_rank(rank)
+        if self._documents is None:
+            self._documents = [None] * self.num_ranks
+        if self._documents[rank] is None:
+            self._documents[rank] = self._rank_document(rank)
+        return self._documents[rank]
+
+    @property
+    def documents(self):
+        return [self.document(r) for r in range(self.num_ranks)]
+
+    def save_mapping(self, file):
+        """
+        Saves the global to local index mapping and the cross-rank
+        connections to a NumPy (npz) file. The rank and local index of each
+        element of component array 'X' are stored in 'X__rank' and
+        'X__local', and the cross-rank connections arriving at rank 'R' of
+        connection group 'G' in 'G__R__sources', 'G__R__source_ranks' and
+        'G__R__destinations'.
+        """
+        arrays = {'num_ranks': numpy.array(self.num_ranks)}
+        for name in self._component_arrays:
+            arrays[name + '__rank'] = self._array_ranks(name)
+            arrays[name + '__local'] = self._local_indices[name]
+        for group in self._connection_groups:
+            for rank in range(self.num_ranks):
+                remote = self.remote_connections(group.name, rank)
+                if not len(remote[0]):
+                    continue
+                prefix = '{}__{}__'.format(group.name, rank)
+                for key, array in zip(('sources', 'source_ranks',
+                                       'destinations'), remote):
+                    arrays[prefix + key] = array
+        numpy.savez_compressed(file, **arrays)
+
+    def write(self, directory, **kwargs):
+        """
+        Writes the document of each rank to 'rank<N>.xml' (or the extension
+        given by the 'ext' keyword argument) and the index mapping to
+        'mapping.npz' in the given directory. Remaining keyword arguments
+        are passed to nineml.write.
+
+        Returns
+        -------
+        urls : list(str)
+            The paths of the rank documents
+        """
+        from nineml.serialization import write
+        ext = kwargs.pop('ext', '.xml')
+        try:
+            os.makedirs(directory)
+        except OSError as e:
+            if e.errno != errno.EEXIST:
+                raise
+        urls = []
+        for rank in range(self.num_ranks):
+            url = os.path.join(directory, 'rank{}{}'.format(rank, ext))
+            # Documents that haven't already been requested are built one at
+            # a time and released once they are written
+            if (self._documents is not None and
+                    self._documents[rank] is not None):
+                document = self._documents[rank]
+            else:
+                document = self._rank_document(rank)
+            write(url, document, **kwargs)
+            urls.append(url)
+        self.save_mapping(os.path.join(directory, 'mapping.npz'))
+        return urls
+
+    def _check_rank(self, rank):
+        if not 0 <= rank < self.num_ranks:
+            raise NineMLUsageError(
+                "Rank {} is out of range for partition over {} ranks"
+                .format(rank, self.num_ranks))
+
+    def _array_ranks(self, array_name):
+        try:
+            return self._ranks[array_name]
+        except KeyError:
+            raise NineMLUsageError(
+                "No component array named '{}' in partition of '{}' network "
+                "(found '{}')".format(array_name, self._network.name,
+                                      "', '".join(self._component_arrays)))
+
+    def _partition_cells(self):
+        populations = list(self._network.populations)
+        projections = list(self._network.projections)
+        # The cost of each cell is 1 plus the weighted number of connections
+        # it receives
+        self._cell_costs = dict((p.name, numpy.ones(len(p)))
+                                for p in populations)
+        affinity = dict((p.name, {}) for p in populations)
+        for proj in projections:
+            conn = proj.connectivity
+            if self._synapse_weight:
+                self._cell_costs[proj.post.name] += (
+                    self._synapse_weight * conn.in_degrees())
+            num_conns = conn.statistics()['num_connections']
+            pre, post = proj.pre.name, proj.post.name
+            if pre != post:
+                for a, b in ((pre, post), (post, pre)):
+                    affinity[a][b] = affinity[a].get(b, 0) + num_conns
+        totals = dict((n, c.sum()) for n, c in self._cell_costs.items())
+        # Greedily lay out the populations, starting from the most costly
+        # and then appending the population with most connections to those
+        # already laid out, so that connected populations are adjacent (and
+        # therefore tend to be assigned to the same ranks)
+        remaining = [p.name for p in populations]
+        order = []
+        links = dict((n, 0) for n in remaining)
+        while remaining:
+            name = max(remaining, key=lambda n: (links[n], totals[n]))
+            remaining.remove(name)
+            order.append(name)
+            for other, count in affinity[name].items():
+                links[other] += count
+        self._population_order = order
+        # Split the cumulative cost of the laid out cells into contiguous
+        # segments of equal cost
+        costs = numpy.concatenate(
+            [self._cell_costs[n] for n in order] or [numpy.zeros(0)])
+        cumulative = numpy.cumsum(costs)
+        total = cumulative[-1] if len(cumulative) else 0.0
+        bounds = numpy.searchsorted(
+            cumulative, total * numpy.arange(1, self.num_ranks) /
+            self.num_ranks, side='left')
+        # The rank of each cell is the number of bounds before it
+        ranks = numpy.searchsorted(bounds, numpy.arange(len(costs)),
+                                   side='left')
+        offset = 0
+        for name in order:
+            size = len(self._cell_costs[name])
+            self._set_ranks(name + ComponentArray.suffix['post'],
+                            ranks[offset:offset + size])
+            offset += size
+
+    def _assign_synapses(self):
+        for proj in self._network.projections:
+            post_ranks = self._ranks[
+                proj.post.name + ComponentArray.suffix['post']]
+            # Synapses are indexed in the CSR order of the connectivity
+            ranks = post_ranks[proj.connectivity.to_csr().indices]
+            for role in ('response', 'plasticity'):
+                name = proj.name + ComponentArray.suffix[role]
+                if name in self._component_arrays:
+                    self._set_ranks(name, ranks)
+
+    def _set_ranks(self, array_name, ranks):
+        """
+        Stores the rank of each element of the component array, and maps
+        them to rank-local indices in a single pass by (stably) sorting the
+        elements by rank
+        """
+        ranks = numpy.asarray(ranks, dtype=int)
+        order = numpy.argsort(ranks, kind='stable')
+        bounds = numpy.zeros(self.num_ranks + 1, dtype=int)
+        numpy.cumsum(numpy.bincount(ranks, minlength=self.num_ranks),
+                     out=bounds[1:])
+        local = numpy.empty(len(ranks), dtype=int)
+        local[order] = (numpy.arange(len(ranks)) -
+                        numpy.repeat(bounds[:-1], numpy.diff(bounds)))
+        self._ranks[array_name] = ranks
+        self._local_indices[array_name] = local
+        self._rank_orders[array_name] = (order, bounds)
+
+    def _split_connection_groups(self):
+        """
+        Sorts the connections of each connection group by the rank of their
+        destination, so that the connections arriving at each rank are a
+        contiguous slice of the sorted arrays
+        """
+        self._split = {}
+        for group in self._connection_groups:
+            src_name, dest_name = group.source.name, group.destination.name
+            sources, destinations = group.connectivity.connections_array()
+            dest_ranks = self._ranks[dest_name][destinations]
+            # NB: A stable sort keeps the connections in their original order
+            # within each rank
+            order = numpy.argsort(dest_ranks, kind='stable')
+            bounds = numpy.zeros(self.num_ranks + 1, dtype=int)
+            numpy.cumsum(numpy.bincount(dest_ranks, minlength=self.num_ranks),
+                         out=bounds[1:])
+            sources = numpy.asarray(sources, dtype=int)[order]
+            destinations = numpy.asarray(destinations, dtype=int)[order]
+            src_ranks = self._ranks[src_name][sources]
+            self._split[group.name] = (
+                bounds, sources, src_ranks,
+                self._local_indices[src_name][sources],
+                self._local_indices[dest_name][destinations],
+                src_ranks == dest_ranks[order])
+
+    def _rank_connections(self, group_name, rank):
+        """
+        Returns the global sources, source ranks, local sources, local
+        destinations and whether the source is on the same rank of the
+        connections of a connection group that arrive at the given rank
+        """
+        try:
+            split = self._split[group_name]
+        except KeyError:
+            raise NineMLUsageError(
+                "No connection group named '{}' in partition of '{}' "
+                "network".format(group_name, self._network.name))
+        self._check_rank(rank)
+        bounds = split[0]
+        return tuple(a[bounds[rank]:bounds[rank + 1]] for a in split[1:])
+
+    def _rank_document(self, rank):
+        from nineml.document import Document
+        rank_arrays = OrderedDict()
+        for name, array in self._component_arrays.items():
+            bounds = self._rank_orders[name][1]
+            size = int(bounds[rank + 1] - bounds[rank])
+            if size:
+                rank_arrays[name] = ComponentArray(
+                    name, size, array.dynamics_properties)
+        rank_groups = []
+        for group in self._connection_groups:
+            _, _, sources, destinations, is_local = self._rank_connections(
+                group.name, rank)
+            sources, destinations = sources[is_local], destinations[is_local]
+            if not len(sources):
+                continue
+            source = rank_arrays[group.source.name]
+            destination = rank_arrays[group.destination.name]
+            props = ConnectionRuleProperties(
+                name=group.name + '_connectivity',
+                definition=explicit_connection_rule,
+                properties={'sourceIndices': sources,
+                            'destinationIndices': destinations})
+            rank_groups.append(type(group)(
+                group.name, source, destination,
+                source_port=group.source_port,
+                destination_port=group.destination_port,
+                connectivity=Connectivity(props, source.size,
+                                          destination.size),
+                delay=group.delay))
+        return Document(*(list(rank_arrays.values()) + rank_groups))
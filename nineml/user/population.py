@@ -1,9 +1,11 @@
 from itertools import chain
+from collections import OrderedDict
 from . import BaseULObject
 from .dynamics import DynamicsProperties
 import nineml.user
 from nineml.base import DocumentLevelObject, DynamicPortsObject
 from nineml.utils import validate_identifier
+from nineml.exceptions import NineMLUsageError
 
 
 class Population(BaseULObject, DocumentLevelObject, DynamicPortsObject):
@@ -54,6 +56,7 @@ class Population(BaseULObject, DocumentLevelObject, DynamicPortsObject):
     @size.setter
     def size(self, size):
         self._size = int(size)
+        BaseULObject._size_changes += 1
 
     @property
     def cell(self):
@@ -88,6 +91,47 @@ class Population(BaseULObject, DocumentLevelObject, DynamicPortsObject):
     def attributes_with_units(self):
         return chain(*[c.attributes_with_units for c in self.all_components()])
 
+    def parameter_table(self, rng=None, si_units=False):
+        """
+        Returns the value of each property and initial value of the cell
+        dynamics for every neuron in the population as columns of a table,
+        so they can be transferred to a simulator in bulk. SingleValues are
+        broadcast to every neuron, ArrayValues must provide a value for each
+        neuron and RandomDistributionValues are sampled for each neuron in a
+        single vectorised call.
+
+        Parameters
+        ----------
+        rng : numpy.random.Generator | None
+            The generator used to sample RandomDistributionValues
+        si_units : bool
+            Whether to convert the values to SI units (otherwise they are
+            in the units of the properties and initial values)
+
+        Returns
+        -------
+        table : OrderedDict(str, numpy.ndarray)
+            An array of length 'size' for each property and initial value,
+            keyed by name (properties first, then initial values, each in
+            alphabetical order)
+        """
+        table = OrderedDict()
+        for prop in chain(
+                sorted(self.cell.properties, key=lambda p: p.name),
+                sorted(self.cell.initial_values, key=lambda p: p.name)):
+            value = prop.value
+            if value.is_array() and len(value) != self.size:
+                raise NineMLUsageError(
+                    "Length of '{}' ArrayValue ({}) in '{}' does not match "
+                    "the size of '{}' population ({})".format(
+                        prop.name, len(value), self.cell.name, self.name,
+                        self.size))
+            column = value.to_array(self.size, rng=rng)
+            if si_units:
+                column = prop.units.to_SI(column)
+            table[prop.name] = column
+        return table
+
     def serialize_node(self, node, **options):
         node.attr('name', self.name, **options)
         node.attr('Size', self.size, in_body=True, **options)
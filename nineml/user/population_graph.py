@@ -0,0 +1,370 @@
+"""
+A compact, population-level summary of the connectivity of a network, which
+can be used to plan load balancing and the communication intervals of
+distributed simulations (see Network.population_graph).
+"""
+from builtins import range, zip
+from collections import OrderedDict
+import numpy
+import nineml.units as un
+from nineml.exceptions import (
+    NineMLUsageError, NineMLRandomDistributionDelayException)
+from .connectionrule import CompressedConnectivity
+
+
+class PopulationGraph(object):
+    """
+    The directed graph between the populations of a network, with an edge
+    for each projection between two populations. Projections to or from
+    selections are split into edges to or from each of the populations in
+    the selection, with the number of connections divided between them in
+    proportion to their size (i.e. assuming the connections are uniformly
+    distributed over the selection).
+
+    The edges are stored in parallel arrays ordered by source and
+    destination population, so they can be indexed with the compressed
+    adjacency returned by `to_csr`.
+
+    Parameters
+    ----------
+    network : Network
+        The network to summarise
+    analytic : bool
+        Whether to use the analytic number of connections of the projections
+        where possible (see Connectivity.statistics) instead of sampling
+        their connections
+    quantile : float | None
+        The quantile used to bound random delays (see
+        Projection.delay_bounds)
+    """
+
+    def __init__(self, network, analytic=True, quantile=None):
+        self._network = network
+        self._names = [p.name for p in network.populations]
+        self._sizes = numpy.array([p.size for p in network.populations],
+                                  dtype=numpy.int64)
+        index = dict((n, i) for i, n in enumerate(self._names))
+        edges = []
+        for proj in network.projections:
+            try:
+                # The lower bound of the delays limits the interval at which
+                # spikes need to be communicated along the edge
+                delay = proj.delay_bounds(quantile=quantile)[0]
+            except NineMLRandomDistributionDelayException:
+                delay = float('nan')
+            num_conns = proj.connectivity.statistics(
+                analytic=analytic)['num_connections']
+            for pre, pre_frac in self._expand(proj.pre):
+                for post, post_frac in self._expand(proj.post):
+                    edges.append((index[pre], index[post],
+                                  num_conns * pre_frac * post_frac, delay,
+                                  proj.name))
+        edges.sort(key=lambda e: (e[0], e[1]))
+        self._sources = numpy.array([e[0] for e in edges], dtype=numpy.int64)
+        self._destinations = numpy.array([e[1] for e in edges],
+                                         dtype=numpy.int64)
+        self._num_connections = numpy.array([e[2] for e in edges],
+                                            dtype=float)
+        self._delays = numpy.array([e[3] for e in edges], dtype=float)
+        self._projection_names = [e[4] for e in edges]
+        self._index = index
+
+    @property
+    def network(self):
+        return self._network
+
+    @property
+    def population_names(self):
+        return iter(self._names)
+
+    @property
+    def num_populations(self):
+        return len(self._names)
+
+    @property
+    def num_edges(self):
+        return len(self._sources)
+
+    @property
+    def sizes(self):
+        "The sizes of the populations"
+        return self._sizes
+
+    @property
+    def edge_sources(self):
+        "The indices of the source populations of the edges"
+        return self._sources
+
+    @property
+    def edge_destinations(self):
+        "The indices of the destination populations of the edges"
+        return self._destinations
+
+    @property
+    def num_connections(self):
+        "The (expected) number of connections of each edge"
+        return self._num_connections
+
+    @property
+    def delays(self):
+        """
+        The (lower bounds of the) delays of the edges in seconds (NaN for
+        random delays that can't be bounded)
+        """
+        return self._delays
+
+    @property
+    def projection_names(self):
+        "The names of the projections the edges were derived from"
+        return list(self._projection_names)
+
+    def index(self, population_name):
+        try:
+            return self._index[population_name]
+        except KeyError:
+            raise NineMLUsageError(
+                "No population named '{}' in '{}' network (found '{}')"
+                .format(population_name, self._network.name,
+                        "', '".join(self._names)))
+
+    def to_csr(self):
+        "Returns the compressed adjacency of the edges (by population index)"
+        return CompressedConnectivity.from_pairs(
+            self._sources, self._destinations, self.num_populations)
+
+    def successors(self, population_name):
+        "The names of the populations the population projects to"
+        dests = self._destinations[
+            self._sources == self.index(population_name)]
+        return [self._names[i] for i in numpy.unique(dests)]
+
+    def predecessors(self, population_name):
+        "The names of the populations that project to the population"
+        srcs = self._sources[
+            self._destinations == self.index(population_name)]
+        return [self._names[i] for i in numpy.unique(srcs)]
+
+    def in_connections(self):
+        "The (expected) number of incoming connections of each population"
+        return numpy.bincount(self._destinations,
+                              weights=self._num_connections,
+                              minlength=self.num_populations)
+
+    def out_connections(self):
+        "The (expected) number of outgoing connections of each population"
+        return numpy.bincount(self._sources, weights=self._num_connections,
+                              minlength=self.num_populations)
+
+    def fan_in(self):
+        """
+        The (expected) mean number of incoming connections of the cells of
+        each population
+        """
+        return self.in_connections() / numpy.maximum(self._sizes, 1)
+
+    def strongly_connected_components(self):
+        """
+        Returns the strongly connected components of the graph (i.e. the
+        groups of populations that are mutually reachable) as lists of
+        population names, in reverse topological order
+        """
+        return [[self._names[i] for i in c] for c in self._components()]
+
+    def longest_delay_path(self):
+        """
+        Returns the path with the largest total delay through the graph of
+        strongly connected components (i.e. the delays of edges between
+        populations in the same component, along which paths can be
+        arbitrarily long, aren't included)
+
+        Returns
+        -------
+        delay : float
+            The total delay along the path in seconds
+        path : list(str)
+            The names of the populations at either end of the edges along the
+            path (consecutive populations in the same component are
+            connected via edges within the component)
+        """
+        self._check_delays('longest delay path')
+        if not self.num_populations:
+            return 0.0, []
+        components = self._components()
+        component_of = numpy.empty(self.num_populations, dtype=numpy.int64)
+        for i, comp in enumerate(components):
+            component_of[comp] = i
+        # The components are in reverse topological order, so the longest
+        # path from each component can be found from the components already
+        # processed
+        longest = numpy.zeros(len(components))
+        next_edge = numpy.full(len(components), -1, dtype=numpy.int64)
+        # NB: The edges are sorted by source so the edge indices match the
+        # positions in the compressed adjacency
+        csr = self.to_csr()
+        for comp_index, comp in enumerate(components):
+            for pop in comp:
+                for edge in range(csr.indptr[pop], csr.indptr[pop + 1]):
+                    dest_comp = component_of[self._destinations[edge]]
+                    if dest_comp == comp_index:
+                        continue
+                    length = self._delays[edge] + longest[dest_comp]
+                    if length > longest[comp_index]:
+                        longest[comp_index] = length
+                        next_edge[comp_index] = edge
+        comp_index = int(numpy.argmax(longest))
+        path = []
+        while next_edge[comp_index] >= 0:
+            edge = next_edge[comp_index]
+            for pop in (self._sources[edge], self._destinations[edge]):
+                if not path or path[-1] != self._names[pop]:
+                    path.append(self._names[pop])
+            comp_index = component_of[self._destinations[edge]]
+        if not path:
+            path = [self._names[components[comp_index][0]]]
+        return float(longest.max()), path
+
+    def min_delay(self, groups=None):
+        """
+        Returns the minimum delay of the edges (or of the edges between the
+        given groups of populations) in seconds, which is the largest
+        interval at which the groups could exchange spikes in a distributed
+        simulation
+
+        Parameters
+        ----------
+        groups : list(list(str)) | None
+            Groups of population names. Populations not included in any
+            group are treated as being in a group by themselves.
+        """
+        self._check_delays('minimum delay')
+        if groups is None:
+            crossing = numpy.ones(self.num_edges, dtype=bool)
+        else:
+            group_of = self._group_indices(groups)
+            crossing = (group_of[self._sources] !=
+                        group_of[self._destinations])
+        if not crossing.any():
+            return float('inf')
+        return float(self._delays[crossing].min())
+
+    def min_delay_cut(self, interval):
+        """
+        Splits the populations into the smallest groups such that all edges
+        between different groups have a delay of at least 'interval', i.e.
+        groups that can be simulated on separate processes which exchange
+        spikes every 'interval'
+
+        Parameters
+        ----------
+        interval : float | Quantity
+            The communication interval (in seconds if a float)
+
+        Returns
+        -------
+        groups : list(list(str))
+            The groups of population names
+        """
+        self._check_delays('minimum delay cut')
+        if isinstance(interval, un.Quantity):
+            interval = float(interval.in_units(un.s))
+        # Union-find over the edges shorter than the interval
+        parent = numpy.arange(self.num_populations)
+
+        def find(i):
+            while parent[i] != i:
+                parent[i] = parent[parent[i]]
+                i = parent[i]
+            return i
+
+        short = self._delays < interval
+        for src, dest in zip(self._sources[short], self._destinations[short]):
+            root_src, root_dest = find(src), find(dest)
+            if root_src != root_dest:
+                parent[max(root_src, root_dest)] = min(root_src, root_dest)
+        groups = OrderedDict()
+        for i, name in enumerate(self._names):
+            groups.setdefault(find(i), []).append(name)
+        return list(groups.values())
+
+    def _components(self):
+        """
+        Tarjan's algorithm (without recursion) returning the strongly
+        connected components as arrays of population indices in reverse
+        topological order
+        """
+        csr = self.to_csr()
+        num_pops = self.num_populations
+        indices = numpy.full(num_pops, -1, dtype=numpy.int64)
+        lowlinks = numpy.zeros(num_pops, dtype=numpy.int64)
+        on_stack = numpy.zeros(num_pops, dtype=bool)
+        stack = []
+        components = []
+        counter = 0
+        for root in range(num_pops):
+            if indices[root] >= 0:
+                continue
+            work = [(root, csr.indptr[root])]
+            indices[root] = lowlinks[root] = counter
+            counter += 1
+            stack.append(root)
+            on_stack[root] = True
+            while work:
+                pop, edge = work[-1]
+                if edge < csr.indptr[pop + 1]:
+                    work[-1] = (pop, edge + 1)
+                    dest = csr.indices[edge]
+                    if indices[dest] < 0:
+                        indices[dest] = lowlinks[dest] = counter
+                        counter += 1
+                        stack.append(dest)
+                        on_stack[dest] = True
+                        work.append((dest, csr.indptr[dest]))
+                    elif on_stack[dest]:
+                        lowlinks[pop] = min(lowlinks[pop], indices[dest])
+                    continue
+                work.pop()
+                if work:
+                    parent = work[-1][0]
+                    lowlinks[parent] = min(lowlinks[parent], lowlinks[pop])
+                if lowlinks[pop] == indices[pop]:
+                    component = []
+                    while True:
+                        member = stack.pop()
+                        on_stack[member] = False
+                        component.append(member)
+                        if member == pop:
+                            break
+                    components.append(numpy.array(sorted(component),
+                                                  dtype=numpy.int64))
+        return components
+
+    def _expand(self, population):
+        """
+        Returns the names of the populations in the population or selection
+        and the fraction of its size they make up
+        """
+        if not hasattr(population, 'operation'):
+            return [(population.name, 1.0)]
+        size = float(population.size)
+        expanded = []
+        for member in population.populations:
+            frac = member.size / size if size else 0.0
+            expanded.extend((n, f * frac) for n, f in self._expand(member))
+        return expanded
+
+    def _group_indices(self, groups):
+        group_of = numpy.arange(self.num_populations) + len(groups)
+        for i, group in enumerate(groups):
+            for name in group:
+                group_of[self.index(name)] = i
+        return group_of
+
+    def _check_delays(self, query):
+        if numpy.isnan(self._delays).any():
+            raise NineMLRandomDistributionDelayException(
+                "Delays of projections '{}' are randomly distributed so "
+                "cannot determine {} (without a quantile)".format(
+                    "', '".join(sorted(set(
+                        n for n, d in zip(self._projection_names,
+                                          self._delays) if numpy.isnan(d)))),
+                    query))
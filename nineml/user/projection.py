@@ -1,6 +1,7 @@
 # encoding: utf-8
 from past.builtins import basestring
 from itertools import chain
+import numpy
 from . import BaseULObject
 from nineml.exceptions import (
     NineMLMissingSerializationError, NineMLSerializationError)
@@ -15,6 +16,7 @@ from nineml.abstraction.ports import EventReceivePort
 from .port_connections import (
     AnalogPortConnection, EventPortConnection, BasePortConnection)
 from nineml.values import SingleValue
+from nineml.exceptions import NineMLRandomDistributionDelayException
 from nineml.exceptions import NineMLUsageError, name_error
 
 
@@ -124,7 +126,7 @@ class Projection(BaseULObject, ContainerObject, DocumentLevelObject):
             self.add(port_connection)
 
     def __len__(self):
-        return sum(1 for _ in self.connectivity.connections())
+        return self.connectivity.num_connections
 
     @property
     def name(self):
@@ -157,10 +159,75 @@ class Projection(BaseULObject, ContainerObject, DocumentLevelObject):
     def connections(self):
         return self.connectivity.connections()
 
+    def connection_chunks(self, max_pairs=None):
+        """
+        Iterates over the connections of the projection in chunks of source
+        and destination index arrays (see `Connectivity.iter_chunks`)
+        """
+        return self.connectivity.iter_chunks(max_pairs=max_pairs)
+
     @property
     def delay(self):
         return self._delay
 
+    def delay_bounds(self, quantile=None, si_units=True):
+        """
+        Returns the lower and upper bounds of the delays of the projection's
+        connections. Per-connection delays (ArrayValues) are bounded by their
+        minimum and maximum and random delays by the support of their
+        distribution or, if 'quantile' is provided, by its 'quantile' and
+        1 - 'quantile' quantiles (where the lower quantile is clipped at 0 as
+        delays can't be negative).
+
+        Parameters
+        ----------
+        quantile : float | None
+            The fraction of random delays allowed to fall below the lower
+            bound (and above the upper bound). Required for distributions
+            with infinite support (e.g. normal)
+        si_units : bool
+            Whether to return the bounds as floats in seconds instead of
+            quantities in the units of the delay
+
+        Returns
+        -------
+        lower : float | Quantity
+            The lower bound of the delays
+        upper : float | Quantity
+            The upper bound of the delays
+        """
+        value = self.delay.value
+        if value.is_single():
+            lower = upper = float(value.value)
+        elif value.is_array():
+            values = numpy.asarray(value.values, dtype=float)
+            if not len(values):
+                raise NineMLUsageError(
+                    "Delay array of '{}' projection is empty".format(
+                        self.name))
+            lower, upper = values.min(), values.max()
+        else:
+            distribution = value.distribution
+            if quantile is not None:
+                # Quantiles of distributions that extend below 0 (e.g.
+                # normal) are clipped at 0
+                lower = max(distribution.quantile(quantile), 0.0)
+                upper = max(distribution.quantile(1.0 - quantile), 0.0)
+            else:
+                lower, upper = distribution.support()
+            if not (numpy.isfinite(lower) and numpy.isfinite(upper)):
+                raise NineMLRandomDistributionDelayException(
+                    "Delay of '{}' projection is drawn from a '{}' "
+                    "distribution with infinite support, so a quantile is "
+                    "required to bound it".format(
+                        self.name, distribution.distribution_type))
+        if not si_units:
+            units = self.delay.units
+            return (Quantity(float(lower), units),
+                    Quantity(float(upper), units))
+        units = self.delay.units
+        return units.to_SI(float(lower)), units.to_SI(float(upper))
+
     @name_error
     def analog_port_connection(self, name):
         return self._analog_port_connections[name]
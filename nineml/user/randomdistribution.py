@@ -1,4 +1,8 @@
+import math
+import numpy
 from nineml.user.component import Component
+from nineml.exceptions import NineMLUsageError
+from nineml.utils import check_numpy_generators
 
 
 class RandomDistributionProperties(Component):
@@ -12,9 +16,204 @@ class RandomDistributionProperties(Component):
     """
     nineml_type = 'RandomDistributionProperties'
 
+    # Functions that draw samples from a NumPy Generator for each UncertML
+    # distribution type, given a dictionary of the property values. Where
+    # parameterisations vary, the alternative property names are accepted
+    samplers = {
+        'normal': lambda rng, p, size: rng.normal(
+            p['mean'], _stddev(p), size),
+        'uniform': lambda rng, p, size: rng.uniform(
+            p['minimum'], p['maximum'], size),
+        'exponential': lambda rng, p, size: rng.exponential(
+            1.0 / p['rate'], size),
+        'gamma': lambda rng, p, size: rng.gamma(p['shape'], p['scale'], size),
+        'log-normal': lambda rng, p, size: rng.lognormal(
+            p['logScale'], p['shape'], size),
+        'poisson': lambda rng, p, size: rng.poisson(p['rate'], size),
+        'bernoulli': lambda rng, p, size: rng.binomial(
+            1, p['probability'], size),
+        'binomial': lambda rng, p, size: rng.binomial(
+            int(p['numberOfTrials']), p['probabilityOfSuccess'], size),
+        'beta': lambda rng, p, size: rng.beta(p['alpha'], p['beta'], size),
+        'cauchy': lambda rng, p, size: (
+            p['location'] + p['scale'] * rng.standard_cauchy(size)),
+        'chi-square': lambda rng, p, size: rng.chisquare(
+            p['degreesOfFreedom'], size),
+        'laplace': lambda rng, p, size: rng.laplace(
+            p['location'], p['scale'], size),
+        'logistic': lambda rng, p, size: rng.logistic(
+            p['location'], p['scale'], size),
+        'pareto': lambda rng, p, size: p['scale'] * (
+            1.0 + rng.pareto(p['shape'], size)),
+        'weibull': lambda rng, p, size: p['scale'] * rng.weibull(
+            p['shape'], size),
+        'geometric': lambda rng, p, size: rng.geometric(
+            p['probability'], size),
+        'negative-binomial': lambda rng, p, size: rng.negative_binomial(
+            p['numberOfSuccesses'], p['probability'], size)}
+
+    # The lower and upper bounds of the support of each UncertML distribution
+    # type, given a dictionary of the property values
+    supports = {
+        'normal': lambda p: (-numpy.inf, numpy.inf),
+        'uniform': lambda p: (p['minimum'], p['maximum']),
+        'exponential': lambda p: (0.0, numpy.inf),
+        'gamma': lambda p: (0.0, numpy.inf),
+        'log-normal': lambda p: (0.0, numpy.inf),
+        'poisson': lambda p: (0.0, numpy.inf),
+        'bernoulli': lambda p: (0.0, 1.0),
+        'binomial': lambda p: (0.0, float(int(p['numberOfTrials']))),
+        'beta': lambda p: (0.0, 1.0),
+        'cauchy': lambda p: (-numpy.inf, numpy.inf),
+        'chi-square': lambda p: (0.0, numpy.inf),
+        'laplace': lambda p: (-numpy.inf, numpy.inf),
+        'logistic': lambda p: (-numpy.inf, numpy.inf),
+        'pareto': lambda p: (p['scale'], numpy.inf),
+        'weibull': lambda p: (0.0, numpy.inf),
+        'geometric': lambda p: (1.0, numpy.inf),
+        'negative-binomial': lambda p: (0.0, numpy.inf)}
+
+    # Closed-form quantile functions, other distributions are estimated from
+    # samples
+    quantile_functions = {
+        'uniform': lambda p, q: p['minimum'] + q * (p['maximum'] -
+                                                    p['minimum']),
+        'exponential': lambda p, q: -math.log1p(-q) / p['rate'],
+        'normal': lambda p, q: p['mean'] + _stddev(p) * _normal_ppf(q)}
+
+    # The number of samples used to estimate quantiles of distributions
+    # without closed-form quantile functions
+    quantile_num_samples = 2 ** 20
+
     @property
     def standard_library(self):
         return self.component_class.standard_library
 
+    @property
+    def distribution_type(self):
+        "The UncertML name of the distribution, e.g. 'normal'"
+        return self.standard_library.rsplit('/', 1)[-1]
+
     def get_nineml_type(self):
         return self.nineml_type
+
+    def sample(self, size, rng=None):
+        """
+        Draws samples from the distribution in a single vectorised call
+
+        Parameters
+        ----------
+        size : int
+            The number of samples to draw
+        rng : numpy.random.Generator | None
+            The generator to draw the samples from. If None a new,
+            randomly seeded, generator is used
+
+        Returns
+        -------
+        samples : numpy.ndarray(float)
+            The samples drawn from the distribution
+        """
+        try:
+            sampler = self.samplers[self.distribution_type]
+        except KeyError:
+            raise NineMLUsageError(
+                "Sampling from '{}' distributions is not supported ('{}')"
+                .format(self.distribution_type, self.name))
+        if rng is None:
+            check_numpy_generators(
+                "Sampling '{}' without a generator".format(self.name))
+            rng = numpy.random.default_rng()
+        props = self._property_values()
+        try:
+            samples = sampler(rng, props, size)
+        except KeyError as e:
+            raise NineMLUsageError(
+                "Missing '{}' property required to sample from '{}' "
+                "distribution '{}'".format(e.args[0], self.distribution_type,
+                                            self.name))
+        return numpy.asarray(samples, dtype=float)
+
+    def support(self):
+        """
+        Returns the lower and upper bounds of the values the distribution can
+        take (which may be infinite)
+        """
+        try:
+            support = self.supports[self.distribution_type]
+        except KeyError:
+            raise NineMLUsageError(
+                "Support of '{}' distributions is not known ('{}')"
+                .format(self.distribution_type, self.name))
+        try:
+            lower, upper = support(self._property_values())
+        except KeyError as e:
+            raise NineMLUsageError(
+                "Missing '{}' property required to determine the support of "
+                "'{}' distribution '{}'".format(
+                    e.args[0], self.distribution_type, self.name))
+        return float(lower), float(upper)
+
+    def quantile(self, q):
+        """
+        Returns the value below which the fraction 'q' of the distribution
+        lies. Where a closed-form quantile function isn't available the
+        quantile is estimated from a fixed-seed sample of the distribution,
+        so the result is reproducible.
+
+        Parameters
+        ----------
+        q : float
+            The fraction of the distribution, in [0, 1]
+        """
+        if not 0.0 <= q <= 1.0:
+            raise NineMLUsageError(
+                "Quantile must be between 0 and 1 ({})".format(q))
+        if q in (0.0, 1.0):
+            return self.support()[int(q)]
+        try:
+            quantile_function = self.quantile_functions[
+                self.distribution_type]
+        except KeyError:
+            check_numpy_generators(
+                "Estimating quantiles of '{}'".format(self.name))
+            samples = self.sample(self.quantile_num_samples,
+                                  rng=numpy.random.default_rng(0))
+            return float(numpy.quantile(samples, q))
+        try:
+            return float(quantile_function(self._property_values(), q))
+        except KeyError as e:
+            raise NineMLUsageError(
+                "Missing '{}' property required to determine quantile of "
+                "'{}' distribution '{}'".format(
+                    e.args[0], self.distribution_type, self.name))
+
+    def _property_values(self):
+        return dict((p.name, float(p.value)) for p in self.properties)
+
+
+def _normal_ppf(q):
+    """
+    The quantile function of the standard normal distribution, found by
+    bisection of the (monotonic) cumulative distribution function
+    """
+    lower, upper = -40.0, 40.0
+    for _ in range(200):
+        mid = 0.5 * (lower + upper)
+        if 0.5 * math.erfc(-mid / math.sqrt(2.0)) < q:
+            lower = mid
+        else:
+            upper = mid
+        if upper - lower < 1e-12:
+            break
+    return 0.5 * (lower + upper)
+
+
+def _stddev(props):
+    try:
+        return props['stddev']
+    except KeyError:
+        try:
+            return props['standardDeviation']
+        except KeyError:
+            return numpy.sqrt(props['variance'])
@@ -1,4 +1,6 @@
 from collections import OrderedDict
+import numbers
+import numpy
 from . import BaseULObject
 from nineml.base import (
     DocumentLevelObject, ContainerObject, DynamicPortsObject)
@@ -8,6 +10,7 @@ from nineml.utils import validate_identifier
 from .component_array import ComponentArray
 from nineml.exceptions import name_error
 from itertools import chain
+from past.builtins import basestring
 from collections import defaultdict
 
 
@@ -95,6 +98,7 @@ class Concatenate(BaseULObject, ContainerObject):
     def __init__(self, items, **kwargs):
         BaseULObject.__init__(self, **kwargs)
         ContainerObject.__init__(self, **kwargs)
+        self._offsets_cache = None
         items = list(items)
         if all(isinstance(it, Item) for it in items):
             indices = [it.index for it in items]
@@ -163,6 +167,100 @@ class Concatenate(BaseULObject, ContainerObject):
         """Return a list of the items in the concatenation."""
         return len(self._items)
 
+    @property
+    def size(self):
+        return int(self.offsets[-1])
+
+    @property
+    def offsets(self):
+        """
+        The global index of the first element of each item in the
+        concatenation (in order of item index) followed by the total size.
+        The offsets are computed once and cached until items are added or
+        removed or the size of a population (or component array) is set.
+        """
+        if (self._offsets_cache is None or
+                self._offsets_cache[0] != BaseULObject._size_changes):
+            items = sorted(self.items, key=lambda it: it.index)
+            offsets = numpy.zeros(len(items) + 1, dtype=numpy.int64)
+            numpy.cumsum([it.population.size for it in items],
+                         out=offsets[1:])
+            offsets.flags.writeable = False
+            self._offsets_cache = (BaseULObject._size_changes, offsets,
+                                   [it.population.name for it in items])
+        return self._offsets_cache[1]
+
+    def _add_elements(self, elements):
+        super(Concatenate, self)._add_elements(elements)
+        self._offsets_cache = None
+
+    def remove(self, *elements):
+        super(Concatenate, self).remove(*elements)
+        self._offsets_cache = None
+
+    def global_to_local(self, indices):
+        """
+        Maps global indices into the concatenation to the index of the item
+        they fall in and their local index within its population
+
+        Parameters
+        ----------
+        indices : int | array(int)
+            Global indices into the concatenation
+
+        Returns
+        -------
+        item_indices : array(int)
+            The indices of the items the elements belong to
+        local_indices : array(int)
+            The indices of the elements within the populations of the items
+        """
+        offsets = self.offsets
+        indices = numpy.asarray(indices, dtype=numpy.int64)
+        if indices.size and (indices.min() < 0 or
+                             indices.max() >= offsets[-1]):
+            raise NineMLUsageError(
+                "Indices out of range for concatenation of size {}"
+                .format(offsets[-1]))
+        item_indices = numpy.searchsorted(offsets, indices, side='right') - 1
+        return item_indices, indices - offsets[item_indices]
+
+    def local_to_global(self, population, indices):
+        """
+        Maps local indices into one of the populations in the concatenation
+        to global indices into the concatenation
+
+        Parameters
+        ----------
+        population : str | int | Population | Selection | ComponentArray
+            The population (or its name or item index)
+        indices : int | array(int)
+            Local indices into the population
+        """
+        offsets = self.offsets
+        if isinstance(population, numbers.Integral):
+            item_index = int(population)
+            if not 0 <= item_index < self.num_items:
+                raise NineMLUsageError(
+                    "Item index {} is out of range for concatenation of {} "
+                    "items".format(item_index, self.num_items))
+        else:
+            if not isinstance(population, basestring):
+                population = population.name
+            try:
+                item_index = self._offsets_cache[2].index(population)
+            except ValueError:
+                raise NineMLUsageError(
+                    "'{}' is not in concatenation ('{}')".format(
+                        population, "', '".join(self._offsets_cache[2])))
+        indices = numpy.asarray(indices, dtype=numpy.int64)
+        size = offsets[item_index + 1] - offsets[item_index]
+        if indices.size and (indices.min() < 0 or indices.max() >= size):
+            raise NineMLUsageError(
+                "Indices out of range for item {} of size {}"
+                .format(item_index, size))
+        return indices + offsets[item_index]
+
     def serialize_node(self, node, **options):  # @UnusedVariable
         node.children(self.items, **options)
 
@@ -239,7 +337,13 @@ class Selection(BaseULObject, DocumentLevelObject, DynamicPortsObject):
 
     @property
     def size(self):
-        return sum(p.size for p in self.populations)
+        return self.operation.size
+
+    def global_to_local(self, indices):
+        return self.operation.global_to_local(indices)
+
+    def local_to_global(self, population, indices):
+        return self.operation.local_to_global(population, indices)
 
     port = combined_port_accessor(Population.port)
     ports = combined_ports_property(Population.ports)
@@ -8,4 +8,4 @@ from .path import join_norm, restore_sys_path, is_file_handle
 from .equality import nearly_equal, xml_equal
 from .validation import (
     check_inferred_against_declared, validate_identifier,
-    assert_no_duplicates)
+    assert_no_duplicates, check_numpy_generators)
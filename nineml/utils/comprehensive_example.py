@@ -5,13 +5,15 @@ comprehensive testing over all 9ML elements
 from __future__ import absolute_import
 from past.builtins import basestring
 import pkgutil
+import numpy
 from collections import defaultdict
 from itertools import chain
 import nineml
 import nineml.units as un
 from nineml.annotations import Annotations
 from nineml.units import Quantity
-from nineml.values import SingleValue, ArrayValue, RandomDistributionValue
+from nineml.values import (
+    SingleValue, ArrayValue, ExternalArrayValue, RandomDistributionValue)
 from nineml.document import Document
 from nineml.reference import Reference
 from nineml.abstraction import (
@@ -499,7 +501,7 @@ netA = Network(
 
 netB = Network(
     name='netB',
-    populations=[popC, popD],
+    populations=[popC, popD, popE],
     projections=[projB])
 
 netC = Network(
@@ -535,7 +537,8 @@ def add_with_sub_elements(element):
     Recursively adds 9ML elements from the example document to a dictionary
     sorted by 9ML types
     """
-    if isinstance(element, (basestring, Document)) or element in loading:
+    if (isinstance(element, (basestring, Document, numpy.ndarray)) or
+            element in loading):
         return
     if not isinstance(element, (dict, list, tuple, int, float, str,
                                 sympy.Basic, Connectivity)):
@@ -579,6 +582,12 @@ annotations = Annotations()
 annotations.set(('cat1', 'NS_1'), 'key1', 'value1')
 annotations.set(('cat2', 'NS_2'), 'key2', 'value2')
 instances_of_all_types[Annotations.nineml_type]['example'] = annotations
+# External array values aren't included in the documents as they reference
+# files that need to exist to load them
+externalArrayValue = ExternalArrayValue('/path/to/values.npy',
+                                        'application/x-npy')
+instances_of_all_types[ExternalArrayValue.nineml_type][
+    externalArrayValue.key] = externalArrayValue
 for elem in doc1.values():
     add_with_sub_elements(elem)
 # Add remaining elements that are not picked up by recursive
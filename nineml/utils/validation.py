@@ -2,9 +2,21 @@ from __future__ import absolute_import
 from builtins import next
 from past.builtins import basestring
 import re
+import numpy
 from ..exceptions import NineMLUsageError
 
 
+def check_numpy_generators(feature):
+    """
+    Checks that the installed version of NumPy provides the random Generator
+    API (NumPy >= 1.17), which is required by 'feature'
+    """
+    if not hasattr(numpy.random, 'default_rng'):
+        raise NineMLUsageError(
+            "{} requires NumPy >= 1.17 (found {})".format(
+                feature, numpy.__version__))
+
+
 def check_inferred_against_declared(declared, inferred, desc='',
                                     strict_unused=True):
     decl_set = set(declared)
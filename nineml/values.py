@@ -5,15 +5,21 @@ from builtins import zip  # @IgnorePep8
 from .base import AnnotatedNineMLObject  # @IgnorePep8
 from abc import ABCMeta  # @IgnorePep8
 from urllib.request import urlopen  # @IgnorePep8
+from urllib.parse import urlparse, urljoin  # @IgnorePep8
+import os.path  # @IgnorePep8
+import io  # @IgnorePep8
+import weakref  # @IgnorePep8
 import contextlib  # @IgnorePep8
-import collections  # @IgnorePep8
+import base64  # @IgnorePep8
+import zlib  # @IgnorePep8
 import sympy  # @IgnorePep8
 import itertools  # @IgnorePep8
 from operator import itemgetter  # @IgnorePep8
 import numpy  # @IgnorePep8
 import nineml  # @IgnorePep8
 from nineml.exceptions import (  # @IgnorePep8
-    NineMLUsageError, NineMLValueError, NineMLSerializationError)
+    NineMLUsageError, NineMLValueError, NineMLSerializationError,
+    NineMLIOError)
 from future.utils import with_metaclass  # @IgnorePep8
 
 # =============================================================================
@@ -116,6 +122,12 @@ class SingleValue(BaseValue):
     def is_single(self):
         return True
 
+    def to_array(self, size, rng=None):  # @UnusedVariable
+        """
+        Returns the value broadcast to an array of length 'size'
+        """
+        return numpy.full(size, self._value)
+
     def __iter__(self):
         """Infinitely iterate the same value"""
         return itertools.repeat(self._value)
@@ -244,49 +256,108 @@ class ArrayValue(BaseValue):
     nineml_type = "ArrayValue"
     nineml_attr = ('values',)
 
-    DataFile = collections.namedtuple('DataFile', 'url mimetype, columnName')
+    # Encodings that can be passed to the serializer as the 'array_encoding'
+    # option. 'rows' writes an ArrayValueRow element for each value, the
+    # binary encodings write the values as a single (little-endian) base64
+    # blob in the body of the element (9ML >= v2 only) and 'dataset' stores
+    # them natively (HDF5 only, where it is the default)
+    binary_encodings = ('base64', 'base64-zlib')
+    encodings = ('rows',) + binary_encodings + ('dataset',)
+    binary_dtype = '<f8'
 
-    def __init__(self, values, datafile=None):
+    def __init__(self, values):
         super(ArrayValue, self).__init__()
-        try:
-            self._values = values.astype(float)  # If NumPy array
-        except AttributeError:
-            try:
-                self._values = [float(v) for v in values]
-            except (TypeError, ValueError):
-                raise NineMLValueError(
-                    "Values provided to ArrayValue ({}) could not be "
-                    "converted to a list of floats"
-                    .format(type(values)))
-        if datafile is None:
-            self._datafile = None
+        lazy_values = loaded_values = None
+        if isinstance(values, numpy.memmap) or (
+                hasattr(values, 'dtype') and hasattr(values, 'shape') and
+                not isinstance(values, (numpy.ndarray, numpy.generic))):
+            # Arrays backed by a file (e.g. memory-mapped arrays and HDF5
+            # datasets) are sliced lazily until all values are required
+            lazy_values = values
         else:
-            self._datafile = self.DataFile(*datafile)
+            try:
+                # NB: Integer arrays (e.g. the connection indices of explicit
+                # connectivity) keep their integer type
+                loaded_values = values.astype(self._dtype(values))
+            except AttributeError:
+                try:
+                    loaded_values = [float(v) for v in values]
+                except (TypeError, ValueError):
+                    raise NineMLValueError(
+                        "Values provided to ArrayValue ({}) could not be "
+                        "converted to a list of floats"
+                        .format(type(values)))
+        self._lazy_values = lazy_values
+        self._loaded_values = loaded_values
+
+    @property
+    def _values(self):
+        if self._loaded_values is None:
+            # NB: Doesn't copy memory-mapped float (or int64) arrays
+            self._loaded_values = numpy.asarray(
+                self._lazy_values[...], dtype=self._dtype(self._lazy_values))
+        return self._loaded_values
 
     @property
     def values(self):
         return self._values
 
+    @classmethod
+    def _dtype(cls, array):
+        return numpy.int64 if array.dtype.kind in 'iu' else float
+
+    @property
+    def is_loaded(self):
+        "Whether the values of a lazily sliced array have been loaded"
+        return self._loaded_values is not None
+
     @property
     def key(self):
         # TODO: Should put a hash on the end of this to make it unique
-        return str('_'.join(str(v) for v in self._values[:10]))
+        return str('_'.join(str(v) for v in self[:10]))
 
     def is_array(self):
         return True
 
+    def to_array(self, size, rng=None):  # @UnusedVariable
+        """
+        Returns the values as a NumPy array, checking that there is a value
+        for each of the 'size' elements
+        """
+        if len(self) != size:
+            raise NineMLUsageError(
+                "Length of ArrayValue ({}) does not match the required size "
+                "({})".format(len(self), size))
+        return numpy.asarray(self._values, dtype=float)
+
     def __iter__(self):
         return iter(self._values)
 
     def __getitem__(self, index):
-        return self._values[index]
+        if self._loaded_values is not None:
+            return self._loaded_values[index]
+        # Only read the requested slice from file
+        sliced = self._lazy_values[index]
+        dtype = self._dtype(self._lazy_values)
+        if numpy.ndim(sliced):
+            return numpy.asarray(sliced, dtype=dtype)
+        return int(sliced) if dtype is numpy.int64 else float(sliced)
 
     def __len__(self):
-        return len(self._values)
+        if self._loaded_values is None:
+            return len(self._lazy_values)
+        return len(self._loaded_values)
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        # File-backed arrays can't be pickled so load them first
+        state['_loaded_values'] = self._values
+        state['_lazy_values'] = None
+        return state
 
     def __repr__(self):
         return "ArrayValue({}{})".format(
-            ', '.join(str(v) for v in self._values[:5]),
+            ', '.join(str(v) for v in self[:5]),
             ('...' if len(self) >= 5 else ''))
 
     def inverse(self):
@@ -295,29 +366,46 @@ class ArrayValue(BaseValue):
         except AttributeError:
             return ArrayValue(1.0 / v for v in self._values)
 
-    def serialize_node(self, node, **options):  # @UnusedVariable
-        if self._datafile is None:
+    def serialize_node(self, node, array_encoding=None, **options):
+        if array_encoding is None:
+            # Store arrays natively by default where they are supported
+            array_encoding = ('dataset' if node.visitor.supports_arrays
+                              else 'rows')
+        if array_encoding not in self.encodings:
+            raise NineMLSerializationError(
+                "Unrecognised array encoding '{}', can be one of '{}'"
+                .format(array_encoding, "', '".join(self.encodings)))
+        if array_encoding == 'dataset':
+            # Integer arrays (e.g. connection indices) are stored as such,
+            # as they compress much better, and all others as floats so the
+            # dtype is preserved when they are read back
+            values = numpy.asarray(self._values)
+            values = values.astype(self._dtype(values), copy=False)
+            node.attr('encoding', array_encoding, **options)
+            node.array('values', values, **options)
+        elif array_encoding != 'rows' and node.visitor.major_version >= 2:
+            data = numpy.asarray(self._values,
+                                 dtype=self.binary_dtype).tobytes()
+            if array_encoding == 'base64-zlib':
+                data = zlib.compress(data)
+            node.attr('encoding', array_encoding, **options)
+            node.attr('dtype', self.binary_dtype, **options)
+            node.attr('length', len(self), **options)
+            node.body(base64.b64encode(data).decode('ascii'), **options)
+        else:
             for i, value in enumerate(self._values):
                 row_elem = node.visitor.create_elem(
                     'ArrayValueRow', parent=node.serial_element, multiple=True,
                     **options)
                 node.visitor.set_attr(row_elem, 'index', i)
-                node.visitor.set_attr(row_elem, 'value', value)
-        else:
-            node.attr('url', self.url, **options)
-            node.attr('mimetype', self.mimetype, **options)
-            node.attr('columnName', self.columnName, **options)
+                node.visitor.set_attr(row_elem, 'value', float(value))
 
     @classmethod
     def unserialize_node(cls, node, **options):  # @UnusedVariable
-        if node.name == 'ExternalArrayValue':
-            url = node.attr('url', **options)
-            with contextlib.closing(urlopen(url)) as f:
-                # FIXME: Should use a non-numpy version of this load function
-                values = numpy.loadtxt(f)
-            return cls(values, (node.attr('url', **options),
-                                node.attr('mimetype', **options),
-                                node.attr('columnName', **options)))
+        if node.attr('encoding', default=None, **options) == 'dataset':
+            return cls(node.array('values', **options))
+        elif node.attr('encoding', default=None, **options) is not None:
+            return cls(cls._decode_body(node, **options))
         else:
             rows = []
             for name, elem in node.visitor.get_all_children(
@@ -345,6 +433,40 @@ class ArrayValue(BaseValue):
                     "Indices greater or equal to the number of array rows")
             return cls(values)
 
+    @classmethod
+    def _decode_body(cls, node, **options):
+        """
+        Reads the values of an ArrayValue written with one of the binary
+        encodings straight into a NumPy array
+        """
+        encoding = node.attr('encoding', **options)
+        if encoding not in cls.binary_encodings:
+            raise NineMLSerializationError(
+                "Unrecognised encoding '{}' of ArrayValue, can be one of '{}'"
+                .format(encoding, "', '".join(cls.binary_encodings)))
+        try:
+            dtype = numpy.dtype(node.attr('dtype', **options))
+        except TypeError:
+            raise NineMLSerializationError(
+                "Invalid dtype '{}' of ArrayValue".format(
+                    node.attr('dtype', **options)))
+        length = node.attr('length', dtype=int, **options)
+        try:
+            data = base64.b64decode(node.body(allow_empty=True, **options) or
+                                    '')
+            if encoding == 'base64-zlib':
+                data = zlib.decompress(data)
+            values = numpy.frombuffer(data, dtype=dtype)
+        except (TypeError, ValueError, zlib.error) as e:
+            raise NineMLSerializationError(
+                "Could not decode {} body of ArrayValue: {}"
+                .format(encoding, e))
+        if len(values) != length:
+            raise NineMLSerializationError(
+                "Number of values decoded from ArrayValue ({}) does not match "
+                "its length attribute ({})".format(len(values), length))
+        return values
+
     # =========================================================================
     # Magic methods to allow the SingleValue to be treated like a
     # floating point number
@@ -497,6 +619,236 @@ class ArrayValue(BaseValue):
             return ArrayValue([v > other for v in self._values])
 
 
+class ExternalArrayValue(ArrayValue):
+    """
+    An array of values stored in an external file, which isn't loaded until
+    the values are first accessed. Binary files on the local file system are
+    memory-mapped (or sliced via h5py for compressed HDF5 datasets), and
+    external arrays that refer to the same data share a single buffer.
+
+    Parameters
+    ----------
+    url : str
+        The URL or file path of the file
+    mimetype : str
+        The mimetype of the file, which determines how it is loaded. Can be
+        'application/x-npy' (NumPy '.npy' files), 'application/octet-stream'
+        (raw binary, little-endian doubles unless a dtype parameter is given,
+        e.g. 'application/octet-stream; dtype=<i8'), 'application/x-hdf5'
+        (a dataset of a HDF5 file) or a text format (e.g. 'text/plain'),
+        which is parsed with numpy.loadtxt
+    column_name : str | None
+        The path to the dataset within the file for HDF5 files
+    """
+
+    nineml_type = "ExternalArrayValue"
+    nineml_attr = ('url', 'mimetype', 'column_name')
+
+    npy_mimetypes = ('application/x-npy', 'application/npy')
+    raw_mimetypes = ('application/octet-stream',)
+    hdf5_mimetypes = ('application/x-hdf5', 'application/x-hdf')
+    raw_dtype = '<f8'
+
+    # The data of the external arrays keyed by the path, inode, size and
+    # modification time of their file (see DocumentRegistry.file_key), their
+    # mimetype and column name, which is kept while any external array refers
+    # to it
+    cache = weakref.WeakValueDictionary()
+
+    def __init__(self, url, mimetype, column_name=None):
+        super(ArrayValue, self).__init__()
+        self._url = url
+        self._mimetype = mimetype
+        self._column_name = column_name
+        self._data = None
+
+    @property
+    def url(self):
+        return self._url
+
+    @property
+    def mimetype(self):
+        return self._mimetype
+
+    @property
+    def column_name(self):
+        return self._column_name
+
+    @property
+    def key(self):
+        return '{}#{}'.format(self._url, self._column_name)
+
+    @property
+    def _lazy_values(self):
+        return self._get_data().lazy
+
+    @property
+    def _loaded_values(self):
+        data = self._data
+        if data is None:
+            # Check whether another reference to the array has loaded it
+            data = self.cache.get(self._cache_key)
+        return data.loaded if data is not None else None
+
+    @property
+    def _cache_key(self):
+        is_local, path = self._location()
+        key = (self._url, None, None, None)
+        if is_local:
+            try:
+                # Files that are rewritten get a new key so their stale data
+                # isn't returned from the cache
+                key = nineml.Document.registry.file_key(path)
+            except OSError:
+                pass  # Missing files are reported when they are opened
+        return key + (self._mimetype, self._column_name)
+
+    @property
+    def _values(self):
+        data = self._get_data()
+        if data.loaded is None:
+            # NB: Doesn't copy memory-mapped float arrays
+            data.loaded = numpy.asarray(data.lazy[...], dtype=float)
+        return data.loaded
+
+    def _get_data(self):
+        if self._data is None:
+            try:
+                self._data = self.cache[self._cache_key]
+            except KeyError:
+                self._data = self._open()
+                self.cache[self._cache_key] = self._data
+        return self._data
+
+    def _location(self):
+        """
+        Returns whether the url refers to the local file system and its path
+        """
+        parsed = urlparse(self._url)
+        # NB: Single letter schemes are Windows drive letters
+        is_local = len(parsed.scheme) <= 1 or parsed.scheme == 'file'
+        path = parsed.path if parsed.scheme == 'file' else self._url
+        return is_local, path
+
+    def _open(self):
+        """
+        Opens the external file, returning its data with an array (or HDF5
+        dataset) that can be sliced without loading the whole file where
+        possible
+        """
+        is_local, path = self._location()
+        mimetype, params = self._parse_mimetype()
+        try:
+            if mimetype in self.npy_mimetypes:
+                if is_local:
+                    lazy = numpy.load(path, mmap_mode='r')
+                else:
+                    lazy = numpy.load(io.BytesIO(self._download()))
+            elif mimetype in self.raw_mimetypes:
+                dtype = numpy.dtype(params.get('dtype', self.raw_dtype))
+                if is_local:
+                    lazy = numpy.memmap(path, dtype=dtype, mode='r')
+                else:
+                    lazy = numpy.frombuffer(self._download(), dtype=dtype)
+            elif mimetype in self.hdf5_mimetypes:
+                return self._open_hdf5(path if is_local else
+                                       io.BytesIO(self._download()))
+            else:
+                lazy = numpy.loadtxt(path if is_local else
+                                     io.BytesIO(self._download()))
+        except (IOError, OSError, ValueError) as e:
+            raise NineMLIOError(
+                "Could not load external array from '{}' ({}): {}"
+                .format(self._url, self._mimetype, e))
+        return _ExternalArrayData(lazy)
+
+    def _open_hdf5(self, file):
+        try:
+            import h5py
+            from nineml.serialization.hdf5 import lazy_dataset
+        except ImportError:
+            raise NineMLUsageError(
+                "h5py needs to be installed to load external array from "
+                "'{}'".format(self._url))
+        if self._column_name is None:
+            raise NineMLUsageError(
+                "Path to dataset needs to be provided as the column name of "
+                "external array in HDF5 file '{}'".format(self._url))
+        h5_file = h5py.File(file, 'r')
+        try:
+            dataset = h5_file[self._column_name]
+        except KeyError:
+            h5_file.close()
+            raise NineMLUsageError(
+                "No dataset '{}' in HDF5 file '{}'".format(self._column_name,
+                                                           self._url))
+        lazy = lazy_dataset(dataset)
+        if lazy is not dataset:
+            # Memory-mapped datasets are read independently of the h5py file
+            h5_file.close()
+            h5_file = None
+        return _ExternalArrayData(lazy, h5_file=h5_file)
+
+    def _download(self):
+        with contextlib.closing(urlopen(self._url)) as f:
+            return f.read()
+
+    def _parse_mimetype(self):
+        parts = [p.strip() for p in self._mimetype.split(';')]
+        params = dict(p.split('=', 1) for p in parts[1:] if '=' in p)
+        return parts[0].lower(), params
+
+    def __repr__(self):
+        return "ExternalArrayValue(url='{}', mimetype='{}'{})".format(
+            self._url, self._mimetype,
+            (", column_name='{}'".format(self._column_name)
+             if self._column_name is not None else ''))
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        # The data is reloaded from the file (or cache) when required
+        state['_data'] = None
+        return state
+
+    def serialize_node(self, node, **options):
+        node.attr('url', self.url, **options)
+        node.attr('mimetype', self.mimetype, **options)
+        if self.column_name is not None:
+            node.attr('columnName', self.column_name, **options)
+
+    @classmethod
+    def unserialize_node(cls, node, **options):  # @UnusedVariable
+        url = node.attr('url', **options)
+        # Resolve relative paths from the location of the document
+        if (not urlparse(url).scheme and not os.path.isabs(url) and
+                node.visitor.url is not None):
+            if len(urlparse(node.visitor.url).scheme) > 1:
+                url = urljoin(node.visitor.url, url)
+            else:
+                url = os.path.normpath(os.path.join(
+                    os.path.dirname(node.visitor.url), url))
+        return cls(url, node.attr('mimetype', **options),
+                   column_name=node.attr('columnName', default=None,
+                                         **options))
+
+
+class _ExternalArrayData(object):
+    """
+    The data of an external array, shared between all external arrays that
+    refer to it via ExternalArrayValue.cache. The HDF5 file a dataset is
+    sliced from (if any) is closed when the data is released.
+    """
+
+    def __init__(self, lazy, h5_file=None):
+        self.lazy = lazy
+        self.loaded = None
+        self.h5_file = h5_file
+
+    def __del__(self):
+        if self.h5_file is not None:
+            self.h5_file.close()
+
+
 class RandomDistributionValue(BaseValue):
 
     nineml_type = "RandomDistributionValue"
@@ -519,6 +871,13 @@ class RandomDistributionValue(BaseValue):
     def is_random(self):
         return True
 
+    def to_array(self, size, rng=None):
+        """
+        Draws 'size' values from the random distribution in a single
+        vectorised call (see RandomDistributionProperties.sample)
+        """
+        return self._distribution.sample(size, rng=rng)
+
     @property
     def distribution(self):
         return self._distribution
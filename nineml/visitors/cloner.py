@@ -7,12 +7,23 @@ class Cloner(BaseChildResultsVisitor):
     """
     A Cloner visitor that visits any NineML object (except Documents) and
     creates a copy of the object
+
+    Parameters
+    ----------
+    share : tuple(type)
+        Classes of objects that are shared between the original and the
+        clone instead of being cloned (along with all of their children),
+        e.g. to copy a network without copying its component classes and
+        units. Only classes whose instances are not modified in place should
+        be shared
     """
 
     def __init__(self, as_class=None, exclude_annotations=False,
                  clone_definitions=None, document=None,
-                 random_seeds=False, validate=True, **kwargs):  # @UnusedVariable @IgnorePep8
+                 random_seeds=False, validate=True, share=(),
+                 **kwargs):  # @UnusedVariable @IgnorePep8
         super(Cloner, self).__init__()
+        self.share = tuple(share)
         self.as_class = as_class if as_class is not None else type(None)
         self.validate = validate
         self.memo = {}
@@ -45,6 +56,8 @@ class Cloner(BaseChildResultsVisitor):
         be referenced by their memory position as the memory is freed after
         they go out of scope, are not saved in # the memo.
         """
+        if self.share and isinstance(obj, self.share):
+            return obj
         if obj.temporary:
             assert nineml_cls is not None or isinstance(obj, self.as_class)
             id_ = None
@@ -52,7 +65,7 @@ class Cloner(BaseChildResultsVisitor):
             id_ = id(obj)
         try:
             # See if the attribute has already been cloned in memo
-            clone = self.memo[id_]
+            _, clone = self.memo[id_]
         except KeyError:
             clone = super(Cloner, self).visit(obj, nineml_cls=nineml_cls,
                                               **kwargs)
@@ -60,7 +73,11 @@ class Cloner(BaseChildResultsVisitor):
             if (hasattr(obj, 'annotations') and not self.exclude_annotations):
                 clone._annotations = self.visit(obj.annotations, **kwargs)
             if not obj.temporary:
-                self.memo[id_] = clone
+                # The original object is stored along with its clone so that
+                # objects created on the fly during the clone (e.g. lazily
+                # created properties) can't reuse the id of an object that
+                # has been garbage collected
+                self.memo[id_] = (obj, clone)
         return clone
 
     def default_action(self, obj, nineml_cls, child_results,
@@ -106,6 +123,9 @@ class Cloner(BaseChildResultsVisitor):
             random_seed=random_seed,
             source_size=connectivity.source_size,
             destination_size=connectivity.destination_size,
+            rng_cls=connectivity._rng_cls,
+            keyed_rows=connectivity.keyed_rows,
+            sampler=connectivity.sampler,
             **kwargs)
         return clone
 
@@ -45,7 +45,8 @@ setup(
                       'future>=0.16.0',
                       'h5py>=2.7.0',
                       'PyYAML>=3.1',
-                      'sympy>=1.1'],
+                      'sympy>=1.1',
+                      'numpy>=1.10'],
     python_requires='>=2.7, !=3.0.*, !=3.1.*, !=3.2.*, <4',
     tests_require=['nose', 'numpy']
 )
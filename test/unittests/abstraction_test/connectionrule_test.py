@@ -2,13 +2,17 @@ from __future__ import division
 from itertools import groupby
 import unittest
 import random
+import numpy
 import nineml.units as un
 from nineml.utils.comprehensive_example import conA
 from nineml.abstraction.connectionrule import (
     all_to_all_connection_rule, one_to_one_connection_rule,
     explicit_connection_rule, probabilistic_connection_rule,
     random_fan_in_connection_rule, random_fan_out_connection_rule)
-from nineml.user.connectionrule import (ConnectionRuleProperties, Connectivity)
+from nineml.user.connectionrule import (
+    ConnectionRuleProperties, Connectivity, InverseConnectivity,
+    SampledConnectionsMemo)
+from nineml.exceptions import NineMLUsageError
 
 # Fix seed to remove stochasticity from probabilistic connectivity
 random.seed(12345)
@@ -83,3 +87,443 @@ class Connectivity_test(unittest.TestCase):
         num_conns = len(list(connectivity.connections()))
         self.assertAlmostEqual(num_conns / size ** 2, p, 2)
 
+
+class ConnectivityArray_test(unittest.TestCase):
+
+    def _check_matches_connections(self, connectivity):
+        sources, destinations = connectivity.connections_array()
+        if connectivity._is_array_sampled():
+            connections = connectivity.connections()
+        else:
+            # Compare against the pure-Python generators
+            connections = connectivity._generator_connections()
+        self.assertEqual(list(zip(sources.tolist(), destinations.tolist())),
+                         [(int(s), int(d)) for s, d in connections])
+
+    def test_deterministic(self):
+        for connectivity in (
+            Connectivity(ConnectionRuleProperties(
+                'all_to_all', all_to_all_connection_rule), 3, 5),
+            Connectivity(ConnectionRuleProperties(
+                'one_to_one', one_to_one_connection_rule), 4, 4),
+            Connectivity(ConnectionRuleProperties(
+                'explicit', explicit_connection_rule,
+                {'sourceIndices': [0, 0, 1, 3, 5],
+                 'destinationIndices': [2, 4, 2, 4, 5]}), 6, 6)):
+            self._check_matches_connections(connectivity)
+
+    def test_random(self):
+        for props in (
+            ConnectionRuleProperties(
+                'probabilistic', probabilistic_connection_rule,
+                {'probability': 0.2}),
+            ConnectionRuleProperties(
+                'random_fan_in', random_fan_in_connection_rule,
+                {'number': 7}),
+            ConnectionRuleProperties(
+                'random_fan_out', random_fan_out_connection_rule,
+                {'number': 7})):
+            for seed in (0, 12345, 2 ** 40 + 3):
+                connectivity = Connectivity(props, 50, 40, random_seed=seed)
+                # Force the random draws to be split over multiple blocks
+                connectivity.array_block_size = 60
+                self._check_matches_connections(connectivity)
+
+    def test_custom_rng_cls(self):
+
+        class CustomRandom(random.Random):
+            pass
+
+        connectivity = Connectivity(
+            ConnectionRuleProperties(
+                'probabilistic', probabilistic_connection_rule,
+                {'probability': 0.2}), 20, 30, random_seed=1,
+            rng_cls=CustomRandom)
+        self._check_matches_connections(connectivity)
+
+    def test_iter_chunks(self):
+        for props in (
+            ConnectionRuleProperties('all_to_all', all_to_all_connection_rule),
+            ConnectionRuleProperties(
+                'probabilistic', probabilistic_connection_rule,
+                {'probability': 0.2}),
+            ConnectionRuleProperties(
+                'random_fan_in', random_fan_in_connection_rule,
+                {'number': 7})):
+            connectivity = Connectivity(props, 50, 40, random_seed=54321)
+            connectivity.array_block_size = 100
+            sources, destinations = connectivity.connections_array()
+            chunks = list(connectivity.iter_chunks(max_pairs=33))
+            self.assertTrue(all(len(s) == len(d) == 33
+                                for s, d in chunks[:-1]))
+            self.assertTrue(0 < len(chunks[-1][0]) <= 33)
+            self.assertEqual(
+                numpy.concatenate([s for s, _ in chunks]).tolist(),
+                sources.tolist())
+            self.assertEqual(
+                numpy.concatenate([d for _, d in chunks]).tolist(),
+                destinations.tolist())
+
+    def test_keyed_rows(self):
+        for props in (
+            ConnectionRuleProperties(
+                'probabilistic', probabilistic_connection_rule,
+                {'probability': 0.2}),
+            ConnectionRuleProperties(
+                'random_fan_in', random_fan_in_connection_rule,
+                {'number': 7}),
+            ConnectionRuleProperties(
+                'random_fan_out', random_fan_out_connection_rule,
+                {'number': 7})):
+            connectivity = Connectivity(props, 50, 40, random_seed=999,
+                                        keyed_rows=True)
+            connectivity.array_block_size = 60
+            self._check_matches_connections(connectivity)
+            sources, destinations = connectivity.connections_array()
+            for workers in (2, 3):
+                par_sources, par_destinations = (
+                    connectivity.connections_array(workers=workers))
+                self.assertEqual(par_sources.tolist(), sources.tolist())
+                self.assertEqual(par_destinations.tolist(),
+                                 destinations.tolist())
+            if props.lib_type == 'RandomFanIn':
+                self.assertTrue(
+                    (numpy.bincount(destinations, minlength=40) == 7).all())
+
+    def test_parallel_empty(self):
+        props = ConnectionRuleProperties(
+            'probabilistic', probabilistic_connection_rule,
+            {'probability': 0.2})
+        for source_size, destination_size in ((0, 40), (50, 0)):
+            connectivity = Connectivity(props, source_size, destination_size,
+                                        random_seed=999, keyed_rows=True)
+            sources, destinations = connectivity.connections_array(workers=2)
+            self.assertEqual(len(sources), 0)
+            self.assertEqual(len(destinations), 0)
+
+    def test_requires_numpy_generators(self):
+        props = ConnectionRuleProperties(
+            'probabilistic', probabilistic_connection_rule,
+            {'probability': 0.2})
+        # Simulate a version of NumPy older than 1.17
+        default_rng = numpy.random.default_rng
+        del numpy.random.default_rng
+        try:
+            # The default sampler doesn't need the Generator API
+            connectivity = Connectivity(props, 10, 10, random_seed=1)
+            sources, destinations = connectivity.connections_array()
+            self.assertEqual(list(zip(sources.tolist(),
+                                      destinations.tolist())),
+                             list(connectivity.connections()))
+            self.assertRaises(NineMLUsageError, Connectivity, props, 10, 10,
+                              keyed_rows=True)
+            self.assertRaises(NineMLUsageError, Connectivity, props, 10, 10,
+                              sampler='geometric')
+        finally:
+            numpy.random.default_rng = default_rng
+
+    def test_parallel_requires_keyed_rows(self):
+        connectivity = Connectivity(
+            ConnectionRuleProperties(
+                'probabilistic', probabilistic_connection_rule,
+                {'probability': 0.2}), 10, 10)
+        self.assertRaises(NineMLUsageError, connectivity.connections_array,
+                          workers=2)
+
+    def test_geometric_sampler(self):
+        p = 0.01
+        size = 1000
+        props = ConnectionRuleProperties(
+            'probabilistic', probabilistic_connection_rule,
+            {'probability': p})
+        for keyed_rows in (False, True):
+            connectivity = Connectivity(props, size, size, random_seed=4321,
+                                        keyed_rows=keyed_rows,
+                                        sampler='geometric')
+            connectivity.array_block_size = 5000
+            sources, destinations = connectivity.connections_array()
+            self.assertAlmostEqual(len(sources) / size ** 2, p, 3)
+            # Connections should be unique and in source-row order
+            flat = sources * size + destinations
+            self.assertTrue((numpy.diff(flat) > 0).all())
+            self.assertTrue((destinations < size).all())
+            self._check_matches_connections(connectivity)
+        par_sources, par_destinations = connectivity.connections_array(
+            workers=2)
+        self.assertEqual(par_sources.tolist(), sources.tolist())
+        self.assertEqual(par_destinations.tolist(), destinations.tolist())
+        self.assertRaises(NineMLUsageError, Connectivity, props, size, size,
+                          sampler='unrecognised')
+
+    def test_compressed(self):
+        for props in (
+            ConnectionRuleProperties('all_to_all', all_to_all_connection_rule),
+            ConnectionRuleProperties(
+                'explicit', explicit_connection_rule,
+                {'sourceIndices': [5, 0, 1, 0, 3],
+                 'destinationIndices': [5, 4, 2, 2, 4]}),
+            ConnectionRuleProperties(
+                'probabilistic', probabilistic_connection_rule,
+                {'probability': 0.2}),
+            ConnectionRuleProperties(
+                'random_fan_in', random_fan_in_connection_rule,
+                {'number': 3})):
+            connectivity = Connectivity(props, 6, 7, random_seed=2468)
+            connections = sorted(connectivity.connections())
+            csr = connectivity.to_csr()
+            self.assertEqual(csr.num_rows, 6)
+            self.assertEqual(
+                list(zip(csr.row_indices().tolist(), csr.indices.tolist())),
+                connections)
+            csc = connectivity.to_csc()
+            self.assertEqual(csc.num_rows, 7)
+            self.assertEqual(
+                list(zip(csc.indices.tolist(), csc.row_indices().tolist())),
+                sorted(connections, key=lambda c: (c[1], c[0])))
+            for src in range(6):
+                self.assertEqual(csr.neighbours(src).tolist(),
+                                 [d for s, d in connections if s == src])
+            for dest in range(7):
+                self.assertEqual(csc.neighbours(dest).tolist(),
+                                 [s for s, d in connections if d == dest])
+            self.assertEqual(connectivity.out_degrees().tolist(),
+                             csr.degrees.tolist())
+            self.assertEqual(connectivity.in_degrees().tolist(),
+                             csc.degrees.tolist())
+
+    def test_memo(self):
+        self.assertTrue(Connectivity.memo is None)  # Memo is opt-in
+        Connectivity.memo = memo = SampledConnectionsMemo()
+        try:
+            self._test_memo(memo)
+        finally:
+            Connectivity.memo = None
+
+    def _test_memo(self, memo):
+        connectivity = Connectivity(
+            ConnectionRuleProperties(
+                'probabilistic', probabilistic_connection_rule,
+                {'probability': 0.2}), 30, 40, random_seed=77)
+        sources, destinations = connectivity.connections_array()
+        csr = connectivity.to_csr()
+
+        def resample():
+            raise Exception("Connections were resampled")
+
+        connectivity._generate_blocks = resample
+        # The stored arrays are returned read-only without copying them
+        memoised = connectivity.connections_array()
+        self.assertTrue(memoised[0] is sources)
+        self.assertTrue(memoised[1] is destinations)
+        self.assertFalse(sources.flags.writeable)
+        self.assertEqual(list(connectivity.connections()),
+                         list(zip(sources.tolist(), destinations.tolist())))
+        self.assertTrue(connectivity.to_csr() is csr)
+        self.assertFalse(csr.indices.flags.writeable)
+        # Changing the size of the connectivity should invalidate the memo
+        connectivity._source_size = 31
+        self.assertRaises(Exception, connectivity.connections_array)
+        connectivity._source_size = 30
+        del connectivity._generate_blocks
+        nbytes = memo.nbytes
+        connectivity.connections_array()
+        self.assertGreater(memo.nbytes, nbytes)
+        # Entries are dropped when the connectivity is garbage collected
+        del connectivity
+        self.assertEqual(memo.nbytes, nbytes - csr.indices.nbytes -
+                         csr.indptr.nbytes)
+
+    def test_memo_streaming(self):
+        Connectivity.memo = memo = SampledConnectionsMemo()
+        connectivity = Connectivity(
+            ConnectionRuleProperties(
+                'probabilistic', probabilistic_connection_rule,
+                {'probability': 0.2}), 30, 40, random_seed=77)
+        try:
+            # Connections that haven't been memoised are streamed from the
+            # generator instead of sampling the full arrays
+            connectivity._generate_blocks = None
+            connections = list(connectivity.connections())
+            self.assertEqual(len(memo), 0)
+            del connectivity._generate_blocks
+            sources, destinations = connectivity.connections_array()
+            self.assertEqual(
+                connections,
+                list(zip(sources.tolist(), destinations.tolist())))
+            # Once they are memoised they are read from the stored arrays
+            connectivity._generator_connections = None
+            self.assertEqual(list(connectivity.connections()), connections)
+        finally:
+            Connectivity.memo = None
+
+    def test_memo_eviction(self):
+        Connectivity.memo = memo = SampledConnectionsMemo(
+            max_bytes=2 * 10 * 10 * 8 + 1)
+        props = ConnectionRuleProperties('all_to_all',
+                                         all_to_all_connection_rule)
+        first = Connectivity(props, 10, 10)
+        second = Connectivity(props, 10, 10)
+        try:
+            first.connections_array()
+            self.assertEqual(len(memo), 1)
+            second.connections_array()
+            self.assertEqual(len(memo), 1)
+            self.assertTrue(memo.get(first, 'pairs') is None)
+            self.assertTrue(memo.get(second, 'pairs') is not None)
+            # Arrays larger than the maximum size aren't stored (or made
+            # read-only)
+            sources, _ = Connectivity(props, 20, 20).connections_array()
+            self.assertTrue(sources.flags.writeable)
+            self.assertTrue(memo.get(second, 'pairs') is not None)
+        finally:
+            Connectivity.memo = None
+
+
+class InverseConnectivity_test(unittest.TestCase):
+
+    def test_inverse(self):
+        connectivity = Connectivity(
+            ConnectionRuleProperties(
+                'random_fan_out', random_fan_out_connection_rule,
+                {'number': 4}), 12, 9, random_seed=3579)
+        inverse = InverseConnectivity(connectivity)
+        self.assertEqual(inverse.source_size, 9)
+        self.assertEqual(inverse.destination_size, 12)
+        self.assertEqual(inverse.lib_type, 'RandomFanOut')
+        self.assertTrue(inverse.has_been_sampled())
+        connections = sorted(connectivity.connections())
+        inverted = sorted((d, s) for s, d in connections)
+        self.assertEqual(list(inverse.connections()), inverted)
+        self.assertEqual(
+            [(int(s), int(d)) for ss, dd in inverse.iter_chunks(max_pairs=5)
+             for s, d in zip(ss, dd)], inverted)
+        for dest in range(9):
+            self.assertEqual(inverse.destinations_of(dest).tolist(),
+                             [s for s, d in connections if d == dest])
+            self.assertEqual(connectivity.sources_of(dest).tolist(),
+                             [s for s, d in connections if d == dest])
+            # The synapse indices refer to the position of the connection in
+            # the forward (sorted) connections
+            self.assertEqual(
+                [connections[i] for i in inverse.synapses_of(dest)],
+                [(s, d) for s, d in connections if d == dest])
+        for src in range(12):
+            self.assertEqual(connectivity.destinations_of(src).tolist(),
+                             [d for s, d in connections if s == src])
+
+
+class ConnectivityStatistics_test(unittest.TestCase):
+
+    def test_analytic(self):
+        for props, size, num_conns in (
+            (ConnectionRuleProperties('all_to_all',
+                                      all_to_all_connection_rule),
+             (20, 30), 600),
+            (ConnectionRuleProperties('one_to_one',
+                                      one_to_one_connection_rule),
+             (25, 25), 25),
+            (ConnectionRuleProperties(
+                'probabilistic', probabilistic_connection_rule,
+                {'probability': 0.3}), (200, 300), 200 * 300 * 0.3),
+            (ConnectionRuleProperties(
+                'random_fan_in', random_fan_in_connection_rule,
+                {'number': 10}), (200, 300), 3000),
+            (ConnectionRuleProperties(
+                'random_fan_out', random_fan_out_connection_rule,
+                {'number': 10}), (200, 300), 2000)):
+            connectivity = Connectivity(props, *size, random_seed=1357)
+            stats = connectivity.statistics()
+            self.assertTrue(stats['analytic'])
+            self.assertAlmostEqual(stats['num_connections'], num_conns)
+            self.assertEqual(stats['memory_bytes'], int(num_conns * 16))
+            sampled = connectivity.statistics(analytic=False)
+            self.assertFalse(sampled['analytic'])
+            # The sampled statistics should be close to the expected ones
+            for name in ('num_connections', 'mean_out_degree',
+                         'mean_in_degree', 'out_degree_variance',
+                         'in_degree_variance'):
+                self.assertLessEqual(abs(sampled[name] - stats[name]),
+                                     0.2 * stats[name])
+
+    def test_streaming(self):
+        connectivity = Connectivity(
+            ConnectionRuleProperties(
+                'explicit', explicit_connection_rule,
+                {'sourceIndices': [0, 0, 1, 3],
+                 'destinationIndices': [2, 4, 2, 4]}), 4, 5)
+        stats = connectivity.statistics()
+        self.assertFalse(stats['analytic'])
+        self.assertEqual(stats['num_connections'], 4)
+        self.assertEqual(stats['mean_out_degree'], 1.0)
+        self.assertEqual(stats['out_degree_variance'], 0.5)
+        self.assertEqual(stats['mean_in_degree'], 0.8)
+        self.assertAlmostEqual(stats['in_degree_variance'], 0.96)
+        inverse = InverseConnectivity(connectivity).statistics()
+        self.assertEqual(inverse['mean_out_degree'], 0.8)
+        self.assertEqual(inverse['mean_in_degree'], 1.0)
+
+
+class ConnectivityRange_test(unittest.TestCase):
+
+    def test_ranges(self):
+        rules = [
+            (ConnectionRuleProperties('all_to_all',
+                                      all_to_all_connection_rule), {}),
+            (ConnectionRuleProperties('one_to_one',
+                                      one_to_one_connection_rule), {}),
+            (ConnectionRuleProperties(
+                'explicit', explicit_connection_rule,
+                {'sourceIndices': [5, 0, 1, 0, 3, 20],
+                 'destinationIndices': [5, 4, 2, 2, 4, 9]}), {})]
+        for name, rule, param in (
+                ('probabilistic', probabilistic_connection_rule,
+                 {'probability': 0.2}),
+                ('random_fan_in', random_fan_in_connection_rule,
+                 {'number': 4}),
+                ('random_fan_out', random_fan_out_connection_rule,
+                 {'number': 4})):
+            props = ConnectionRuleProperties(name, rule, param)
+            rules.extend(((props, {}), (props, {'keyed_rows': True})))
+        rules.append((rules[-1][0], {'rng_cls': type('CustomRandom',
+                                                     (random.Random,), {})}))
+        rules.append((ConnectionRuleProperties(
+            'probabilistic', probabilistic_connection_rule,
+            {'probability': 0.2}), {'sampler': 'geometric'}))
+        for props, kwargs in rules:
+            for src_range, dest_range in (((3, 11), None), (None, (2, 7)),
+                                          ((0, 25), (8, 25)), ((4, 4), None),
+                                          ((10, 20), (0, 5))):
+                def connectivity():
+                    conn = Connectivity(props, 25, 25, random_seed=8642,
+                                        **kwargs)
+                    conn.array_block_size = 40
+                    return conn
+                ranged = list(connectivity().connections(
+                    source_range=src_range, destination_range=dest_range))
+                src_lo, src_hi = src_range if src_range else (0, 25)
+                dest_lo, dest_hi = dest_range if dest_range else (0, 25)
+                full = [
+                    (s, d) for s, d in zip(*connectivity().connections_array())
+                    if src_lo <= s < src_hi and dest_lo <= d < dest_hi]
+                self.assertEqual([(int(s), int(d)) for s, d in ranged],
+                                 [(int(s), int(d)) for s, d in full],
+                                 "Mismatch for {} {} {} {}".format(
+                                     props.lib_type, kwargs, src_range,
+                                     dest_range))
+        conn = Connectivity(rules[0][0], 25, 25)
+        self.assertRaises(NineMLUsageError, conn.connections_array,
+                          source_range=(5, 26))
+        self.assertRaises(NineMLUsageError, conn.connections_array,
+                          destination_range=(6, 5))
+
+    def test_inverse_ranges(self):
+        connectivity = Connectivity(
+            ConnectionRuleProperties(
+                'probabilistic', probabilistic_connection_rule,
+                {'probability': 0.3}), 15, 20, random_seed=24)
+        inverse = InverseConnectivity(connectivity)
+        self.assertEqual(
+            list(inverse.connections(source_range=(3, 9),
+                                     destination_range=(2, 10))),
+            [(s, d) for s, d in inverse.connections()
+             if 3 <= s < 9 and 2 <= d < 10])
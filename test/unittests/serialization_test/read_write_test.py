@@ -1,10 +1,31 @@
 from __future__ import unicode_literals
 import unittest
 import tempfile
+import shutil
 import os
+import gc
+import pickle
+import threading
+import numpy
+from future.moves.urllib.request import urlopen
 from nineml import read, write
-from nineml import DynamicsProperties
-from nineml.utils.comprehensive_example import dynA, dynB
+from nineml.serialization import serialize, unserialize, format_to_serializer
+from nineml.values import ArrayValue, ExternalArrayValue
+from nineml.user import Initial
+from nineml.units import Quantity
+import nineml.units as un
+from nineml import DynamicsProperties, Document
+from nineml.document import DocumentRegistry
+from nineml.serialization.xml import XMLSerializer, XMLStreamUnserializer
+from nineml.exceptions import (
+    NineMLSerializationError, NineMLUsageError, NineMLIOError,
+    NineMLSerializationNotSupportedError)
+from nineml.utils.comprehensive_example import dynA, dynB, dynC, doc1
+try:
+    import h5py
+    from nineml.serialization.hdf5 import HDF5Unserializer
+except ImportError:
+    h5py = None
 
 
 class TestReadWrite(unittest.TestCase):
@@ -23,3 +44,388 @@ class TestReadWrite(unittest.TestCase):
             definition='{}#dynB'.format(os.path.join(tmp_dir, self.tmp_path)),
             properties={'P1': 1, 'P2': 2, 'P3': 3})
         self.assertEqual(dynB, dynBProps.component_class)
+
+
+class TestXMLStreamUnserializer(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp_dir, 'stream.xml')
+        write(self.path, doc1, register=False)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_lazy_read(self):
+        eager = read(self.path, register=False)
+        doc = read(self.path, lazy=True, register=False)
+        # Elements are indexed but not loaded
+        self.assertEqual(sorted(doc.keys()), sorted(eager.keys()))
+        self.assertEqual(len(dict.keys(doc)), 0)
+        # Loading an element only loads it and the elements it references
+        self.assertEqual(doc['dynA'], eager['dynA'])
+        self.assertTrue(dict.__contains__(doc, 'dynA'))
+        self.assertFalse(dict.__contains__(doc, 'dynB'))
+        self.assertEqual(doc['dynPropA'], eager['dynPropA'])
+        self.assertLess(len(dict.keys(doc)), len(list(eager.keys())))
+        # Elements are read from their offsets so can be loaded in any order
+        for name in reversed(sorted(eager.keys())):
+            self.assertEqual(doc[name], eager[name])
+        self.assertEqual(doc, eager)
+
+    def test_unserialize(self):
+        with open(self.path) as f:
+            unserializer = XMLStreamUnserializer(f, url=self.path)
+        self.assertTrue(unserializer.line_number('dynA') > 1)
+        self.assertEqual(unserializer.unserialize(),
+                         read(self.path, register=False))
+        # Strings can't be streamed
+        with open(self.path) as f:
+            xml_str = f.read()
+        self.assertRaises(NineMLSerializationNotSupportedError,
+                          XMLStreamUnserializer, xml_str, url=self.path)
+
+    def test_unsupported(self):
+        json_path = os.path.join(self.tmp_dir, 'doc.json')
+        write(json_path, doc1, register=False)
+        self.assertRaises(NineMLSerializationError, read, json_path,
+                          lazy=True)
+
+
+class TestArrayValueEncoding(unittest.TestCase):
+
+    formats = [f for f in ('xml', 'json', 'yaml', 'dict')
+               if format_to_serializer[f] is not None]
+
+    def setUp(self):
+        self.array = ArrayValue(numpy.random.RandomState(1).rand(100))
+
+    def test_round_trip(self):
+        for fmt in self.formats:
+            for encoding in ('rows',) + ArrayValue.binary_encodings:
+                elem = serialize(self.array, format=fmt, version=2,
+                                 array_encoding=encoding)
+                reread = unserialize(elem, ArrayValue, format=fmt, version=2)
+                self.assertTrue(
+                    numpy.array_equal(reread.values, self.array.values),
+                    "{} encoding failed round trip in {}".format(encoding,
+                                                                 fmt))
+
+    def test_version_gated(self):
+        rows = serialize(self.array, version=1, to_str=True)
+        self.assertEqual(
+            serialize(self.array, version=1, array_encoding='base64-zlib',
+                      to_str=True), rows)
+        encoded = serialize(self.array, version=2, array_encoding='base64',
+                            to_str=True)
+        self.assertNotIn('ArrayValueRow', encoded)
+        self.assertLess(len(encoded), len(rows))
+
+    def test_document(self):
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            rows_path = os.path.join(tmp_dir, 'rows.xml')
+            encoded_path = os.path.join(tmp_dir, 'encoded.xml')
+            write(rows_path, doc1, version=2, register=False)
+            write(encoded_path, doc1, version=2, array_encoding='base64-zlib',
+                  register=False)
+            self.assertEqual(read(encoded_path, register=False),
+                             read(rows_path, register=False))
+        finally:
+            shutil.rmtree(tmp_dir)
+
+    def test_write_options(self):
+        tmp_dir = tempfile.mkdtemp()
+        serialize_method = XMLSerializer.serialize
+        passed_options = []
+
+        def recording_serialize(serializer, **options):
+            passed_options.append(options)
+            return serialize_method(serializer, **options)
+
+        XMLSerializer.serialize = recording_serialize
+        try:
+            write(os.path.join(tmp_dir, 'doc.xml'), doc1, version=2,
+                  array_encoding='base64', register=False)
+        finally:
+            XMLSerializer.serialize = serialize_method
+            shutil.rmtree(tmp_dir)
+        # Only the serialization options are passed to serialize
+        self.assertEqual(passed_options, [{'array_encoding': 'base64'}])
+
+    def test_errors(self):
+        self.assertRaises(NineMLSerializationError, serialize, self.array,
+                          version=2, array_encoding='hex')
+        elem = serialize(self.array, version=2, array_encoding='base64')
+        elem.attrib['length'] = '99'
+        self.assertRaises(NineMLSerializationError, unserialize, elem,
+                          ArrayValue, format='xml', version=2)
+        elem.attrib['length'] = '100'
+        elem.attrib['encoding'] = 'base64-zlib'
+        self.assertRaises(NineMLSerializationError, unserialize, elem,
+                          ArrayValue, format='xml', version=2)
+
+
+@unittest.skipIf(format_to_serializer['hdf5'] is None,
+                 "h5py is not installed")
+class TestHDF5Arrays(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.values = numpy.random.RandomState(1).rand(1000)
+        self.dynamics = dynC.clone()
+        self._create_props()
+
+    def _create_props(self):
+        self.props = DynamicsProperties(
+            name='dynPropLarge', definition=self.dynamics,
+            properties={'P1': 23.3 * un.unitless,
+                        'P2': Quantity(ArrayValue(self.values), un.unitless)},
+            initial_values=[Initial('SV1', 3.3 * un.unitless),
+                            Initial('SV2', 21.7 * un.unitless),
+                            Initial('SV3', Quantity(numpy.arange(1000),
+                                                    un.unitless))])
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def _read_arrays(self, path):
+        props = read(path, register=False)['dynPropLarge']
+        return (props.property('P2').value,
+                props.initial_value('SV3').value)
+
+    def test_chunked(self):
+        path = os.path.join(self.tmp_dir, 'chunked.h5')
+        write(path, self.dynamics, self.props, register=False,
+              array_chunk_size=100)
+        with h5py.File(path, 'r') as f:
+            datasets = []
+            f.visititems(lambda n, o: datasets.append(o.chunks)
+                         if isinstance(o, h5py.Dataset) else None)
+            self.assertEqual(datasets, [(100,), (100,)])
+        values, indices = self._read_arrays(path)
+        self.assertFalse(values.is_loaded)
+        self.assertEqual(len(values), 1000)
+        self.assertEqual(values[10], self.values[10])
+        self.assertTrue(numpy.array_equal(values[10:20], self.values[10:20]))
+        self.assertFalse(values.is_loaded)
+        self.assertTrue(numpy.array_equal(values.values, self.values))
+        self.assertTrue(values.is_loaded)
+        self.assertEqual(indices[999], 999.0)
+        # Integer indices are read back as such
+        self.assertEqual(indices.values.dtype, numpy.int64)
+        self.assertTrue(numpy.array_equal(indices.values, numpy.arange(1000)))
+
+    def test_memory_mapped(self):
+        path = os.path.join(self.tmp_dir, 'contiguous.h5')
+        write(path, self.dynamics, self.props, register=False,
+              array_compression=None)
+        values, _ = self._read_arrays(path)
+        self.assertIsInstance(values._lazy_values, numpy.memmap)
+        self.assertTrue(numpy.array_equal(values[-5:], self.values[-5:]))
+        self.assertTrue(numpy.array_equal(values.values, self.values))
+        self.assertTrue(numpy.array_equal(
+            pickle.loads(pickle.dumps(values)).values, self.values))
+
+    def test_read_only(self):
+        path = os.path.join(self.tmp_dir, 'read_only.h5')
+        write(path, self.dynamics, self.props, register=False)
+        doc = read(path, register=False)
+        # The file is opened read-only and kept open with the document
+        self.assertEqual(doc._unserializer._file.mode, 'r')
+        values = doc['dynPropLarge'].property('P2').value
+        self.assertTrue(numpy.array_equal(values.values, self.values))
+        # URLs are cached to a temporary file before being opened
+        unserializer = HDF5Unserializer(urlopen('file://' + path))
+        self.assertEqual(unserializer._file.mode, 'r')
+        self.assertTrue(numpy.array_equal(
+            unserializer.unserialize()['dynPropLarge'].property(
+                'P2').value.values, self.values))
+        os.remove(unserializer._file.filename)
+
+    def test_dtypes(self):
+        path = os.path.join(self.tmp_dir, 'dtypes.h5')
+        self.values = numpy.arange(1000, dtype=float)
+        self._create_props()
+        write(path, self.dynamics, self.props, register=False)
+        # Float arrays with integral values are read back as floats
+        values, _ = self._read_arrays(path)
+        self.assertEqual(values.values.dtype, numpy.float64)
+        self.assertTrue(numpy.array_equal(values.values, numpy.arange(1000)))
+
+    def test_rows(self):
+        path = os.path.join(self.tmp_dir, 'rows.h5')
+        write(path, self.dynamics, self.props, register=False,
+              array_encoding='rows')
+        values, _ = self._read_arrays(path)
+        self.assertTrue(values.is_loaded)
+        self.assertTrue(numpy.array_equal(values.values, self.values))
+
+
+class TestExternalArrayValue(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.values = numpy.random.RandomState(1).rand(50)
+        self.npy_path = os.path.join(self.tmp_dir, 'values.npy')
+        numpy.save(self.npy_path, self.values)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_lazy_load(self):
+        external = ExternalArrayValue(self.npy_path, 'application/x-npy')
+        self.assertFalse(external.is_loaded)
+        self.assertEqual(len(external), 50)
+        self.assertEqual(external[3], self.values[3])
+        self.assertFalse(external.is_loaded)
+        self.assertIsInstance(external._lazy_values, numpy.memmap)
+        self.assertTrue(numpy.array_equal(external.values, self.values))
+        self.assertTrue(external.is_loaded)
+        # Arrays referring to the same file share the same buffer
+        other = ExternalArrayValue(self.npy_path, 'application/x-npy')
+        self.assertTrue(other.is_loaded)
+        self.assertTrue(other.values is external.values)
+        self.assertTrue(external.clone().values is external.values)
+        self.assertEqual(
+            pickle.loads(pickle.dumps(external)).key, external.key)
+
+    def test_rewrite(self):
+        external = ExternalArrayValue(self.npy_path, 'application/x-npy')
+        self.assertTrue(numpy.array_equal(external.values, self.values))
+        # Rewriting the file invalidates the cached data
+        new_values = numpy.random.RandomState(2).rand(60)
+        numpy.save(self.npy_path, new_values)
+        rewritten = ExternalArrayValue(self.npy_path, 'application/x-npy')
+        self.assertFalse(rewritten.is_loaded)
+        self.assertTrue(numpy.array_equal(rewritten.values, new_values))
+
+    def test_mimetypes(self):
+        raw_path = os.path.join(self.tmp_dir, 'values.bin')
+        (self.values * 100).astype('<i4').tofile(raw_path)
+        raw = ExternalArrayValue(raw_path,
+                                 'application/octet-stream; dtype=<i4')
+        self.assertTrue(numpy.array_equal(
+            raw.values, (self.values * 100).astype(int)))
+        txt_path = os.path.join(self.tmp_dir, 'values.txt')
+        numpy.savetxt(txt_path, self.values)
+        self.assertTrue(numpy.allclose(
+            ExternalArrayValue(txt_path, 'text/plain').values, self.values))
+        if h5py is not None:
+            h5_path = os.path.join(self.tmp_dir, 'values.h5')
+            with h5py.File(h5_path, 'w') as f:
+                f.create_dataset('group/values', data=self.values,
+                                 chunks=(10,), compression='gzip')
+            h5 = ExternalArrayValue(h5_path, 'application/x-hdf5',
+                                    column_name='group/values')
+            self.assertTrue(numpy.array_equal(h5[10:20],
+                                              self.values[10:20]))
+            self.assertFalse(h5.is_loaded)
+            self.assertTrue(numpy.array_equal(h5.values, self.values))
+            # The file is closed once no external array refers to it
+            h5_file = h5._data.h5_file
+            self.assertTrue(h5_file)
+            del h5
+            gc.collect()
+            self.assertFalse(h5_file)
+            self.assertRaises(NineMLUsageError, len, ExternalArrayValue(
+                h5_path, 'application/x-hdf5'))
+        self.assertRaises(NineMLIOError, len, ExternalArrayValue(
+            os.path.join(self.tmp_dir, 'missing.npy'), 'application/x-npy'))
+
+    def test_relative_url(self):
+        dynamics = dynC.clone()
+        props = DynamicsProperties(
+            name='dynPropExternal', definition=dynamics,
+            properties={'P1': 23.3 * un.unitless,
+                        'P2': Quantity(ExternalArrayValue(
+                            'values.npy', 'application/x-npy'),
+                            un.unitless)},
+            initial_values=[Initial('SV1', 3.3 * un.unitless),
+                            Initial('SV2', 21.7 * un.unitless),
+                            Initial('SV3', 1.0 * un.unitless)])
+        for ext in ('xml', 'json'):
+            path = os.path.join(self.tmp_dir, 'doc.' + ext)
+            write(path, dynamics, props, register=False)
+            external = read(path, register=False)[
+                'dynPropExternal'].property('P2').value
+            self.assertEqual(external.url, self.npy_path)
+            self.assertTrue(numpy.array_equal(external.values, self.values))
+
+
+class TestDocumentRegistry(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp_dir, 'doc.xml')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_invalidation(self):
+        registry = Document.registry
+        write(self.path, dynA, register=False)
+        doc = read(self.path)
+        registry.reset_counters()
+        self.assertTrue(read(self.path) is doc)
+        self.assertEqual((registry.hits, registry.misses), (1, 0))
+        # Rewrite the file straight away (i.e. within the resolution of
+        # the modification time in seconds)
+        write(self.path, dynA, dynB, register=False)
+        reread = read(self.path)
+        self.assertFalse(reread is doc)
+        self.assertIn('dynB', reread)
+        self.assertEqual((registry.hits, registry.misses), (1, 1))
+        self.assertFalse(read(self.path, reload=True) is reread)
+        registry.pop(self.path)
+        self.assertNotIn(self.path, registry)
+
+    def test_capacity(self):
+        registry = DocumentRegistry(max_entries=2)
+        paths = []
+        for i in range(3):
+            path = os.path.join(self.tmp_dir, 'doc{}.xml'.format(i))
+            write(path, dynA, register=False)
+            paths.append(path)
+            registry.add(path, Document(dynA))
+        # Only the two most recently used documents are held strongly
+        gc.collect()
+        self.assertEqual(len(registry), 2)
+        self.assertIsNone(registry.get(paths[0]))
+        self.assertIsNotNone(registry.get(paths[1]))
+        registry.add(paths[0], Document(dynA))
+        gc.collect()
+        self.assertIsNotNone(registry.get(paths[1]))
+        self.assertIsNone(registry.get(paths[2]))
+        # Limit by the total size of the files
+        size = os.path.getsize(paths[0])
+        registry.max_bytes = size
+        gc.collect()
+        self.assertEqual(len(registry), 1)
+        self.assertEqual(registry.num_bytes, size)
+        self.assertEqual((registry.hits, registry.misses), (2, 2))
+        # By default documents are only held while referenced elsewhere
+        registry = DocumentRegistry()
+        doc = Document(dynA)
+        registry.add(paths[0], doc)
+        self.assertTrue(registry.get(paths[0]) is doc)
+        del doc
+        gc.collect()
+        self.assertEqual(len(registry), 0)
+        self.assertIsNone(registry.get(paths[0]))
+
+    def test_threads(self):
+        write(self.path, dynA, register=False)
+        results = []
+
+        def read_doc():
+            for _ in range(5):
+                results.append(read(self.path)['dynA'])
+
+        threads = [threading.Thread(target=read_doc) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(results), 20)
+        self.assertTrue(all(r == dynA for r in results))
@@ -0,0 +1,71 @@
+import unittest
+from io import BytesIO
+import numpy
+from nineml.abstraction import RandomDistribution, Parameter
+from nineml.user import ConnectionTable, RandomDistributionProperties
+from nineml.values import SingleValue, ArrayValue, RandomDistributionValue
+from nineml.exceptions import NineMLUsageError
+import nineml.units as un
+
+
+class TestConnectionTable(unittest.TestCase):
+
+    def setUp(self):
+        self.sources = [0, 0, 1, 2, 2]
+        self.destinations = [1, 2, 0, 0, 1]
+        self.uniform = RandomDistributionProperties(
+            name="UniformProps",
+            definition=RandomDistribution(
+                name="Uniform",
+                parameters=[Parameter('minimum'), Parameter('maximum')],
+                standard_library=(
+                    'http://www.uncertml.org/distributions/uniform')),
+            properties={'minimum': 1.0, 'maximum': 2.0})
+
+    def test_from_values(self):
+        table = ConnectionTable.from_values(
+            self.sources, self.destinations,
+            rng=numpy.random.default_rng(1),
+            delay=SingleValue(1.5) * un.ms,
+            weight=ArrayValue([0.1, 0.2, 0.3, 0.4, 0.5]) * un.nA,
+            noise=RandomDistributionValue(self.uniform) * un.mV)
+        self.assertEqual(len(table), 5)
+        self.assertEqual(table.sources.dtype, numpy.int32)
+        self.assertEqual(table.destinations.tolist(), self.destinations)
+        self.assertEqual(list(table.column_names),
+                         ['delay', 'noise', 'weight'])
+        self.assertEqual(table.column('delay').dtype, numpy.float32)
+        self.assertEqual(table.column('delay').tolist(), [1.5] * 5)
+        self.assertTrue(numpy.allclose(table.column('weight'),
+                                       [0.1, 0.2, 0.3, 0.4, 0.5]))
+        noise = table.column('noise')
+        self.assertTrue(((noise >= 1.0) & (noise < 2.0)).all())
+        self.assertEqual(table.units('weight'), un.nA)
+        self.assertRaises(NineMLUsageError, table.column, 'missing')
+        # ArrayValues must provide a value for each connection
+        self.assertRaises(
+            NineMLUsageError, ConnectionTable.from_values, self.sources,
+            self.destinations, weight=ArrayValue([0.1, 0.2]) * un.nA)
+
+    def test_save_load(self):
+        table = ConnectionTable.from_values(
+            self.sources, self.destinations,
+            delay=RandomDistributionValue(self.uniform) * un.ms)
+        f = BytesIO()
+        table.save(f)
+        f.seek(0)
+        self.assertEqual(ConnectionTable.load(f), table)
+
+    def test_save_load_custom_units(self):
+        # Units that aren't defined in nineml.units are saved with the table
+        decisecond = un.Unit('decisecond', dimension=un.time, power=-1)
+        table = ConnectionTable.from_values(
+            self.sources, self.destinations,
+            delay=SingleValue(2.0) * decisecond,
+            weight=SingleValue(0.5) * un.nA)
+        f = BytesIO()
+        table.save(f)
+        f.seek(0)
+        loaded = ConnectionTable.load(f)
+        self.assertEqual(loaded, table)
+        self.assertEqual(loaded.units('delay'), decisecond)
@@ -0,0 +1,126 @@
+import os
+import shutil
+import tempfile
+import unittest
+import numpy
+from nineml.abstraction.connectionrule import (
+    all_to_all_connection_rule, probabilistic_connection_rule,
+    random_fan_in_connection_rule)
+from nineml.user import (
+    ConnectionRuleProperties, Connectivity, ConnectivityCache)
+
+
+class TestConnectivityCache(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        # Disable the in-memory memo so that the disk cache is always used
+        self.memo = Connectivity.memo
+        Connectivity.memo = None
+        self.props = ConnectionRuleProperties(
+            'probabilistic', probabilistic_connection_rule,
+            {'probability': 0.2})
+
+    def tearDown(self):
+        Connectivity.cache = None
+        Connectivity.memo = self.memo
+        shutil.rmtree(self.tmp_dir)
+
+    def test_warm_start(self):
+        connectivity = Connectivity(self.props, 30, 40, random_seed=101)
+        sources, destinations = connectivity.connections_array()
+        Connectivity.cache = cache = ConnectivityCache(self.tmp_dir)
+        cold = connectivity.connections_array()
+        self.assertEqual((cache.hits, cache.misses, len(cache)), (0, 1, 1))
+        # A separate but equivalent connectivity object should hit the cache
+        warm = Connectivity(self.props, 30, 40,
+                            random_seed=101).connections_array()
+        self.assertEqual((cache.hits, cache.misses, len(cache)), (1, 1, 1))
+        for arrays in (cold, warm):
+            self.assertEqual(arrays[0].tolist(), sources.tolist())
+            self.assertEqual(arrays[1].tolist(), destinations.tolist())
+        self.assertEqual(
+            list(connectivity.connections()),
+            list(zip(sources.tolist(), destinations.tolist())))
+        self.assertEqual(cache.hits, 2)
+
+    def test_key(self):
+        cache = ConnectivityCache(self.tmp_dir)
+        key = cache.key(Connectivity(self.props, 30, 40, random_seed=101))
+        self.assertEqual(
+            key, cache.key(Connectivity(self.props, 30, 40, random_seed=101)))
+        for connectivity in (
+                Connectivity(self.props, 30, 40, random_seed=102),
+                Connectivity(self.props, 31, 40, random_seed=101),
+                Connectivity(self.props, 30, 41, random_seed=101),
+                Connectivity(self.props, 30, 40, random_seed=101,
+                             keyed_rows=True),
+                Connectivity(self.props, 30, 40, random_seed=101,
+                             sampler='geometric'),
+                Connectivity(ConnectionRuleProperties(
+                    'probabilistic', probabilistic_connection_rule,
+                    {'probability': 0.25}), 30, 40, random_seed=101),
+                Connectivity(ConnectionRuleProperties(
+                    'random_fan_in', random_fan_in_connection_rule,
+                    {'number': 1}), 30, 40, random_seed=101)):
+            self.assertNotEqual(key, cache.key(connectivity))
+        # The seed doesn't affect deterministic connectivity
+        all_to_all = ConnectionRuleProperties('all_to_all',
+                                              all_to_all_connection_rule)
+        self.assertEqual(
+            cache.key(Connectivity(all_to_all, 3, 4, random_seed=1)),
+            cache.key(Connectivity(all_to_all, 3, 4, random_seed=2)))
+
+    def test_eviction(self):
+        Connectivity.cache = cache = ConnectivityCache(self.tmp_dir)
+        paths = []
+        for seed in range(3):
+            connectivity = Connectivity(self.props, 30, 40, random_seed=seed)
+            connectivity.connections_array()
+            path = cache._path(cache.key(connectivity))
+            # Make the access times distinct
+            os.utime(path, (seed, seed))
+            paths.append(path)
+        entry_size = cache.size // 3
+        # Access the first entry so that it becomes the most recently used
+        Connectivity(self.props, 30, 40, random_seed=0).connections_array()
+        Connectivity.cache = cache = ConnectivityCache(
+            self.tmp_dir, max_size=int(entry_size * 2.5))
+        Connectivity(self.props, 30, 40, random_seed=3).connections_array()
+        self.assertEqual(len(cache), 2)
+        self.assertTrue(os.path.exists(paths[0]))
+        self.assertFalse(os.path.exists(paths[1]))
+        self.assertFalse(os.path.exists(paths[2]))
+
+    def test_corrupt_entry(self):
+        Connectivity.cache = cache = ConnectivityCache(self.tmp_dir)
+        connectivity = Connectivity(self.props, 30, 40, random_seed=5)
+        sources, _ = connectivity.connections_array()
+        with open(cache._path(cache.key(connectivity)), 'wb') as f:
+            f.write(b'truncated')
+        self.assertEqual(connectivity.connections_array()[0].tolist(),
+                         sources.tolist())
+        self.assertEqual(cache.hits, 0)
+        self.assertEqual(len(cache), 1)
+        self.assertTrue(isinstance(
+            cache.load(cache.key(connectivity))[0], numpy.ndarray))
+
+    def test_memory_mapped(self):
+        Connectivity.cache = cache = ConnectivityCache(self.tmp_dir)
+        connectivity = Connectivity(self.props, 30, 40, random_seed=7)
+        sources, destinations = connectivity.connections_array()
+        loaded = cache.load(cache.key(connectivity))
+        self.assertTrue(all(isinstance(a, numpy.memmap) for a in loaded))
+        self.assertFalse(loaded[0].flags.writeable)
+        # Warm reads are sliced from the memory-mapped entry block by block
+        connectivity.array_block_size = 16
+        chunks = list(connectivity.iter_chunks())
+        self.assertEqual(cache.hits, 2)
+        self.assertTrue(all(len(s) <= 16 for s, _ in chunks))
+        self.assertTrue(all(s.dtype == numpy.int64 for s, _ in chunks))
+        self.assertEqual(
+            numpy.concatenate([s for s, _ in chunks]).tolist(),
+            sources.tolist())
+        self.assertEqual(
+            numpy.concatenate([d for _, d in chunks]).tolist(),
+            destinations.tolist())
@@ -11,7 +11,11 @@ backend.
 """
 from __future__ import division
 import os.path
+import shutil
+import tempfile
 import unittest
+import numpy
+import nineml
 from nineml.abstraction import ConnectionRule
 from nineml.abstraction import (
     Dynamics, Parameter, AnalogSendPort, AnalogReducePort, StateVariable,
@@ -21,10 +25,14 @@ from nineml.abstraction import (
 from nineml.user import (
     DynamicsProperties, Population,
     Projection, ConnectionRuleProperties, RandomDistributionProperties,
-    Network, Selection, Concatenate)
-from nineml.values import RandomDistributionValue
+    Network, Selection, Concatenate, SampledConnectionsMemo)
+from nineml.user.connectionrule import Connectivity
+from nineml.user.connection_group import FlattenedConnectivity
+from nineml.values import RandomDistributionValue, ArrayValue
+from nineml.document import AddToDocumentVisitor
 import nineml.units as un
-from nineml.exceptions import NineMLRandomDistributionDelayException
+from nineml.exceptions import (
+    NineMLRandomDistributionDelayException, NineMLUsageError)
 
 
 src_dir = os.path.dirname(__file__)
@@ -273,6 +281,32 @@ class TestNetwork(unittest.TestCase):
                          int(100 * scale) * new_order * 5)
         self.assertEqual(len(scaled.projection('Inhibition')),
                          int(200 * scale) * new_order * 5)
+        # The original network is unchanged
+        self.assertEqual(self.model.population('Ext').size, self.order * 5)
+        self.assertEqual(
+            self.model.projection('Excitation').connectivity.source_size,
+            self.order * 4)
+        self.assertEqual(float(self.model.projection(
+            'Excitation').connectivity.rule_properties.property(
+                'number').value), 100)
+        # The component classes and units are shared with the original
+        # network but the properties and values are copied
+        for name in ('Ext', 'Exc', 'Inh'):
+            cell = scaled.population(name).cell
+            orig_cell = self.model.population(name).cell
+            self.assertFalse(cell is orig_cell)
+            self.assertTrue(cell.component_class is orig_cell.component_class)
+        for name in ('External', 'Excitation', 'Inhibition'):
+            proj = scaled.projection(name)
+            orig = self.model.projection(name)
+            self.assertFalse(proj.response is orig.response)
+            self.assertTrue(proj.response.component_class is
+                            orig.response.component_class)
+            self.assertFalse(proj.delay is orig.delay)
+            self.assertTrue(proj.delay.units is orig.delay.units)
+            self.assertFalse(proj.connectivity is orig.connectivity)
+            self.assertTrue(proj.pre is scaled.population(proj.pre.name) or
+                            proj.pre is scaled.selection(proj.pre.name))
 
     def test_delay_limits(self):
         limits = self.model.delay_limits()
@@ -318,6 +352,72 @@ class TestNetwork(unittest.TestCase):
         self.assertRaises(
             NineMLRandomDistributionDelayException,
             rand_distr_network.delay_limits)
+        # Bound the normal distribution by its quantiles
+        limits = rand_distr_network.delay_limits(quantile=0.025)
+        self.assertAlmostEqual(float(limits['min_delay'].value),
+                               5.0 - 1.959964, places=5)
+        self.assertAlmostEqual(float(limits['max_delay'].value),
+                               5.0 + 1.959964, places=5)
+        self.assertEqual(limits['min_delay'].units, un.ms)
+        # Bounded distributions and per-connection delays
+        uniform_delay = RandomDistributionProperties(
+            name="UniformDelayProps",
+            definition=RandomDistribution(
+                name="UniformDelay",
+                parameters=[Parameter('minimum'), Parameter('maximum')],
+                standard_library=(
+                    'http://www.uncertml.org/distributions/uniform')),
+            properties={'minimum': 0.5, 'maximum': 2.0})
+        gamma_delay = RandomDistributionProperties(
+            name="GammaDelayProps",
+            definition=RandomDistribution(
+                name="GammaDelay",
+                parameters=[Parameter('shape'), Parameter('scale')],
+                standard_library=(
+                    'http://www.uncertml.org/distributions/gamma')),
+            properties={'shape': 2.0, 'scale': 1.0})
+        self.assertEqual(gamma_delay.support(), (0.0, float('inf')))
+        # Quantiles without a closed form are estimated from samples
+        self.assertAlmostEqual(gamma_delay.quantile(0.5), 1.678347,
+                               places=2)
+        projections = [
+            Projection(
+                name, pre=pop1, post=pop2, response=self.psr,
+                plasticity=self.static_ext,
+                connection_rule_properties=self.one_to_one, delay=delay,
+                port_connections=[
+                    ('response', 'Isyn', 'post', 'Isyn'),
+                    ('plasticity', 'weight', 'response', 'weight')])
+            for name, delay in (
+                ('Uniform', RandomDistributionValue(uniform_delay) * un.ms),
+                ('Array', ArrayValue(numpy.linspace(0.8, 4.0, 100)) *
+                 un.ms))]
+        network = Network('bounded_delays', populations=[pop1, pop2],
+                          projections=projections)
+        limits = network.delay_limits(si_units=True)
+        self.assertAlmostEqual(limits['min_delay'], 0.0005)
+        self.assertAlmostEqual(limits['max_delay'], 0.004)
+        lower, upper = projections[0].delay_bounds(quantile=0.1)
+        self.assertAlmostEqual(lower, 0.00065)
+        self.assertAlmostEqual(upper, 0.00185)
+        # The limits keep the units of the projections they are taken from
+        slow = Projection(
+            'Slow', pre=pop1, post=pop2, response=self.psr,
+            plasticity=self.static_ext,
+            connection_rule_properties=self.one_to_one, delay=0.01 * un.s,
+            port_connections=[
+                ('response', 'Isyn', 'post', 'Isyn'),
+                ('plasticity', 'weight', 'response', 'weight')])
+        network.add(slow)
+        limits = network.delay_limits()
+        self.assertEqual(limits['max_delay'], 0.01 * un.s)
+        self.assertEqual(limits['max_delay'].units, un.s)
+        self.assertAlmostEqual(float(limits['min_delay'].value), 0.5)
+        self.assertEqual(limits['min_delay'].units, un.ms)
+        # Lower quantiles of distributions that extend below zero are clipped
+        self.assertEqual(
+            rand_delay_prj.delay_bounds(quantile=1e-10, si_units=False)[0],
+            0.0 * un.ms)
 
     def test_components(self):
         names = set(c.name for c in self.model.all_components())
@@ -326,6 +426,349 @@ class TestNetwork(unittest.TestCase):
                         'InhibitoryPlasticity', 'OneToOne',
                         'RandomFanInProps', 'liaf_props', 'stim', 'syn')))
 
+    def test_flatten(self):
+        self._test_flatten()
+
+    def test_flatten_memo(self):
+        # Flattened connection groups share the memo of the projections
+        Connectivity.memo = SampledConnectionsMemo()
+        try:
+            self._test_flatten()
+        finally:
+            Connectivity.memo = None
+
+    def _test_flatten(self):
+        pre = Population("Pre", 40, self.celltype)
+        post = Population("Post", 10, self.celltype)
+        fan_in = ConnectionRuleProperties(
+            name="FanIn",
+            definition=ConnectionRule(
+                name="RandomFanIn", parameters=[Parameter(name="number")],
+                standard_library=(
+                    "http://nineml.net/9ML/1.0/connectionrules/RandomFanIn")),
+            properties={'number': 5})
+        proj = Projection(
+            "Proj", pre=pre, post=post, response=self.psr,
+            plasticity=self.static_ext, connection_rule_properties=fan_in,
+            delay=self.delay,
+            port_connections=[
+                ('pre', 'spikeOutput', 'response', 'spike'),
+                ('response', 'Isyn', 'post', 'Isyn'),
+                ('plasticity', 'weight', 'response', 'weight')])
+        network = Network('flat', populations=[pre, post],
+                          projections=[proj])
+        sources, destinations = proj.connectivity.connections_array()
+        _, connection_groups = network.flatten()
+        groups = dict((cg.name, cg) for cg in connection_groups)
+        spike = groups['Proj__pre__spikeOutput__response__spike']
+        # The explicit connection rules are only created on demand
+        self.assertTrue(spike.connectivity._explicit_properties is None)
+        self.assertEqual(spike.nineml_type, 'EventConnectionGroup')
+        self.assertEqual(spike.source.name, 'Pre__cell')
+        self.assertEqual(spike.destination.name, 'Proj__psr')
+        isyn = groups['Proj__response__Isyn__post__Isyn']
+        self.assertEqual(isyn.nineml_type, 'AnalogConnectionGroup')
+        self.assertEqual(isyn.source.name, 'Proj__psr')
+        self.assertEqual(isyn.destination.name, 'Post__cell')
+        # Synapses are ordered by their (source, destination) pairs
+        pairs = sorted(zip(sources.tolist(), destinations.tolist()))
+        spike_conns = [(int(s), int(d)) for s, d in spike.connections]
+        isyn_conns = [(int(s), int(d)) for s, d in isyn.connections]
+        self.assertEqual([(s, pairs[d][1]) for s, d in spike_conns],
+                         [(pairs[s][0], d) for s, d in isyn_conns])
+        self.assertEqual([s for s, _ in pairs],
+                         [s for s, _ in spike_conns])
+        table = spike.connection_table
+        self.assertEqual(list(zip(table.sources.tolist(),
+                                  table.destinations.tolist())),
+                         spike_conns)
+        self.assertEqual(table.column('delay').tolist(), [1.5] * len(pairs))
+        self.assertEqual(table.units('delay'), un.ms)
+        self.assertEqual(list(isyn.connection_table.column_names), [])
+        self.assertEqual(
+            [int(i) for i in spike.connectivity.rule_properties.property(
+                'sourceIndices').value],
+            [s for s, _ in spike_conns])
+        self.assertEqual(spike.connectivity.rule_properties.property(
+            'sourceIndices').value.values.dtype, numpy.int64)
+        self.assertEqual(spike.connectivity.lib_type, 'Explicit')
+        # Per-connection values are drawn from a stream independent of the
+        # one seeded directly by the connectivity's seed
+        seed = abs(proj.connectivity._seed)
+        self.assertNotEqual(
+            spike._values_rng().random(5).tolist(),
+            numpy.random.default_rng(seed).random(5).tolist())
+        self.assertEqual(spike._values_rng().random(5).tolist(),
+                         spike._values_rng().random(5).tolist())
+
+    def test_parallel_flatten(self):
+        pre = Population("Pre", 30, self.celltype)
+        post = Population("Post", 20, self.celltype)
+        probabilistic = ConnectionRuleProperties(
+            name="Prob",
+            definition=ConnectionRule(
+                name="Probabilistic",
+                parameters=[Parameter(name="probability")],
+                standard_library=(
+                    "http://nineml.net/9ML/1.0/connectionrules/"
+                    "Probabilistic")),
+            properties={'probability': 0.2})
+        proj = Projection(
+            "Proj", pre=pre, post=post, response=self.psr,
+            plasticity=self.static_ext,
+            connection_rule_properties=probabilistic, delay=self.delay,
+            port_connections=[
+                ('pre', 'spikeOutput', 'response', 'spike'),
+                ('response', 'Isyn', 'post', 'Isyn'),
+                ('plasticity', 'weight', 'response', 'weight')])
+        network = Network('flat', populations=[pre, post],
+                          projections=[proj])
+        arrays, groups = network.flatten()
+        par_arrays, par_groups = network.clone(random_seeds=True).flatten(
+            workers=2)
+        self.assertEqual([(a.name, a.size) for a in arrays],
+                         [(a.name, a.size) for a in par_arrays])
+        self.assertEqual(arrays, par_arrays)
+        self.assertEqual([g.name for g in groups],
+                         [g.name for g in par_groups])
+        for group, par_group in zip(groups, par_groups):
+            self.assertEqual(list(group.connections),
+                             list(par_group.connections))
+            if isinstance(par_group.connectivity, FlattenedConnectivity):
+                # The connections sampled by the workers are reused by the
+                # connection groups, with the same per-connection values
+                self.assertEqual(
+                    par_group.connectivity.projection_connectivity.lib_type,
+                    'Explicit')
+                self.assertEqual(
+                    par_group._values_rng().random(5).tolist(),
+                    group._values_rng().random(5).tolist())
+        # The populations share their cell dynamics, which are flattened
+        # once and shared between the component arrays in both cases
+        for flat in (arrays, par_arrays):
+            cells = dict((a.name, a.dynamics_properties) for a in flat)
+            self.assertTrue(cells['Pre__cell'] is cells['Post__cell'])
+
+    def test_partition(self):
+        self._test_partition()
+
+    def test_partition_memo(self):
+        # Flattened connection groups share the memo of the projections
+        Connectivity.memo = SampledConnectionsMemo()
+        try:
+            self._test_partition()
+        finally:
+            Connectivity.memo = None
+
+    def _test_partition(self):
+        probabilistic = ConnectionRuleProperties(
+            name="Prob",
+            definition=ConnectionRule(
+                name="Probabilistic",
+                parameters=[Parameter(name="probability")],
+                standard_library=(
+                    "http://nineml.net/9ML/1.0/connectionrules/"
+                    "Probabilistic")),
+            properties={'probability': 0.2})
+        pop_a = Population("A", 30, self.celltype)
+        pop_b = Population("B", 20, self.celltype)
+        pop_c = Population("C", 25, self.celltype)
+        port_connections = [
+            ('pre', 'spikeOutput', 'response', 'spike'),
+            ('response', 'Isyn', 'post', 'Isyn'),
+            ('plasticity', 'weight', 'response', 'weight')]
+        projections = [
+            Projection(
+                name, pre=pre, post=post, response=self.psr,
+                plasticity=self.static_ext,
+                connection_rule_properties=probabilistic, delay=self.delay,
+                port_connections=port_connections)
+            for name, pre, post in (('AtoB', pop_a, pop_b),
+                                    ('CtoC', pop_c, pop_c))]
+        network = Network('partitioned', populations=[pop_a, pop_b, pop_c],
+                          projections=projections)
+        partition = network.partition(3)
+        # The document of each rank is only built when it is requested
+        self.assertTrue(partition._documents is None)
+        partition.document(1)
+        self.assertEqual([d is not None for d in partition._documents],
+                         [False, True, False])
+        # The connected populations should be laid out next to each other
+        order = partition.population_order
+        self.assertEqual(abs(order.index('A') - order.index('B')), 1)
+        costs = partition.rank_costs()
+        self.assertEqual(costs.sum(), 75 + sum(len(p) for p in projections))
+        for pop in network.populations:
+            ranks = partition.global_to_local(
+                pop.name + '__cell', range(len(pop)))[0]
+            # Ranks are assigned in contiguous index ranges
+            self.assertTrue((ranks[1:] >= ranks[:-1]).all() or
+                            (ranks[1:] <= ranks[:-1]).all())
+        self.assertTrue(costs.max() - costs.min() < 0.2 * costs.sum())
+        self.assertEqual(list(partition.rank_sizes('AtoB__psr')),
+                         list(partition.rank_sizes('AtoB__pls')))
+        _, groups = network.flatten()
+        cross_rank = 0
+        for group in groups:
+            expected = sorted((int(s), int(d)) for s, d in group.connections)
+            found = []
+            for rank in range(partition.num_ranks):
+                doc = partition.document(rank)
+                local_to_global = partition.local_to_global
+                if group.name in doc:
+                    local = doc[group.name]
+                    for s, d in local.connections:
+                        found.append((
+                            int(local_to_global(group.source.name, rank, s)),
+                            int(local_to_global(group.destination.name, rank,
+                                                d))))
+                sources, source_ranks, dests = partition.remote_connections(
+                    group.name, rank)
+                self.assertTrue((source_ranks != rank).all())
+                found.extend(zip(
+                    sources.tolist(), local_to_global(
+                        group.destination.name, rank, dests).tolist()))
+                cross_rank += len(sources)
+            self.assertEqual(sorted(found), expected)
+        self.assertEqual(partition.cross_rank_edges, cross_rank)
+        # Writes and reads back the documents of each rank
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            urls = partition.write(tmp_dir)
+            self.assertEqual(nineml.read(urls[1]), partition.document(1))
+            with numpy.load(os.path.join(tmp_dir, 'mapping.npz')) as mapping:
+                ranks, local = partition.global_to_local('B__cell',
+                                                         range(20))
+                self.assertEqual(mapping['B__cell__rank'].tolist(),
+                                 ranks.tolist())
+                self.assertEqual(mapping['B__cell__local'].tolist(),
+                                 local.tolist())
+        finally:
+            shutil.rmtree(tmp_dir)
+        self.assertRaises(NineMLUsageError, network.partition, 0)
+        self.assertRaises(NineMLUsageError, partition.document, 3)
+        self.assertRaises(NineMLUsageError, partition.remote_connections,
+                          'AtoB__pre__spikeOutput__response__spike', 3)
+
+    def test_batch(self):
+        document = nineml.Document()
+        document.add(Network('batched'))
+        network = document['batched']
+        populations = [Population('Pop{}'.format(i), 10, self.celltype)
+                       for i in range(20)]
+        with network.batch():
+            for pop in populations:
+                network.add(pop)
+            # Elements are only added at the end of the batch
+            self.assertEqual(network.num_populations, 0)
+            self.assertFalse('Pop0' in document)
+        self.assertEqual(list(network.population_names),
+                         [p.name for p in populations])
+        self.assertTrue(document['Pop0'] is populations[0])
+        self.assertTrue(document[self.celltype.name] is self.celltype)
+        # The dynamics shared by the populations in the batch are only
+        # traversed once when they are added to the document
+        visited = []
+        action = AddToDocumentVisitor.action
+
+        def counting_action(visitor, obj, **kwargs):
+            visited.append(obj)
+            return action(visitor, obj, **kwargs)
+
+        AddToDocumentVisitor.action = counting_action
+        try:
+            with network.batch():
+                for i in range(20, 30):
+                    network.add(Population('Pop{}'.format(i), 10,
+                                           self.celltype))
+        finally:
+            AddToDocumentVisitor.action = action
+        self.assertEqual(
+            sum(1 for o in visited if o is self.celltype), 10)
+        self.assertEqual(
+            sum(1 for o in visited if o is self.celltype.component_class), 1)
+        self.assertEqual(network.num_populations, 30)
+        # Clashing elements are detected at the end of the batch and none
+        # of the elements in the batch are added
+        with self.assertRaises(NineMLUsageError):
+            with network.batch():
+                network.add(Population('Pop30', 10, self.celltype))
+                network.add(Population('Pop0', 10, self.celltype))
+        with self.assertRaises(NineMLUsageError):
+            with network.batch():
+                network.add(Population('Pop30', 10, self.celltype))
+                network.add(Population('Pop30', 10, self.celltype))
+        self.assertEqual(network.num_populations, 30)
+        self.assertFalse('Pop30' in document)
+
+    def test_population_graph(self):
+        graph = self.model.population_graph()
+        order = self.order
+        self.assertEqual(list(graph.population_names), ['Ext', 'Exc', 'Inh'])
+        # Projections to the 'All' selection are split between 'Exc' and 'Inh'
+        self.assertEqual(graph.num_edges, 6)
+        self.assertAlmostEqual(graph.fan_in()[graph.index('Exc')],
+                               1 + 100 + 200)
+        self.assertAlmostEqual(graph.in_connections()[graph.index('Inh')],
+                               order * (1 + 100 + 200))
+        self.assertEqual(graph.successors('Ext'), ['Exc', 'Inh'])
+        self.assertEqual(graph.predecessors('Ext'), [])
+        self.assertEqual(
+            sorted(sorted(c) for c in graph.strongly_connected_components()),
+            [['Exc', 'Inh'], ['Ext']])
+        self.assertAlmostEqual(graph.min_delay(), 0.0015)
+        delay, path = graph.longest_delay_path()
+        self.assertAlmostEqual(delay, 0.0015)
+        self.assertEqual(path[0], 'Ext')
+        self.assertEqual(len(path), 2)
+        self.assertEqual(len(graph.min_delay_cut(1.0 * un.ms)), 3)
+        self.assertEqual(len(graph.min_delay_cut(2.0 * un.ms)), 1)
+        # Chain with a loop and differing delays
+        pops = [Population(n, 10, self.celltype) for n in 'ABCD']
+        projections = [
+            Projection(
+                '{}to{}'.format(pre.name, post.name), pre=pre, post=post,
+                response=self.psr, plasticity=self.static_ext,
+                connection_rule_properties=self.one_to_one,
+                delay=delay * un.ms,
+                port_connections=[
+                    ('response', 'Isyn', 'post', 'Isyn'),
+                    ('plasticity', 'weight', 'response', 'weight')])
+            for pre, post, delay in ((pops[0], pops[1], 2.0),
+                                     (pops[1], pops[2], 3.0),
+                                     (pops[2], pops[1], 1.0),
+                                     (pops[2], pops[3], 0.5))]
+        graph = Network('chain', populations=pops,
+                        projections=projections).population_graph()
+        self.assertEqual(
+            sorted(sorted(c) for c in graph.strongly_connected_components()),
+            [['A'], ['B', 'C'], ['D']])
+        delay, path = graph.longest_delay_path()
+        self.assertAlmostEqual(delay, 0.0025)
+        self.assertEqual(path, ['A', 'B', 'C', 'D'])
+        self.assertEqual(graph.min_delay_cut(1.5 * un.ms),
+                         [['A'], ['B', 'C', 'D']])
+        self.assertEqual(graph.min_delay_cut(0.4 * un.ms),
+                         [['A'], ['B'], ['C'], ['D']])
+        self.assertAlmostEqual(graph.min_delay([['A'], ['B', 'C', 'D']]),
+                               0.002)
+        self.assertEqual(graph.min_delay([['A', 'B', 'C', 'D']]),
+                         float('inf'))
+
+    def test_statistics(self):
+        stats = self.model.statistics()
+        order = self.order
+        self.assertEqual(
+            stats['projections']['Excitation']['num_connections'],
+            100 * order * 5)
+        self.assertEqual(
+            stats['projections']['Excitation']['mean_out_degree'],
+            100 * 5 / 4)
+        self.assertEqual(stats['num_connections'], 300 * order * 5 +
+                         order * 5)
+        self.assertEqual(stats['memory_bytes'],
+                         stats['num_connections'] * 16)
+
     def test_resample_connectivity(self):
         scaled = self.model.scale(10 * self.order)
         scaled.resample_connectivity()
@@ -1,6 +1,16 @@
 import os.path
 import unittest
+import numpy
 from nineml import read
+from nineml.abstraction import (
+    Parameter, Dynamics, Regime, On, OutputEvent, StateVariable,
+    RandomDistribution)
+from nineml.user import (
+    Population, DynamicsProperties, RandomDistributionProperties)
+from nineml.values import ArrayValue, RandomDistributionValue
+from nineml.exceptions import NineMLUsageError
+from nineml import units as un
+from nineml.units import Quantity
 from nineml.serialization.xml import XMLUnserializer
 from nineml.serialization import DEFAULT_VERSION
 
@@ -18,3 +28,74 @@ from nineml.serialization import DEFAULT_VERSION
 #         self.assertEquals(document1, document2,
 #                           "Documents don't match after write/read from file:\n"
 #                           "{}".format(document2.find_mismatch(document1)))
+
+
+class TestParameterTable(unittest.TestCase):
+
+    def setUp(self):
+        self.dynamics = Dynamics(
+            name='Dyn',
+            state_variables=[
+                StateVariable('SV1', dimension=un.voltage)],
+            regimes=[
+                Regime(
+                    'dSV1/dt = -SV1 / P1',
+                    transitions=[On('SV1 > P2', do=[OutputEvent('emit')])],
+                    name='R1'
+                ),
+            ],
+            parameters=[Parameter('P1', dimension=un.time),
+                        Parameter('P2', dimension=un.voltage)])
+        self.uniform = RandomDistributionProperties(
+            name="UniformProps",
+            definition=RandomDistribution(
+                name="Uniform",
+                parameters=[Parameter('minimum'), Parameter('maximum')],
+                standard_library=(
+                    'http://www.uncertml.org/distributions/uniform')),
+            properties={'minimum': -70.0, 'maximum': -60.0})
+
+    def test_parameter_table(self):
+        cell = DynamicsProperties(
+            name="DynProps", definition=self.dynamics,
+            properties={
+                'P1': ArrayValue([1.0, 2.0, 3.0, 4.0]) * un.ms,
+                'P2': RandomDistributionValue(self.uniform) * un.mV},
+            initial_values={'SV1': -65.0 * un.mV})
+        pop = Population('Pop', 4, cell)
+        table = pop.parameter_table(rng=numpy.random.default_rng(1))
+        self.assertEqual(list(table), ['P1', 'P2', 'SV1'])
+        self.assertEqual(table['P1'].tolist(), [1.0, 2.0, 3.0, 4.0])
+        self.assertEqual(table['SV1'].tolist(), [-65.0] * 4)
+        self.assertEqual(len(table['P2']), 4)
+        self.assertTrue(((table['P2'] >= -70.0) &
+                         (table['P2'] < -60.0)).all())
+        self.assertEqual(
+            table['P2'].tolist(),
+            pop.parameter_table(
+                rng=numpy.random.default_rng(1))['P2'].tolist())
+        si_table = pop.parameter_table(rng=numpy.random.default_rng(1),
+                                       si_units=True)
+        self.assertTrue(numpy.allclose(si_table['P1'], table['P1'] * 1e-3))
+        self.assertTrue(numpy.allclose(si_table['SV1'], -0.065))
+        pop.size = 5
+        self.assertRaises(NineMLUsageError, pop.parameter_table)
+
+    def test_offset_units(self):
+        dynamics = Dynamics(
+            name='Thermo',
+            state_variables=[StateVariable('T', dimension=un.temperature)],
+            regimes=[Regime('dT/dt = (T0 - T) / tau', name='R1')],
+            parameters=[Parameter('T0', dimension=un.temperature),
+                        Parameter('tau', dimension=un.time)])
+        cell = DynamicsProperties(
+            name="ThermoProps", definition=dynamics,
+            properties={'T0': Quantity(ArrayValue([20.0, 25.0]), un.degC),
+                        'tau': 2.0 * un.ms},
+            initial_values={'T': Quantity(30.0, un.degC)})
+        si_table = Population('Pop', 2, cell).parameter_table(si_units=True)
+        # Offsets are added after scaling, as for all SI conversions
+        self.assertTrue(numpy.allclose(si_table['T0'], [293.15, 298.15]))
+        self.assertTrue(numpy.allclose(si_table['T'], 303.15))
+        self.assertTrue(numpy.allclose(si_table['tau'], 0.002))
+        self.assertEqual(un.degC.to_SI(20.0), si_table['T0'][0])
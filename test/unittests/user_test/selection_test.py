@@ -0,0 +1,82 @@
+import unittest
+import numpy
+from nineml.abstraction import (
+    Parameter, Dynamics, Regime, On, OutputEvent, StateVariable)
+from nineml.user import (
+    Population, DynamicsProperties, Selection, Concatenate)
+from nineml.user.selection import Item
+from nineml.exceptions import NineMLUsageError
+from nineml import units as un
+
+
+class TestConcatenate(unittest.TestCase):
+
+    def setUp(self):
+        dynamics = Dynamics(
+            name='Dyn',
+            state_variables=[
+                StateVariable('SV1', dimension=un.voltage)],
+            regimes=[
+                Regime(
+                    'dSV1/dt = -SV1 / P1',
+                    transitions=[On('SV1 > P2', do=[OutputEvent('emit')])],
+                    name='R1'
+                ),
+            ],
+            parameters=[Parameter('P1', dimension=un.time),
+                        Parameter('P2', dimension=un.voltage)])
+        props = DynamicsProperties(
+            name="DynProps", definition=dynamics,
+            properties={'P1': 1.0 * un.ms, 'P2': -65.0 * un.mV})
+        self.pops = [Population(name, size, props)
+                     for name, size in (('A', 5), ('B', 0), ('C', 3),
+                                        ('D', 7))]
+        self.selection = Selection('All', Concatenate(self.pops))
+
+    def test_global_to_local(self):
+        self.assertEqual(self.selection.size, 15)
+        self.assertEqual(self.selection.operation.offsets.tolist(),
+                         [0, 5, 5, 8, 15])
+        items, local = self.selection.global_to_local(numpy.arange(15))
+        self.assertEqual(items.tolist(), [0] * 5 + [2] * 3 + [3] * 7)
+        self.assertEqual(local.tolist(),
+                         list(range(5)) + list(range(3)) + list(range(7)))
+        for item_index, pop in enumerate(self.pops):
+            for population in (pop, pop.name, item_index):
+                self.assertEqual(
+                    self.selection.local_to_global(
+                        population, numpy.arange(pop.size)).tolist(),
+                    numpy.flatnonzero(items == item_index).tolist())
+        self.assertEqual(self.selection.local_to_global('C', 2), 7)
+        self.assertRaises(NineMLUsageError, self.selection.global_to_local,
+                          [15])
+        self.assertRaises(NineMLUsageError, self.selection.local_to_global,
+                          'C', [3])
+        self.assertRaises(NineMLUsageError, self.selection.local_to_global,
+                          'E', [0])
+
+    def test_offsets_cache(self):
+        offsets = self.selection.operation.offsets
+        self.assertTrue(offsets is self.selection.operation.offsets)
+        self.pops[1].size = 4
+        self.assertEqual(self.selection.operation.offsets.tolist(),
+                         [0, 5, 9, 12, 19])
+        self.assertEqual(self.selection.size, 19)
+        self.assertEqual(self.selection.global_to_local([6])[0].tolist(),
+                         [1])
+        # Adding or removing items also invalidates the offsets
+        concat = self.selection.operation
+        concat.remove(concat.item('3'))
+        self.assertEqual(concat.offsets.tolist(), [0, 5, 9, 12])
+        concat.add(Item(3, self.pops[0]))
+        self.assertEqual(concat.offsets.tolist(), [0, 5, 9, 12, 17])
+
+    def test_integral_item_index(self):
+        self.assertEqual(
+            self.selection.local_to_global(numpy.int64(2), [0, 2]).tolist(),
+            [5, 7])
+
+    def test_item_order(self):
+        concat = Concatenate([Item(1, self.pops[0]), Item(0, self.pops[2])])
+        self.assertEqual(concat.offsets.tolist(), [0, 3, 8])
+        self.assertEqual(concat.local_to_global('A', [0]).tolist(), [3])